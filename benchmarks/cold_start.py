@@ -0,0 +1,157 @@
+'''
+Cold-start benchmark. Starts every function in a fresh interpreter, as a
+new Cloud Functions or Cloud Run instance would, and times the import of
+its main.py and its first request against the local mock services: a scan
+for start_service, a price check for trigger_function_2, a buy for
+trigger_function_1 and a sell for trigger_function_3. Prints the results as
+JSON, or writes them to --output, so runs can be compared.
+
+    python benchmarks/cold_start.py --runs 10 --output before.json
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(BENCHMARKS_DIR, os.pardir, "functions")
+FUNCTIONS = ["start_service", "trigger_function_1", "trigger_function_2", "trigger_function_3"]
+DEXSCREENER_URL = "https://api.dexscreener.com"
+JUPITER_URL = "https://api.jup.ag"
+
+
+def child(directory, token):
+    '''
+    Runs inside the fresh interpreter: imports the function and serves one
+    request. Only the standard library is imported before main.py, so every
+    SDK import is charged to the function.
+    '''
+    started = time.perf_counter()
+    sys.path.insert(0, os.path.abspath(os.path.join(FUNCTIONS_DIR, directory)))
+    import main
+    imported = time.perf_counter()
+
+    import requests
+    import http_client
+    routes = {DEXSCREENER_URL: os.environ["MOCK_DEXSCREENER_URL"], JUPITER_URL: os.environ["MOCK_JUPITER_URL"]}
+
+    class RedirectSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            for prefix, target in routes.items():
+                if url.startswith(prefix):
+                    url = target + url[len(prefix):]
+                    break
+            return super().request(method, url, *args, **kwargs)
+
+    http_client.client.session = RedirectSession()
+    if "swap_executor" in sys.modules:
+        # Jupiter URLs are module constants of the swap executor
+        sys.modules["swap_executor"].JUPITER_QUOTE_URL = JUPITER_URL + "/swap/v1/quote"
+        sys.modules["swap_executor"].JUPITER_SWAP_URL = JUPITER_URL + "/swap/v1/swap"
+
+    serving = time.perf_counter()
+    if directory == "start_service":
+        profiles = main.get_latest_tokens_dexscreener()
+        snapshots = main.get_pricehistory_batch_dexscreener([token['tokenAddress'] for token in profiles])
+        main.filter_dexscreener_data(profiles, snapshots=snapshots)
+        ok = True
+    elif directory == "trigger_function_1":
+        ok = main.purchase_token(token) is not None
+    elif directory == "trigger_function_2":
+        ok = bool(main.get_pricehistory_dexscreener(token))
+    else:
+        ok = "signature" in main.sell_token(token)
+    done = time.perf_counter()
+    return {"finished_at": time.time(), "import": imported - started, "first_request": done - serving, "ok": ok}
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    return {"p50_ms": ordered[len(ordered) // 2] * 1000, "max_ms": ordered[-1] * 1000}
+
+
+def top_imports(directory, env, limit):
+    '''
+    Slowest modules imported by main.py, from one run under -X importtime.
+    :return: List of (module, cumulative ms), slowest first
+    '''
+    code = f"import sys; sys.path.insert(0, {os.path.join(FUNCTIONS_DIR, directory)!r}); import main"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        # Direct imports of main.py are indented by two spaces
+        if name.startswith("   ") or not name.startswith("  "):
+            continue
+        imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:limit]
+
+
+def run(args):
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from solders.keypair import Keypair
+    from mock_services import MockDexScreener, MockJupiter, MockSolanaRpc
+    service_options = {"latency": args.latency_ms / 1000, "jitter": 0}
+    dexscreener = MockDexScreener(tokens=args.tokens, seed=args.seed, **service_options).start()
+    jupiter = MockJupiter(**service_options).start()
+    token = next(iter(dexscreener.tokens))
+    rpc = MockSolanaRpc(holdings=[token], **service_options).start()
+    env = dict(os.environ, SOLANA_RPC_URL=rpc.url, PRIVATE_KEY_BASE58=str(Keypair()), USER_ID="benchmark",
+               MOCK_DEXSCREENER_URL=dexscreener.url, MOCK_JUPITER_URL=jupiter.url,
+               # Measure the start-up alone instead of waiting on http_client's production quotas
+               DEXSCREENER_PROFILES_RPS="1e6", DEXSCREENER_RPS="1e6", JUPITER_RPS="1e6")
+
+    results = {}
+    for directory in args.functions:
+        samples = {"import": [], "first_request": [], "cold_start_to_first_response": []}
+        errors = 0
+        for _ in range(args.runs):
+            spawned = time.time()
+            code = f"import sys; sys.path.insert(0, {BENCHMARKS_DIR!r}); import json, cold_start; " \
+                   f"print(json.dumps(cold_start.child({directory!r}, {token!r})))"
+            completed = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+            try:
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+            except (IndexError, ValueError):
+                errors += 1
+                print(completed.stderr, file=sys.stderr)
+                continue
+            errors += not result["ok"]
+            samples["import"].append(result["import"])
+            samples["first_request"].append(result["first_request"])
+            samples["cold_start_to_first_response"].append(result["finished_at"] - spawned)
+        results[directory] = {stage: percentiles(values) for stage, values in samples.items() if values}
+        results[directory]["errors"] = errors
+        if args.top_imports:
+            results[directory]["top_imports_ms"] = top_imports(directory, env, args.top_imports)
+    for service in (dexscreener, jupiter, rpc):
+        service.stop()
+    return {"config": vars(args), "functions": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters started per function")
+    parser.add_argument("--functions", nargs="+", default=FUNCTIONS, choices=FUNCTIONS)
+    parser.add_argument("--tokens", type=int, default=20, help="token profiles served by the mock feed")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency of every mock response")
+    parser.add_argument("--top-imports", type=int, default=5, help="slowest imports of main.py to list, 0 for none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results)
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
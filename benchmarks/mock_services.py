@@ -0,0 +1,303 @@
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import flask
+from werkzeug.serving import make_server
+from solders.hash import Hash
+from solders.instruction import AccountMeta, Instruction
+from solders.message import MessageV0
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from solders.transaction import VersionedTransaction
+
+TOKEN_PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+SOL_MINT = "So11111111111111111111111111111111111111112"
+
+
+class RateLimiter:
+    '''
+    Server side token bucket. Requests over the limit get a 429 with Retry-After.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockService:
+    '''
+    Local HTTP stand-in for a remote API, served from a background thread.
+    Every request waits latency plus up to jitter seconds, and requests over
+    the rate limit are answered with 429. Subclasses implement handle().
+    '''
+    def __init__(self, latency=0.0, jitter=0.0, rate=None, burst=None):
+        '''
+        :param latency: float, seconds added to every response
+        :param jitter: float, extra random delay of up to this many seconds
+        :param rate: float, requests per second allowed, None for no limit
+        :param burst: int, requests allowed at once, defaults to rate
+        '''
+        self.latency = latency
+        self.jitter = jitter
+        self.limiter = RateLimiter(rate, burst or max(1, int(rate))) if rate else None
+        self.requests = 0
+        self.rejected = 0
+        self._server = None
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def respond(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def serve(self, method):
+                service.requests += 1
+                time.sleep(service.latency + random.uniform(0, service.jitter))
+                if service.limiter is not None and not service.limiter.allow():
+                    service.rejected += 1
+                    self.respond(429, {"error": "rate limited"}, {"Retry-After": "1"})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                self.respond(*service.handle(method, self.path, body))
+
+            def do_GET(self):
+                self.serve("GET")
+
+            def do_POST(self):
+                self.serve("POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method, path, body):
+        '''
+        :return: (status, payload): Tuple
+        '''
+        raise NotImplementedError
+
+    def stats(self):
+        return {"requests": self.requests, "rejected": self.rejected}
+
+
+class MockDexScreener(MockService):
+    '''
+    Dex Screener with a fixed set of generated tokens. Roughly pass_rate of
+    them have the links and price history that pass the filter.
+    '''
+    def __init__(self, tokens=100, pass_rate=0.3, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        rng = random.Random(seed)
+        self.tokens = {}
+        now_ms = time.time() * 1000
+        for _ in range(tokens):
+            address = str(Pubkey.new_unique())
+            healthy = rng.random() < pass_rate
+            buys = rng.randint(50, 200) if healthy else rng.randint(1, 20)
+            self.tokens[address] = {
+                "profile": {"chainId": "solana", "tokenAddress": address,
+                            "links": [{"type": "twitter"}, {"type": "telegram"}] if healthy else []},
+                "pair": {
+                    "chainId": "solana",
+                    "baseToken": {"address": address},
+                    "quoteToken": {"address": SOL_MINT},
+                    "priceNative": str(rng.uniform(0.0001, 0.01)),
+                    "txns": {window: {"buys": buys * scale, "sells": 40 * scale}
+                             for window, scale in (("m5", 1), ("h1", 12), ("h6", 72))},
+                    "volume": {"m5": rng.uniform(100, 5000), "h24": rng.uniform(1e4, 1e6)},
+                    "priceChange": {"m5": rng.uniform(-10, 10), "h24": rng.uniform(-0.5, 0.5)},
+                    "liquidity": {"usd": rng.uniform(1e4, 1e6)},
+                    "pairCreatedAt": now_ms - rng.uniform(1, 60) * 86400 * 1000,
+                    "fdv": rng.uniform(1e5, 2e6),
+                },
+            }
+
+    def handle(self, method, path, body):
+        parts = urlparse(path).path.strip("/").split("/")
+        if parts[:3] == ["token-profiles", "latest", "v1"]:
+            return 200, [token["profile"] for token in self.tokens.values()]
+        if len(parts) == 4 and parts[0] == "tokens":
+            return 200, [self.tokens[address]["pair"] for address in parts[3].split(",") if address in self.tokens]
+        if len(parts) == 4 and parts[0] == "token-pairs":
+            token = self.tokens.get(parts[3])
+            return 200, [token["pair"], token["pair"]] if token else []
+        if len(parts) == 4 and parts[0] == "orders":
+            return 200, []
+        return 404, {"error": f"unknown path {path}"}
+
+
+def unsigned_swap_transaction(payer):
+    instruction = Instruction(Pubkey.default(), bytes([random.randint(0, 255)]), [AccountMeta(payer, True, True)])
+    message = MessageV0.try_compile(payer, [instruction], [], Hash.new_unique())
+    return VersionedTransaction.populate(message, [Signature.default()])
+
+
+class MockJupiter(MockService):
+    '''
+    Jupiter swap API: quotes at a fixed rate, routed through one pool per
+    token, and unsigned swap transactions for whichever wallet asks. Counts
+    the swaps that bid an exact compute unit price and the ones that asked
+    for a priority level.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.bids = {"compute_unit_price": 0, "priority_level": 0}
+        self.pools = {}  # token mint -> pool account
+
+    def pool(self, input_mint, output_mint):
+        mint = output_mint if input_mint == SOL_MINT else input_mint
+        return self.pools.setdefault(mint, str(Pubkey.new_unique()))
+
+    def handle(self, method, path, body):
+        parsed = urlparse(path)
+        if parsed.path == "/swap/v1/quote":
+            query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            return 200, {"inputMint": query.get("inputMint"), "outputMint": query.get("outputMint"),
+                         "inAmount": query.get("amount"), "outAmount": str(int(query.get("amount", 0)) * 1000),
+                         "slippageBps": int(query.get("slippageBps", 50)),
+                         "routePlan": [{"swapInfo": {"ammKey": self.pool(query.get("inputMint"),
+                                                                         query.get("outputMint")),
+                                                     "inputMint": query.get("inputMint"),
+                                                     "outputMint": query.get("outputMint")},
+                                        "percent": 100}]}
+        if parsed.path == "/swap/v1/swap":
+            self.bids["compute_unit_price" if "computeUnitPriceMicroLamports" in body else "priority_level"] += 1
+            transaction = unsigned_swap_transaction(Pubkey.from_string(body["userPublicKey"]))
+            return 200, {"swapTransaction": base64.b64encode(bytes(transaction)).decode(),
+                         "lastValidBlockHeight": 1000}
+        return 404, {"error": f"unknown path {path}"}
+
+    def stats(self):
+        return dict(super().stats(), bids=dict(self.bids))
+
+
+class MockSolanaRpc(MockService):
+    '''
+    Solana JSON-RPC node. Every sent transaction is confirmed on the first
+    status poll, and every wallet holds a balance of each mint in holdings.
+    Prioritization fees of a single account are local_fee_multiplier times
+    the network's, like a busy pool's local fee market.
+    '''
+    def __init__(self, holdings=(), local_fee_multiplier=5, **kwargs):
+        super().__init__(**kwargs)
+        self.holdings = list(holdings)
+        self.local_fee_multiplier = local_fee_multiplier
+        self.sent = 0
+
+    def token_account(self, mint, amount):
+        return {"pubkey": str(Pubkey.new_unique()), "account": {
+            "lamports": 2039280, "owner": TOKEN_PROGRAM_ID, "executable": False, "rentEpoch": 0, "space": 165,
+            "data": {"program": "spl-token", "space": 165, "parsed": {"type": "account", "info": {
+                "mint": mint, "owner": "", "tokenAmount": {"amount": str(amount), "decimals": 6,
+                                                           "uiAmount": amount / 1e6,
+                                                           "uiAmountString": str(amount / 1e6)}}}}}}
+
+    def call(self, method, params):
+        if method == "sendTransaction":
+            self.sent += 1
+            return str(VersionedTransaction.from_bytes(base64.b64decode(params[0])).signatures[0])
+        if method == "getSignatureStatuses":
+            status = {"slot": 1, "confirmations": None, "err": None, "status": {"Ok": None},
+                      "confirmationStatus": "confirmed"}
+            return {"context": {"slot": 1}, "value": [status for _ in params[0]]}
+        if method == "getBlockHeight":
+            return 10
+        if method == "getLatestBlockhash":
+            return {"context": {"slot": 1}, "value": {"blockhash": str(Hash.new_unique()), "lastValidBlockHeight": 1000}}
+        if method == "getRecentPrioritizationFees":
+            multiplier = self.local_fee_multiplier if params and params[0] else 1
+            return [{"slot": slot, "prioritizationFee": slot * 10 * multiplier} for slot in range(1, 151)]
+        if method == "getTokenAccountsByOwner":
+            program_id = params[1].get("programId")
+            accounts = [self.token_account(mint, 1000000) for mint in self.holdings] \
+                if program_id == TOKEN_PROGRAM_ID else []
+            return {"context": {"slot": 1}, "value": accounts}
+        return None
+
+    def handle(self, method, path, body):
+        calls = body if isinstance(body, list) else [body]
+        replies = [{"jsonrpc": "2.0", "id": call.get("id"), "result": self.call(call["method"], call.get("params", []))}
+                   for call in calls]
+        return 200, replies if isinstance(body, list) else replies[0]
+
+    def stats(self):
+        return dict(super().stats(), sent=self.sent)
+
+
+class FunctionHost:
+    '''
+    Serves an HTTP Cloud Function's entry point the way the Functions
+    Framework does: it is called with the Flask request and its return value
+    is the response. Calls without a bearer token are refused, like calls to
+    a function that does not allow unauthenticated invocations.
+    '''
+    def __init__(self, function):
+        '''
+        :param function: Callable(flask.Request), e.g. a trigger function's main
+        '''
+        self.function = function
+        self.calls = 0
+        self.refused = 0
+        self._server = None
+
+    def start(self):
+        app = flask.Flask("function")
+
+        def entry_point():
+            if not flask.request.headers.get("Authorization", "").startswith("Bearer "):
+                self.refused += 1
+                return "Unauthorized", 401
+            self.calls += 1
+            return self.function(flask.request)
+        app.add_url_rule("/", "main", entry_point, methods=["POST"])
+        self._server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return {"calls": self.calls, "refused": self.refused}
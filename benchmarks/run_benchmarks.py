@@ -0,0 +1,239 @@
+'''
+End-to-end latency benchmark. Starts local stand-ins for Dex Screener,
+Jupiter and the Solana RPC node, points the functions at them and times
+the scan, the buy trigger path, purchase_token and sell_token. Prints the
+results as JSON, or writes them to --output, so runs can be compared.
+
+    python benchmarks/run_benchmarks.py --tokens 200 --latency-ms 50 --output before.json
+'''
+import argparse
+import contextlib
+import importlib.util
+import json
+import math
+import os
+import sys
+import time
+import requests
+from solders.keypair import Keypair
+from mock_services import FunctionHost, MockDexScreener, MockJupiter, MockSolanaRpc
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "functions")
+DEXSCREENER_URL = "https://api.dexscreener.com"
+JUPITER_URL = "https://api.jup.ag"
+
+
+def percentile(values, percent):
+    '''
+    Nearest-rank percentile of a list of numbers, None for an empty list.
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+
+
+class StageTimer:
+    '''
+    Collects the duration of every run of each stage.
+    '''
+    def __init__(self):
+        self.samples = {}  # stage -> list of seconds
+        self.items = {}  # stage -> items processed
+        self.errors = {}
+
+    @contextlib.contextmanager
+    def time(self, stage, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def add(self, stage, seconds, items=1):
+        self.samples.setdefault(stage, []).append(seconds)
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def report(self):
+        report = {}
+        for stage, samples in self.samples.items():
+            total = sum(samples)
+            report[stage] = {
+                "runs": len(samples),
+                "items": self.items[stage],
+                "errors": self.errors.get(stage, 0),
+                "throughput_per_s": self.items[stage] / total if total else None,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            }
+        return report
+
+
+class RedirectSession(requests.Session):
+    '''
+    Sends requests for the real API hosts to the local mocks. http_client
+    still picks its rate limit bucket from the original URL.
+    '''
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+
+    def request(self, method, url, *args, **kwargs):
+        for prefix, target in self.routes.items():
+            if url.startswith(prefix):
+                url = target + url[len(prefix):]
+                break
+        return super().request(method, url, *args, **kwargs)
+
+
+def load_function(directory, name):
+    '''
+    Imports a function directory's main.py under its own module name. Shared
+    modules are identical copies, so one import of each serves every function.
+    '''
+    path = os.path.abspath(os.path.join(FUNCTIONS_DIR, directory))
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(path, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(args):
+    service_options = {"latency": args.latency_ms / 1000, "jitter": args.jitter_ms / 1000}
+    dexscreener = MockDexScreener(tokens=args.tokens, pass_rate=args.pass_rate, seed=args.seed,
+                                  rate=args.dexscreener_rps, **service_options).start()
+    jupiter = MockJupiter(rate=args.jupiter_rps, **service_options).start()
+    rpc = MockSolanaRpc(holdings=list(dexscreener.tokens)[:args.sells], rate=args.rpc_rps, **service_options).start()
+    os.environ.update({"SOLANA_RPC_URL": rpc.url, "PRIVATE_KEY_BASE58": str(Keypair()), "USER_ID": "benchmark"})
+    if args.no_client_limits:
+        # Measure the code alone instead of waiting on http_client's production quotas
+        os.environ.update({"DEXSCREENER_PROFILES_RPS": "1e6", "DEXSCREENER_RPS": "1e6",
+                           "DEXSCREENER_ORDERS_RPS": "1e6", "JUPITER_RPS": "1e6"})
+
+    scanner = load_function("start_service", "scanner_main")
+    buy = load_function("trigger_function_1", "buy_main")
+    sell = load_function("trigger_function_3", "sell_main")
+    import http_client
+    import swap_executor
+    from response_cache import ResponseCache
+    from wallet_state import MemoryWalletStore, WalletState
+    http_client.client.session = RedirectSession({DEXSCREENER_URL: dexscreener.url, JUPITER_URL: jupiter.url})
+    # The local function host takes any bearer token, there is no metadata server to sign one
+    http_client.id_token_for = lambda audience: "benchmark"
+    buy_function, sell_function = FunctionHost(buy.main).start(), FunctionHost(sell.main).start()
+    # Jupiter URLs are module constants of the swap executor
+    swap_executor.JUPITER_QUOTE_URL = jupiter.url + "/swap/v1/quote"
+    swap_executor.JUPITER_SWAP_URL = jupiter.url + "/swap/v1/swap"
+
+    timer = StageTimer()
+    user = {"user_id": "benchmark", "wallet_limit": 10 ** 9, "amount_in_sol": 0.03, "required_tests": [],
+            "function_trigger_1": buy_function.url, "function_trigger_3": sell_function.url}
+    quiet = open(os.devnull, "w")
+    with contextlib.redirect_stdout(quiet):
+        for _ in range(args.rounds):
+            # A cold cache every round, so each scan pays for its remote fetches
+            scanner.response_cache = ResponseCache(ttls=scanner.response_cache.ttls,
+                                                   max_bytes=scanner.response_cache.max_bytes)
+            with timer.time("intake"):
+                profiles = scanner.get_latest_tokens_dexscreener()
+            with timer.time("snapshots", items=len(profiles)):
+                snapshots = scanner.get_pricehistory_batch_dexscreener(
+                    [token['tokenAddress'] for token in profiles if token['chainId'] == "solana"])
+            with timer.time("filter", items=len(profiles)):
+                valid_tokens = scanner.filter_dexscreener_data(profiles, snapshots=snapshots)
+
+        # main()'s fan-out and function mode dispatch, with trigger_function_1 served over local HTTP
+        scanner.wallet_state = WalletState(MemoryWalletStore())
+        decided = {}  # tokenAddress -> when fan_out_tokens decided to buy it
+        purchases = {}  # tokenAddress -> purchase_token result
+        purchase_token = buy.purchase_token
+
+        def record_purchase(tokenAddress, position=None):
+            purchases[tokenAddress] = purchase_token(tokenAddress, position=position)
+            return purchases[tokenAddress]
+
+        def invoke_function(function_url, position):
+            outcome = http_client.invoke_function(function_url, position.to_json())
+            result = purchases.get(position.tokenAddress)
+            if result is None:
+                timer.errors["decision_to_submit"] = timer.errors.get("decision_to_submit", 0) + 1
+            else:
+                # Sent before the function waited for the confirmation
+                submitted = time.perf_counter() - result["timings"]["confirm"]
+                timer.add("decision_to_submit", submitted - decided[position.tokenAddress])
+            return outcome
+
+        def trigger_buy(user, tokenAddress, tokenMetadata):
+            decided[tokenAddress] = time.perf_counter()
+            dispatch.trigger_buy(user, tokenAddress, tokenMetadata)
+
+        buy.purchase_token = record_purchase
+        dispatch = scanner.FunctionDispatch(scanner.get_pricehistory_batch_dexscreener, scanner.wallet_state,
+                                            invoke_function, {user['user_id']: user}, workers=args.buy_workers)
+        dispatch.start()
+        scanner.fan_out_tokens(valid_tokens[:args.buys], snapshots, [user], trigger_buy)
+        dispatch.stop()
+        buy.purchase_token = purchase_token
+
+        swap_executor.executor.timings.clear()
+        for tokenAddress in list(dexscreener.tokens)[:args.buys]:
+            with timer.time("purchase_token"):
+                if buy.purchase_token(tokenAddress) is None:
+                    timer.errors["purchase_token"] = timer.errors.get("purchase_token", 0) + 1
+        for timings in list(swap_executor.executor.timings):
+            for stage, seconds in timings.items():
+                timer.add(f"swap.{stage}", seconds)
+        for tokenAddress in list(dexscreener.tokens)[:args.sells]:
+            with timer.time("sell_token"):
+                if "error" in sell.sell_token(tokenAddress):
+                    timer.errors["sell_token"] = timer.errors.get("sell_token", 0) + 1
+    confirmations = swap_executor.executor.confirmations.stats()
+    priority_fees = swap_executor.executor.fees.stats()
+    swap_executor.executor.close()
+    for service in (dexscreener, jupiter, rpc, buy_function, sell_function):
+        service.stop()
+
+    return {
+        "config": vars(args),
+        "stages": timer.report(),
+        "valid_tokens": len(valid_tokens),
+        "confirmations": confirmations,
+        "priority_fees": priority_fees,
+        "services": {"dexscreener": dexscreener.stats(), "jupiter": jupiter.stats(), "rpc": rpc.stats()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100, help="token profiles served by the mock feed")
+    parser.add_argument("--pass-rate", type=float, default=0.3, help="share of tokens built to pass the filter")
+    parser.add_argument("--rounds", type=int, default=5, help="scans to time")
+    parser.add_argument("--buys", type=int, default=20, help="purchase_token calls to time")
+    parser.add_argument("--sells", type=int, default=20, help="sell_token calls to time")
+    parser.add_argument("--buy-workers", type=int, default=4, help="buys the dispatch runs at once, as BUY_WORKERS")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency of every mock response")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="random extra latency, up to")
+    parser.add_argument("--dexscreener-rps", type=float, default=None, help="mock Dex Screener rate limit")
+    parser.add_argument("--jupiter-rps", type=float, default=None, help="mock Jupiter rate limit")
+    parser.add_argument("--rpc-rps", type=float, default=None, help="mock RPC rate limit")
+    parser.add_argument("--no-client-limits", action="store_true",
+                        help="lift http_client's own rate limits, leaving only the mocks' limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(results)
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
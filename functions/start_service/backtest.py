@@ -0,0 +1,385 @@
+import argparse
+import itertools
+import json
+import math
+import time
+from multiprocessing import Pool
+import numpy as np
+import requests
+import http_client
+import main as scanner
+import scoring
+from capture import CaptureReader
+from position_monitor import exit_conditions_met
+from profile_intake import ProfileIntake
+from price_history import PriceHistory
+from response_cache import ResponseCache
+from token_snapshot import decode_pairs, decode_pools
+from main import ENTRY_WATCH_MAX_AGE, MIN_ENTRY_MOMENTUM, PRICE_HISTORY_SAMPLES, PRICE_MOMENTUM_WINDOW, \
+    REQUIRED_PASSES, build_entry_metadata, check_links, filter_dexscreener_data, get_pricehistory_batch_dexscreener
+
+PROFILES_KEY = "GET https://api.dexscreener.com/token-profiles/latest/v1"
+POOL_PREFIX = "GET https://api.dexscreener.com/token-pairs/v1/"
+ORDERS_PREFIX = "GET https://api.dexscreener.com/orders/v1/"
+TOKENS_PREFIX = "GET https://api.dexscreener.com/tokens/v1/"
+# Sweep parameters are "<test>.<threshold>", the thresholds a live rule set can tune
+THRESHOLDS = {group: defaults for group, defaults in scanner.rule_tests().values() if defaults}
+
+
+class ReplayClient:
+    '''
+    Stand-in for http_client's client that answers every request from a
+    capture, with the last response recorded at or before clock. Requests
+    that were never captured get a 404, which fails the test that needed
+    them, as in Dataset.
+    '''
+    def __init__(self, reader, clock=None):
+        '''
+        :param reader: CaptureReader
+        :param clock: float, unix time responses are served as of, None for the end of the capture
+        '''
+        self.reader = reader
+        self.clock = clock
+        self.on_response = None
+        self.served = 0
+        self.missing = 0
+
+    def request(self, method, url, **kwargs):
+        position = self.reader.latest(f"{method} {url}", self.clock)
+        response = requests.Response()
+        response.url = url
+        if position is None:
+            self.missing += 1
+            response.status_code = 404
+            response._content = b"[]"
+        else:
+            self.served += 1
+            response.status_code = self.reader.entries[position][1]
+            response._content = self.reader.body(position)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def captured_data(reader, position, decode=json.loads):
+    '''
+    A captured response decoded the way the live fetch uses it. The live
+    fetches call raise_for_status and http_client records the final error
+    response too, so an error status fails the fetch here as it did live.
+    :param position: int, None for a request that was never captured
+    :param decode: Callable(bytes), e.g. decode_pools
+    :return: The decoded data, None where the live fetch would have failed
+    '''
+    if position is None or reader.entries[position][1] >= 400:
+        return None
+    try:
+        return decode(reader.body(position))
+    except ValueError:
+        return None
+
+
+def profile_polls(reader):
+    '''
+    Replays the captured token-profiles polls through ProfileIntake, like the live intake.
+    :return: List of (captured_at, served_until, new profiles). served_until is
+        the next poll's time, the end of the window the profiles were vetted in.
+    '''
+    intake = ProfileIntake(None)
+    polls = reader.matching(PROFILES_KEY)
+    batches = []
+    for i, (captured_at, position) in enumerate(polls):
+        profiles = captured_data(reader, position)
+        if not isinstance(profiles, list):
+            continue
+        served_until = polls[i + 1][0] if i + 1 < len(polls) else math.inf
+        fresh = intake.diff(profiles)
+        if fresh:
+            batches.append((captured_at, served_until, fresh))
+    return batches
+
+
+def token_timelines(reader):
+    '''
+    Splits every captured /tokens/v1 response back per requested token, the
+    same way get_pricehistory_batch_dexscreener does. A failed request
+    leaves its tokens without pairs at that time, as it does live.
+    :return: Dict of token address -> (list of captured_at, list of TokenSnapshot lists), in time order
+    '''
+    timelines = {}
+    for captured_at, position in reader.matching(TOKENS_PREFIX):
+        addresses = reader.entries[position][3][len(TOKENS_PREFIX):].split("/", 1)[-1].split(",")
+        snapshots = {address: [] for address in addresses}
+        for pair in captured_data(reader, position, decode_pairs) or []:
+            if pair.baseAddress in snapshots:
+                snapshots[pair.baseAddress].append(pair)
+            elif pair.quoteAddress in snapshots:
+                snapshots[pair.quoteAddress].append(pair)
+        for address, pairs in snapshots.items():
+            times, values = timelines.setdefault(address, ([], []))
+            times.append(captured_at)
+            values.append(pairs)
+    return timelines
+
+
+def entry_momentum(timeline, index):
+    '''
+    A token's momentum at its index-th snapshot, from the samples the live
+    price history would hold by then.
+    :param timeline: (list of captured_at, list of TokenSnapshot lists), see token_timelines
+    :return: float, None while the samples do not span PRICE_MOMENTUM_WINDOW
+    '''
+    times, snapshots = timeline
+    samples = [(captured_at, pairs) for captured_at, pairs in zip(times[:index + 1], snapshots[:index + 1]) if pairs]
+    history = PriceHistory(capacity=PRICE_HISTORY_SAMPLES, momentum_window=PRICE_MOMENTUM_WINDOW)
+    for captured_at, pairs in samples[-PRICE_HISTORY_SAMPLES:]:
+        history.add_snapshot(pairs[0], at=captured_at)
+    return history.momentum
+
+
+def watched_entry(timeline, index):
+    '''
+    Where the entry watch would vet a token again that the scan at its
+    index-th snapshot could not judge: its first later snapshot with a
+    known momentum. The watch's own lookups are captured too, so they are
+    part of the timeline.
+    :param timeline: (list of captured_at, list of TokenSnapshot lists), see token_timelines
+    :return: int, index of that snapshot, None if the watch would drop the token first
+    '''
+    times, snapshots = timeline
+    for later in range(index + 1, len(times)):
+        if times[later] - times[index] >= ENTRY_WATCH_MAX_AGE:
+            break
+        if snapshots[later] and entry_momentum(timeline, later) is not None:
+            return later
+    return None
+
+
+def simulate_exit(tokenMetadata, entered_at, timeline, trailing_stop=0):
+    '''
+    Walks a token's later snapshots until the exit rule of trigger_function_2 fires.
+    :param trailing_stop: float, see exit_conditions_met; the price history starts at the entry snapshot
+    :return: (return, exited): Tuple, return is the exit price over the entry price minus one,
+        or the last seen price for positions still open at the end of the capture
+    '''
+    times, snapshots = timeline
+    price = tokenMetadata['priceNative']
+    history = PriceHistory(capacity=PRICE_HISTORY_SAMPLES)
+    for captured_at, pairs in zip(times, snapshots):
+        if captured_at < entered_at or not pairs:
+            continue
+        try:
+            history.add_snapshot(pairs[0], at=captured_at)
+            if captured_at == entered_at:
+                continue
+            price = pairs[0].priceNative
+            if exit_conditions_met(tokenMetadata, pairs[0], history=history, trailing_stop=trailing_stop):
+                return price / tokenMetadata['priceNative'] - 1, True
+        except (KeyError, TypeError, ValueError):
+            continue
+    return price / tokenMetadata['priceNative'] - 1, False
+
+
+class Dataset:
+    '''
+    Every token the capture's intake would have vetted, loaded into NumPy
+    columns once, with the outcome of buying it precomputed from its later
+    snapshots. evaluate() then only compares columns against thresholds, so
+    thousands of combinations can be scored per second. Pool and orders
+    data only exist for tokens the live filter fetched them for; tokens
+    without them, or whose fetch failed, fail that test.
+    Tokens without a momentum at the scan also get the price history
+    columns and outcome of the snapshot the entry watch would vet them
+    again at, with the scan's pool and orders data, which the response
+    cache still serves by then.
+    '''
+    def __init__(self, reader, trailing_stop=0):
+        '''
+        :param reader: CaptureReader
+        :param trailing_stop: float, trailing stop of the simulated exits, see exit_conditions_met
+        '''
+        timelines = token_timelines(reader)
+        pools, pool_times, orders, order_times, histories, momenta, links, returns, exited = \
+            [], [], [], [], [], [], [], [], []
+        watch_histories, watch_momenta, watch_returns, watch_exited = [], [], [], []
+
+        def outcome(timeline, index):
+            try:
+                return simulate_exit(build_entry_metadata(timeline[1][index][0]), timeline[0][index], timeline,
+                                     trailing_stop=trailing_stop)
+            except (IndexError, KeyError, TypeError, ValueError, ZeroDivisionError):
+                return np.nan, False
+        for captured_at, served_until, profiles in profile_polls(reader):
+            for profile in profiles:
+                if profile.get('chainId') != "solana":
+                    continue
+                tokenAddress = profile['tokenAddress']
+                pool_position = reader.latest(f"{POOL_PREFIX}solana/{tokenAddress}", served_until)
+                orders_position = reader.latest(f"{ORDERS_PREFIX}solana/{tokenAddress}", served_until)
+                timeline = timelines.get(tokenAddress, ([], []))
+                # The scan's own snapshot is the first one fetched after the poll
+                index = np.searchsorted(timeline[0], captured_at, side='left')
+                if index < len(timeline[0]) and timeline[0][index] <= served_until:
+                    token_data = timeline[1][index]
+                else:
+                    index, token_data = None, []
+                pools.append(captured_data(reader, pool_position, decode_pools))
+                pool_times.append(reader.entries[pool_position][0] if pool_position is not None else captured_at)
+                orders.append(captured_data(reader, orders_position))
+                order_times.append(reader.entries[orders_position][0] if orders_position is not None else captured_at)
+                histories.append(token_data)
+                momenta.append(entry_momentum(timeline, index) if index is not None else None)
+                links.append(check_links(profile))
+                token_return, token_exited = outcome(timeline, index)
+                returns.append(token_return)
+                exited.append(token_exited)
+                # Where the entry watch would have vetted the token again, if it could not be judged now
+                watch_index = watched_entry(timeline, index) if index is not None and momenta[-1] is None else None
+                watch_histories.append(timeline[1][watch_index] if watch_index is not None else [])
+                watch_momenta.append(entry_momentum(timeline, watch_index) if watch_index is not None else None)
+                watch_return, watch_exit = outcome(timeline, watch_index)
+                watch_returns.append(watch_return)
+                watch_exited.append(watch_exit)
+        self.count = len(histories)
+        self.pool_known = np.array([pool is not None for pool in pools], dtype=bool)
+        self.orders_known = np.array([order is not None for order in orders], dtype=bool)
+        self.pool_columns = scoring.pool_columns(pools)
+        self.pool_now = np.array(pool_times, dtype=np.float64)[self.pool_columns['token_index']]
+        self.orders_columns = scoring.orders_columns(orders, now=np.array(order_times, dtype=np.float64))
+        self.pricehistory_columns = scoring.pricehistory_columns(histories, momentum=momenta)
+        self.watch_columns = scoring.pricehistory_columns(watch_histories, momentum=watch_momenta)
+        self.watch_returns = np.array(watch_returns, dtype=np.float64)
+        self.watch_exited = np.array(watch_exited, dtype=bool)
+        self.links = np.array(links, dtype=bool)
+        self.returns = np.array(returns, dtype=np.float64)
+        self.exited = np.array(exited, dtype=bool)
+
+    def evaluate(self, params):
+        '''
+        Scores the dataset with one set of thresholds.
+        :param params: Dict of "<test>.<threshold>" -> value, missing thresholds keep their defaults
+        :return: Dict of trade statistics
+        :raises ValueError: for a parameter that is not one of THRESHOLDS
+        '''
+        groups = {group: {} for group in THRESHOLDS}
+        for name, value in params.items():
+            group, _, threshold = name.partition(".")
+            if threshold not in THRESHOLDS.get(group, {}):
+                known = [f"{group}.{threshold}" for group, defaults in THRESHOLDS.items() for threshold in defaults]
+                raise ValueError(f"Unknown threshold {name!r}, the thresholds are {', '.join(known)}")
+            groups[group][threshold] = value
+        # The entry trend gate is part of the live price history test
+        groups['pricehistory'].setdefault('min_momentum', MIN_ENTRY_MOMENTUM)
+        pool_ok = scoring.score_pool_columns(self.pool_columns, now=self.pool_now, **groups['pool'])[0] \
+            & self.pool_known
+        orders_ok = scoring.score_orders_columns(self.orders_columns, **groups['orders']) & self.orders_known
+        pricehistory_ok, masks = scoring.score_pricehistory_columns(self.pricehistory_columns, **groups['pricehistory'])
+        other_passes = pool_ok.astype(int) + orders_ok + self.links
+        valid = other_passes + pricehistory_ok == REQUIRED_PASSES
+        # Tokens the entry trend gate could not judge are bought when the entry watch vets them again
+        watch_ok = scoring.score_pricehistory_columns(self.watch_columns, **groups['pricehistory'])[0]
+        rewatched = scoring.momentum_pending(self.pricehistory_columns, masks) & ~valid & \
+            (other_passes + watch_ok == REQUIRED_PASSES)
+        valid |= rewatched
+        all_returns = np.where(rewatched, self.watch_returns, self.returns)
+        exited = np.where(rewatched, self.watch_exited, self.exited)
+        returns = all_returns[valid & ~np.isnan(all_returns)]
+        return {
+            "tokens": self.count,
+            "valid": int(valid.sum()),
+            "trades": len(returns),
+            "exited": int((valid & exited).sum()),
+            "mean_return": float(returns.mean()) if len(returns) else None,
+            "total_return": float(returns.sum()),
+            "win_rate": float((returns > 0).mean()) if len(returns) else None,
+        }
+
+
+def replay_filter(reader):
+    '''
+    Runs the live filter_dexscreener_data over the capture, with http_client
+    answered from it instead of the network. Each intake batch is vetted
+    with responses as of the next poll, and with an empty response cache:
+    its TTLs run on the wall clock, not the capture's.
+    :return: List of (captured_at, valid_tokens) per intake batch
+    '''
+    replay_client = ReplayClient(reader)
+    live_client, http_client.client = http_client.client, replay_client
+    live_cache = scanner.response_cache
+    try:
+        results = []
+        for captured_at, served_until, profiles in profile_polls(reader):
+            replay_client.clock = served_until
+            scanner.response_cache = ResponseCache(ttls=live_cache.ttls, max_bytes=live_cache.max_bytes,
+                                                   default_ttl=live_cache.default_ttl)
+            snapshots = get_pricehistory_batch_dexscreener(
+                [token['tokenAddress'] for token in profiles if token['chainId'] == "solana"])
+            results.append((captured_at, filter_dexscreener_data(profiles, snapshots=snapshots)))
+        print(f"Replayed {replay_client.served} responses, {replay_client.missing} requests not in the capture")
+        return results
+    finally:
+        http_client.client = live_client
+        scanner.response_cache = live_cache
+
+
+_dataset = None
+
+
+def _init_worker(dataset):
+    global _dataset
+    _dataset = dataset
+
+
+def _evaluate(params):
+    return params, _dataset.evaluate(params)
+
+
+def sweep(dataset, grid, processes=None, chunksize=64):
+    '''
+    Scores every combination of a threshold grid on all cores.
+    :param dataset: Dataset
+    :param grid: Dict of "<test>.<threshold>" -> list of values
+    :param processes: int, worker processes, defaults to the number of cores
+    :return: List of (params, statistics) tuples, best total return first
+    '''
+    names = sorted(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    with Pool(processes, initializer=_init_worker, initargs=(dataset,)) as pool:
+        results = pool.map(_evaluate, combinations, chunksize=chunksize)
+    return sorted(results, key=lambda result: result[1]["total_return"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the token filter and exit rule on a capture file.")
+    parser.add_argument("capture", help="capture file written with CAPTURE_PATH")
+    parser.add_argument("--grid", help="JSON file of \"<test>.<threshold>\" -> list of values to sweep")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--replay", action="store_true", help="also run the live filter over the capture")
+    parser.add_argument("--trailing-stop", type=float, default=0, help="drawdown from the high that also sells")
+    args = parser.parse_args()
+
+    reader = CaptureReader(args.capture)
+    if args.replay:
+        for captured_at, valid_tokens in replay_filter(reader):
+            print(json.dumps({"at": captured_at, "valid": [token['tokenAddress'] for token, _ in valid_tokens]}))
+    start = time.perf_counter()
+    dataset = Dataset(reader, trailing_stop=args.trailing_stop)
+    print(f"Loaded {dataset.count} tokens from {len(reader)} captured responses in {time.perf_counter() - start:.2f}s")
+    if args.grid is None:
+        print(json.dumps({"params": {}, "result": dataset.evaluate({})}))
+        return
+    with open(args.grid) as f:
+        grid = json.load(f)
+    start = time.perf_counter()
+    results = sweep(dataset, grid, processes=args.processes)
+    print(f"Scored {len(results)} combinations in {time.perf_counter() - start:.2f}s")
+    for params, result in results[:args.top]:
+        print(json.dumps({"params": params, "result": result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b"BZCAP1\n"
+# Record header: capture time, HTTP status, flags, key length, body length
+HEADER = struct.Struct("<dHBHI")
+FLAG_ZLIB = 1
+
+
+class CaptureWriter:
+    '''
+    Appends API responses to a capture file. Every record is a fixed header
+    followed by the request key ("GET <url>") and the zlib-compressed body,
+    written with a single write so a crash can only cut off the last record.
+    '''
+    def __init__(self, path, compress_level=1):
+        '''
+        :param path: str, capture file, created if missing and appended to otherwise
+        :param compress_level: int, zlib level, 0 stores bodies uncompressed
+        '''
+        self.path = path
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC)
+            self._file.flush()
+        self.records = 0
+
+    def record(self, method, url, status, body, captured_at=None):
+        '''
+        :param method: str
+        :param url: str
+        :param status: int, HTTP status code
+        :param body: bytes
+        :param captured_at: float, unix time, defaults to now
+        '''
+        key = f"{method} {url}".encode()
+        flags = 0
+        if self.compress_level:
+            body = zlib.compress(body, self.compress_level)
+            flags |= FLAG_ZLIB
+        header = HEADER.pack(time.time() if captured_at is None else captured_at, status, flags, len(key), len(body))
+        with self._lock:
+            self._file.write(header + key + body)
+            self._file.flush()
+            self.records += 1
+
+    def record_response(self, method, url, response):
+        '''
+        http_client on_response hook. Recording errors are logged, never raised into the request.
+        '''
+        try:
+            self.record(method, url, response.status_code, response.content)
+        except Exception as e:
+            print(f"Error capturing {url}: {e}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CaptureReader:
+    '''
+    Read-only view of a capture file. The file is memory-mapped and indexed
+    by request key once; bodies are only decompressed and decoded on access.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        self.entries = []  # (captured_at, status, flags, key, body offset, body length), in file order
+        self.index = {}  # key -> (list of captured_at, list of entry positions), both in time order
+        self._build_index()
+
+    def _build_index(self):
+        offset = len(MAGIC)
+        size = len(self._map)
+        while offset + HEADER.size <= size:
+            captured_at, status, flags, key_length, body_length = HEADER.unpack_from(self._map, offset)
+            body_offset = offset + HEADER.size + key_length
+            if body_offset + body_length > size:
+                break  # Truncated last record
+            key = self._map[offset + HEADER.size:body_offset].decode()
+            self.entries.append((captured_at, status, flags, key, body_offset, body_length))
+            offset = body_offset + body_length
+        for position in sorted(range(len(self.entries)), key=lambda i: self.entries[i][0]):
+            times, positions = self.index.setdefault(self.entries[position][3], ([], []))
+            times.append(self.entries[position][0])
+            positions.append(position)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def body(self, position):
+        '''
+        :param position: int, index into entries
+        :return: bytes, the raw response body
+        '''
+        captured_at, status, flags, key, body_offset, body_length = self.entries[position]
+        body = self._map[body_offset:body_offset + body_length]
+        return zlib.decompress(body) if flags & FLAG_ZLIB else body
+
+    def json(self, position):
+        return json.loads(self.body(position))
+
+    def latest(self, key, at=None):
+        '''
+        :param key: str, "<METHOD> <url>"
+        :param at: float, unix time, defaults to the end of the capture
+        :return: int position of the last capture of key at or before at, or None
+        '''
+        times, positions = self.index.get(key, ((), ()))
+        count = len(times) if at is None else bisect.bisect_right(times, at)
+        return positions[count - 1] if count else None
+
+    def matching(self, prefix):
+        '''
+        Lists (captured_at, position) of every record whose key starts with prefix, in time order.
+        '''
+        found = []
+        for key, (times, positions) in self.index.items():
+            if key.startswith(prefix):
+                found.extend(zip(times, positions))
+        return sorted(found)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class EntryWatch:
+    '''
+    Keeps sampling the tokens the entry trend gate could not judge yet,
+    because their price history did not span the momentum window when they
+    were vetted. Each tick refreshes every watched token with one batched
+    price lookup, which adds a sample to its history, and hands the tokens
+    whose momentum is now known back to vet. Tokens still unknown after
+    max_age seconds are dropped.
+    '''
+    def __init__(self, fetch_snapshots, momentum, vet=None, interval=10, max_age=300, max_tokens=1000):
+        '''
+        :param fetch_snapshots: Callable taking a list of token addresses and
+            returning a dict of address -> list of TokenSnapshots, recording them in the price history
+        :param momentum: Callable(tokenAddress) returning the token's momentum, None while unknown
+        :param vet: Callable(list of tokenMetadata, snapshots) run for the tokens whose momentum is known
+        :param interval: float, seconds between ticks
+        :param max_age: float, seconds a token is watched at most
+        :param max_tokens: int, tokens watched at once, more are turned away
+        '''
+        self.fetch_snapshots = fetch_snapshots
+        self.momentum = momentum
+        self.vet = vet
+        self.interval = interval
+        self.max_age = max_age
+        self.max_tokens = max_tokens
+        self.tokens = {}  # tokenAddress -> (tokenMetadata, time.monotonic() it was added)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counts = {"watched": 0, "vetted": 0, "expired": 0, "refused": 0}
+
+    def add(self, tokenMetadata):
+        '''
+        :param tokenMetadata: Dict, the token's profile
+        :return: bool, False if the watch is full
+        '''
+        tokenAddress = tokenMetadata['tokenAddress']
+        with self._lock:
+            if tokenAddress in self.tokens:
+                return True
+            if len(self.tokens) >= self.max_tokens:
+                self.counts["refused"] += 1
+                return False
+            self.tokens[tokenAddress] = (tokenMetadata, time.monotonic())
+            self.counts["watched"] += 1
+            return True
+
+    def tick(self, now=None):
+        '''
+        Samples every watched token once and vets the ones whose momentum is known.
+        :param now: float, time.monotonic() value ages are measured at, defaults to now
+        :return: List of the tokenMetadata handed to vet
+        '''
+        with self._lock:
+            watched = dict(self.tokens)
+        if not watched:
+            return []
+        snapshots = self.fetch_snapshots(list(watched))
+        now = time.monotonic() if now is None else now
+        ready, expired = [], []
+        for tokenAddress, (tokenMetadata, added_at) in watched.items():
+            if self.momentum(tokenAddress) is not None:
+                ready.append(tokenMetadata)
+            elif now - added_at >= self.max_age:
+                expired.append(tokenMetadata)
+        with self._lock:
+            for tokenMetadata in ready + expired:
+                self.tokens.pop(tokenMetadata['tokenAddress'], None)
+            self.counts["vetted"] += len(ready)
+            self.counts["expired"] += len(expired)
+        if ready and self.vet is not None:
+            self.vet(ready, snapshots)
+        return ready
+
+    def run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error in entry watch: {e}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="entry-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, watching=len(self.tokens))
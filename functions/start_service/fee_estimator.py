@@ -0,0 +1,264 @@
+#Shared fee estimator: start_service, trigger_function_1 and trigger_function_3 ship identical copies of this file, keep them in sync.
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+import http_client
+import metrics
+
+PRIORITY_FEE_PERCENTILE = float(os.environ.get("PRIORITY_FEE_PERCENTILE", 75))  # Percentile of recent fees bid per swap
+PRIORITY_FEE_INTERVAL = float(os.environ.get("PRIORITY_FEE_INTERVAL", 2))  # Seconds between fee samples
+PRIORITY_FEE_TTL = float(os.environ.get("PRIORITY_FEE_TTL", 10))  # Seconds a fee estimate stays usable
+PRIORITY_FEE_SAMPLE_TIMEOUT = float(os.environ.get("PRIORITY_FEE_SAMPLE_TIMEOUT", 0.5))  # Longest wait on a swap's own fee sample
+PRIORITY_FEE_MIN = int(os.environ.get("PRIORITY_FEE_MIN", 1000))  # Lowest compute unit price bid, micro-lamports
+MAX_PRIORITY_FEE_LAMPORTS = int(os.environ.get("MAX_PRIORITY_FEE_LAMPORTS", 1000000))  # Most a swap pays in priority fees
+MAX_COMPUTE_UNITS = 1400000  # Compute unit limit of a transaction
+PERCENTILES = (25, 50, 75, 90, 99)
+
+
+def percentiles(values, percents=PERCENTILES):
+    '''
+    Nearest-rank percentiles of a list of numbers, sorted once.
+    :param values: List
+    :param percents: Tuple of floats, 0 to 100
+    :return: Dict of percent -> value, empty for an empty list
+    '''
+    ordered = sorted(values)
+    return {percent: ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+            for percent in percents} if ordered else {}
+
+
+def fee_bucket(compute_unit_price):
+    '''
+    Decade bucket of a compute unit price, e.g. "1e4" for 10,000 to 99,999
+    micro-lamports, "fallback" for swaps sent without an estimate.
+    '''
+    if compute_unit_price is None:
+        return "fallback"
+    if not compute_unit_price:
+        return "0"
+    return f"1e{int(math.log10(compute_unit_price))}"
+
+
+class FeeEstimator:
+    '''
+    Serves a compute unit price for each swap from recent prioritization
+    fees. Every sample is one batched getRecentPrioritizationFees request:
+    one call for the whole network and one per account, the pool accounts
+    swaps write-lock, whose local fee markets can be far above the
+    network's. Estimates are percentiles of the fees paid in the last 150
+    slots and expire after ttl seconds. estimate() samples a swap's pools
+    on demand when their estimates are missing or stale; a long-running
+    process can also start() a background sampler of the watched accounts,
+    so its swaps usually find fresh estimates and do not wait.
+    Swaps report back how they ended and how long they took to land, so the
+    landing rate and time of each fee level can be compared.
+    '''
+    def __init__(self, rpc_url, percentile=PRIORITY_FEE_PERCENTILE, interval=PRIORITY_FEE_INTERVAL,
+                 ttl=PRIORITY_FEE_TTL, min_price=PRIORITY_FEE_MIN,
+                 max_price=MAX_PRIORITY_FEE_LAMPORTS * 10**6 // MAX_COMPUTE_UNITS, max_accounts=16, history=1000,
+                 sample_timeout=PRIORITY_FEE_SAMPLE_TIMEOUT):
+        '''
+        :param rpc_url: str
+        :param percentile: float, one of PERCENTILES, the estimate fee_for() returns
+        :param interval: float, seconds between background samples
+        :param ttl: float, seconds an estimate stays usable
+        :param min_price: int, micro-lamports per compute unit, floor of fee_for()
+        :param max_price: int, micro-lamports per compute unit, cap of fee_for(); the default keeps
+            a swap's priority fee under MAX_PRIORITY_FEE_LAMPORTS at any compute unit limit
+        :param max_accounts: int, watched accounts, the least recently traded are dropped past it
+        :param history: int, landed swaps kept for landing_stats()
+        :param sample_timeout: float, seconds estimate() waits for its sample
+        '''
+        self.rpc_url = rpc_url
+        self.percentile = percentile
+        self.interval = interval
+        self.ttl = ttl
+        self.min_price = min_price
+        self.max_price = max_price
+        self.max_accounts = max_accounts
+        self.sample_timeout = sample_timeout
+        self.estimates = {}  # account, None for the network -> (sampled_at, Dict of percent -> fee)
+        self.landings = deque(maxlen=history)  # (compute_unit_price, outcome, seconds)
+        self.counts = {"samples": 0, "sample_errors": 0, "account": 0, "network": 0, "fallback": 0}
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, *accounts):
+        '''
+        Adds accounts to the background samples. A new account wakes the
+        sampler so its estimate is usually ready by the time its swap is built.
+        '''
+        with self._lock:
+            new = False
+            for account in accounts:
+                account = str(account)
+                new = new or account not in self._accounts
+                self._accounts[account] = None
+                self._accounts.move_to_end(account)
+            while len(self._accounts) > self.max_accounts:
+                dropped, _ = self._accounts.popitem(last=False)
+                self.estimates.pop(dropped, None)
+        if new:
+            self._wake.set()
+
+    def sample(self, accounts=None, timeout=None):
+        '''
+        Refreshes estimates with one batched request.
+        :param accounts: List of accounts, None standing for the network, defaults to the network and
+            every watched account
+        :param timeout: float, seconds to wait for the RPC; with it the request is sent once, without retries
+        '''
+        if accounts is None:
+            with self._lock:
+                accounts = [None] + list(self._accounts)
+        batch = [{"jsonrpc": "2.0", "id": index, "method": "getRecentPrioritizationFees",
+                  "params": [[account]] if account else []}
+                 for index, account in enumerate(accounts)]
+        with metrics.timer("priority_fee_sample"):
+            if timeout is None:
+                response = http_client.post(self.rpc_url, json=batch)
+            else:
+                response = http_client.client.session.post(self.rpc_url, json=batch, timeout=timeout)
+        response.raise_for_status()
+        sampled_at = time.monotonic()
+        replies = {reply.get("id"): reply.get("result") for reply in response.json()}
+        with self._lock:
+            for index, account in enumerate(accounts):
+                result = replies.get(index)
+                if isinstance(result, list) and result:
+                    self.estimates[account] = (sampled_at, percentiles([fee["prioritizationFee"] for fee in result]))
+            self.counts["samples"] += 1
+
+    def _fresh_fee(self, key, now):
+        # The estimate of an account, None for the network, if it is fresh; call with the lock held
+        entry = self.estimates.get(key)
+        if entry is not None and now - entry[0] <= self.ttl:
+            return entry[1].get(self.percentile)
+        return None
+
+    def stale(self, *accounts):
+        '''
+        :param accounts: str, pool accounts of a swap's route
+        :return: List of the accounts without a fresh estimate, led by None when the network's is not fresh
+        '''
+        now = time.monotonic()
+        with self._lock:
+            return [key for key in [None] + [str(account) for account in accounts]
+                    if self._fresh_fee(key, now) is None]
+
+    def fee_for(self, *accounts):
+        '''
+        Compute unit price for a swap write-locking accounts, from the cache
+        only: the highest of the accounts' and the network's fresh estimates,
+        so a busy pool raises the bid and a quiet one never takes it below
+        the network's. Every call counts as an estimated or a fallback bid.
+        :param accounts: str, pool accounts of the swap's route
+        :return: int, micro-lamports per compute unit, None without a fresh estimate
+        '''
+        now = time.monotonic()
+        with self._lock:
+            fresh = []
+            for key in [None] + [str(account) for account in accounts]:
+                fee = self._fresh_fee(key, now)
+                if fee is not None:
+                    fresh.append((fee, key))
+            if not fresh:
+                self.counts["fallback"] += 1
+                metrics.count("priority_fee_bids.fallback")
+                return None
+            # The network's estimate wins ties, it is listed first
+            fee, key = max(fresh, key=lambda estimate: estimate[0])
+            self.counts["network" if key is None else "account"] += 1
+        metrics.count("priority_fee_bids.estimated")
+        return int(min(self.max_price, max(self.min_price, fee)))
+
+    def estimate(self, *accounts):
+        '''
+        fee_for() a swap about to be built. The accounts, and the network,
+        without a fresh estimate are sampled first, waiting at most
+        sample_timeout; a sample that fails or times out leaves the swap on
+        whatever is fresh, or on the fallback.
+        :param accounts: str, pool accounts of the swap's route
+        :return: int, micro-lamports per compute unit, None without a fresh estimate
+        '''
+        self.watch(*accounts)
+        stale = self.stale(*accounts)
+        if stale:
+            try:
+                self.sample(stale, timeout=self.sample_timeout)
+            except Exception as e:
+                with self._lock:
+                    self.counts["sample_errors"] += 1
+                print(f"Error sampling priority fees for a swap: {e}")
+        return self.fee_for(*accounts)
+
+    def record_landing(self, compute_unit_price, outcome, seconds):
+        '''
+        Records how a swap sent at compute_unit_price ended and how long after sending.
+        :param compute_unit_price: int, None for a swap sent without an estimate
+        :param outcome: str, "confirmed", "failed" or "expired"
+        :param seconds: float
+        '''
+        bucket = fee_bucket(compute_unit_price)
+        self.landings.append((compute_unit_price, outcome, seconds))
+        metrics.count(f"landings.fee_{bucket}.{outcome}")
+        if outcome == "confirmed":
+            metrics.observe(f"time_to_land.fee_{bucket}", seconds)
+
+    def landing_stats(self):
+        '''
+        :return: Dict of fee bucket -> sent, outcome counts, landing_rate (share confirmed) and
+            time-to-land percentiles in seconds
+        '''
+        buckets = {}
+        for compute_unit_price, outcome, seconds in list(self.landings):
+            bucket = buckets.setdefault(fee_bucket(compute_unit_price), {"sent": 0, "confirmed": 0, "failed": 0, "expired": 0, "times": []})
+            bucket["sent"] += 1
+            bucket[outcome] += 1
+            if outcome == "confirmed":
+                bucket["times"].append(seconds)
+        for bucket in buckets.values():
+            times = percentiles(bucket.pop("times"), (50, 90))
+            bucket.update(landing_rate=bucket["confirmed"] / bucket["sent"], p50=times.get(50), p90=times.get(90))
+        return buckets
+
+    def stats(self):
+        '''
+        :return: Dict of counters, with fallback_rate the share of bids made without a fresh estimate
+        '''
+        with self._lock:
+            network = self.estimates.get(None)
+            bids = self.counts["account"] + self.counts["network"] + self.counts["fallback"]
+            return dict(self.counts, accounts=len(self._accounts),
+                        fallback_rate=self.counts["fallback"] / bids if bids else None,
+                        network_fees=network[1] if network is not None else None,
+                        landings=self.landing_stats())
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                with self._lock:
+                    self.counts["sample_errors"] += 1
+                print(f"Error sampling priority fees: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="fee-estimator", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
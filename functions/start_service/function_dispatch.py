@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from position_monitor import PositionMonitor
+from position_record import PositionRecord
+
+BUY_NOT_LANDED = ("failed", "expired")  # trigger_function_1 outcomes of a buy that never landed
+
+
+class FunctionDispatch:
+    '''
+    Function mode counterpart of Pipeline. Buys and sells are POSTed to
+    trigger_function_1 and trigger_function_3 from a pool of threads, so the
+    scan and the PositionMonitor never wait on them. Both functions answer
+    once their swap has resolved, with its outcome as the response body: a
+    position is only watched once its buy confirmed, and its wallet slot is
+    only freed once its sell landed. A buy whose outcome never arrives, e.g.
+    when the call timed out, may still have landed, so it keeps its slot and
+    is watched; if nothing was bought its sell finds no balance, which frees
+    the slot.
+    '''
+    def __init__(self, fetch_snapshots, wallet_state, invoke_function, users_by_id, workers=4, monitor_interval=10,
+                 price_history=None, trailing_stop=0):
+        '''
+        :param fetch_snapshots: Callable taking a list of token addresses, see PositionMonitor
+        :param wallet_state: WalletState, released when a buy fails or a sell lands
+        :param invoke_function: Callable(function_url, PositionRecord) returning the function's response body
+        :param users_by_id: Dict of user_id -> user Dict from load_users, with the function URLs
+        :param workers: int, invocations in flight at the same time
+        :param monitor_interval: float, seconds between open position checks
+        :param price_history: PriceHistoryStore, see PositionMonitor
+        :param trailing_stop: float, see PositionMonitor
+        '''
+        self.wallet_state = wallet_state
+        self.invoke_function = invoke_function
+        self.users_by_id = users_by_id
+        self.workers = workers
+        self.monitor = PositionMonitor(fetch_snapshots, self.dispatch_sell, interval=monitor_interval,
+                                       price_history=price_history, trailing_stop=trailing_stop)
+        self._pool = None
+
+    def trigger_buy(self, user, tokenAddress, tokenMetadata):
+        '''
+        Scan stage output, with the trigger_buy signature fan_out_tokens expects.
+        '''
+        print(f"Trigger condition met for user: {user['user_id']}")
+        position = PositionRecord(user['user_id'], tokenAddress, tokenMetadata, amount_in_sol=user['amount_in_sol'])
+        self._pool.submit(self.buy, user['function_trigger_1'], position)
+
+    def dispatch_sell(self, tokenAddress, tokenMetadata, tokenLiveData, user_id):
+        '''
+        Monitor stage output, with the dispatch_sell signature PositionMonitor expects.
+        '''
+        position = PositionRecord(user_id, tokenAddress, tokenMetadata, tokenLiveData=tokenLiveData)
+        self._pool.submit(self.sell, self.users_by_id[user_id]['function_trigger_3'], position)
+
+    def invoke(self, function_url, position):
+        '''
+        :return: str, the function's response body, None when the call failed
+        '''
+        try:
+            return self.invoke_function(function_url, position)
+        except Exception as e:
+            print(f"Error invoking {function_url} for {position.tokenAddress}: {e}")
+            return None
+
+    def buy(self, function_url, position):
+        outcome = self.invoke(function_url, position)
+        if outcome in BUY_NOT_LANDED:
+            print(f"Function {function_url} did not buy {position.tokenAddress} for user: {position.user_id}: "
+                  f"{outcome}")
+            # Release the wallet slot of a position that was never opened
+            self.wallet_state.record_sell(position.user_id, position.tokenAddress)
+            return
+        if outcome == "confirmed":
+            print(f"Function {function_url} bought {position.tokenAddress} for user: {position.user_id}")
+        else:
+            print(f"Buy of {position.tokenAddress} for user: {position.user_id} has no known outcome, "
+                  f"watching it in case it landed")
+        self.monitor.add_position(position.tokenAddress, position.tokenMetadata, user_id=position.user_id)
+
+    def sell(self, function_url, position):
+        outcome = self.invoke(function_url, position)
+        if outcome == "sold":
+            self.wallet_state.record_sell(position.user_id, position.tokenAddress)
+            print(f"Function {function_url} sold {position.tokenAddress} for user: {position.user_id}")
+        else:
+            print(f"Function {function_url} did not sell {position.tokenAddress} for user: {position.user_id}: "
+                  f"{outcome}")
+            # Watch it again so the next tick retries the exit
+            self.monitor.add_position(position.tokenAddress, position.tokenMetadata, user_id=position.user_id)
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dispatch")
+        self.monitor.start()
+
+    def stop(self):
+        '''
+        Stops the monitor, then waits for the invocations in flight.
+        '''
+        self.monitor.stop()
+        self._pool.shutdown(wait=True)
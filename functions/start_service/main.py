@@ -3,16 +3,97 @@ import time
 import requests
 import json
 import base64
-from google.cloud import secretmanager, functions_v2
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-
+import functools
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import ResponseCache
+import http_client
+import metrics
+from function_dispatch import FunctionDispatch
+from wallet_state import WalletState, FirestoreWalletStore
+from quote_cache import QuoteCache
+from profile_intake import ProfileIntake
+from capture import CaptureWriter
+from token_snapshot import decode_pairs, decode_pools, pack_pools, unpack_pools
+from price_history import PriceHistoryStore
+from entry_watch import EntryWatch
+from rule_plan import DEFAULT_RULE_SET, RulePlan, rule_set_name, threshold_defaults
+
+VETTING_MAX_WORKERS = int(os.environ.get("VETTING_MAX_WORKERS", 16))  # Tokens vetted at the same time
+FETCHES_PER_TOKEN = 2  # Pool and orders requests per token, price history is batched
+DEXSCREENER_MAX_ADDRESSES = 30  # Addresses accepted by one /tokens/v1 request
+VALIDITY_TESTS = ['pool_test', 'orders_test', 'link_test', 'pricehistory_test']
+REQUIRED_PASSES = 3  # Number of VALIDITY_TESTS a token must pass
+STRUCTURAL_TESTS = ['pool_test', 'link_test']  # Failures that will not change within a few cycles
+BATCH_SCORING = os.environ.get("BATCH_SCORING", "0") == "1"  # Score whole scans with NumPy columns
+MONITOR_INTERVAL = float(os.environ.get("MONITOR_INTERVAL", 10))  # Seconds between open position checks
+INTAKE_MIN_INTERVAL = float(os.environ.get("INTAKE_MIN_INTERVAL", 5))  # Fastest token-profiles poll, under its 60 req/min limit
+INTAKE_MAX_INTERVAL = float(os.environ.get("INTAKE_MAX_INTERVAL", 60))  # Slowest token-profiles poll when the feed is quiet
+QUOTE_PREFETCH = os.environ.get("QUOTE_PREFETCH", "0") == "1"  # Quote tokens speculatively while vetting them, pipeline mode only
+QUOTE_PREFETCH_MAX = int(os.environ.get("QUOTE_PREFETCH_MAX", 4))  # Candidates prefetched at once, later ones are not prefetched
+QUOTE_PREFETCH_RPS = float(os.environ.get("QUOTE_PREFETCH_RPS", 0.25))  # Prefetch budget, on top of the Jupiter rate limit
+QUOTE_PREFETCH_RESERVE = int(os.environ.get("QUOTE_PREFETCH_RESERVE", 2))  # Jupiter requests a prefetch leaves to the buy path
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "0") == "1"  # Buy, monitor and sell in this process instead of invoking functions
+BUY_WORKERS = int(os.environ.get("BUY_WORKERS", 4))  # Buys in flight at the same time, until they confirm
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))  # Serve Prometheus metrics on /metrics when set
+CAPTURE_PATH = os.environ.get("CAPTURE_PATH")  # Append every API response here for backtest.py (optional)
+PRICE_HISTORY_SAMPLES = int(os.environ.get("PRICE_HISTORY_SAMPLES", 60))  # Price samples kept per token
+PRICE_HISTORY_MAX_TOKENS = int(os.environ.get("PRICE_HISTORY_MAX_TOKENS", 10000))  # Tokens with a price history at once
+TRAILING_STOP = float(os.environ.get("TRAILING_STOP", 0))  # Sell at this drawdown from the price history's high, 0 for off
+MIN_ENTRY_MOMENTUM = float(os.environ.get("MIN_ENTRY_MOMENTUM", "-inf"))  # Lowest momentum a token may be bought at, -inf for off
+PRICE_MOMENTUM_WINDOW = float(os.environ.get("PRICE_MOMENTUM_WINDOW", 60))  # Seconds of price history momentum looks back
+ENTRY_WATCH_INTERVAL = float(os.environ.get("ENTRY_WATCH_INTERVAL", 10))  # Seconds between samples of tokens awaiting a momentum
+ENTRY_WATCH_MAX_AGE = float(os.environ.get("ENTRY_WATCH_MAX_AGE", 300))  # Seconds a token awaiting a momentum is sampled at most
+SOL_MINT = "So11111111111111111111111111111111111111112"
+# Thresholds a user's rules may set per test: those both the check and its scoring.py scorer read,
+# so a rule means the same in scalar scoring, batch scoring and backtests
+RULE_THRESHOLDS = {
+    'pool_test': ('min_liquidity_usd', 'min_pool_age_days', 'min_volume_usd', 'max_price_change_percent',
+                  'min_num_pools', 'max_fdv_usd'),
+    'orders_test': ('max_recent_ads', 'max_recent_takeovers', 'ad_window_hours', 'takeover_window_hours'),
+    'pricehistory_test': ('min_m5_buy_ratio', 'min_h1_buy_ratio', 'min_h6_buy_ratio', 'max_m5_price_drop_percent',
+                          'min_m5_volume'),
+}
+DEFAULT_USER_SETTINGS = {
+    "wallet_limit": 5,  # Maximum number of tokens held at once
+    "amount_in_sol": 0.03,  # SOL spent per buy
+    "required_tests": [],  # VALIDITY_TESTS a token must have passed for this user to buy it
+    "rules": {},  # "<group>.<threshold>" -> value replacing a validity check's default, see compile_rule_plan
+}
+
+# Responses reused across polling cycles, and tokens rejected for structural reasons
+response_cache = ResponseCache(
+    ttls={
+        "pool": int(os.environ.get("POOL_CACHE_TTL", 900)),
+        "orders": int(os.environ.get("ORDERS_CACHE_TTL", 600)),
+        "rejected": int(os.environ.get("REJECTED_CACHE_TTL", 1800)),
+    },
+    max_bytes=int(os.environ.get("CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+)
+# Jupiter quotes prefetched for tokens that are close to passing
+quote_cache = QuoteCache(lambda *args: get_jupiter_swap_quote(*args), ttl=float(os.environ.get("QUOTE_TTL", 3)),
+                         prefetch_quote=lambda *args: prefetch_jupiter_swap_quote(*args))
+# Quote prefetches allowed, apart from the Jupiter bucket the buy path draws on
+prefetch_budget = http_client.TokenBucket(QUOTE_PREFETCH_RPS, 1)
+# Holdings per user, kept in memory and written back to Firestore in the background
+wallet_state = WalletState(FirestoreWalletStore(), flush_interval=float(os.environ.get("WALLET_FLUSH_INTERVAL", 5)))
+# Recent prices of every token fetched, for the entry trend gate and the trailing stop
+price_history = PriceHistoryStore(capacity=PRICE_HISTORY_SAMPLES, max_tokens=PRICE_HISTORY_MAX_TOKENS,
+                                  momentum_window=PRICE_MOMENTUM_WINDOW)
+# Tokens the entry trend gate could not judge yet, sampled until their momentum is known; main() vets them again
+entry_watch = EntryWatch(lambda tokenAddresses: get_pricehistory_batch_dexscreener(tokenAddresses),
+                         lambda tokenAddress: entry_momentum(tokenAddress),
+                         interval=ENTRY_WATCH_INTERVAL, max_age=ENTRY_WATCH_MAX_AGE)
+# Rule plan used when no plan is passed in: the default rule set alone, compiled on first use
+_rule_plan = None
+
+@metrics.timed("dexscreener_profiles")
 def get_latest_tokens_dexscreener():
     """Fetches real-time latest tokens from Dex Screener"""
     url = "https://api.dexscreener.com/token-profiles/latest/v1"
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
         data = response.json()
         return data
@@ -20,46 +101,253 @@ def get_latest_tokens_dexscreener():
         error = f"Error fetching data: {e}"
         # log error
         return error
-def filter_dexscreener_data(data):
+@metrics.timed("vet_scan")
+def filter_dexscreener_data(data, snapshots=None, max_workers=VETTING_MAX_WORKERS, batch_scoring=BATCH_SCORING,
+                            on_candidate=None, plan=None):
     '''
     Filter tokens from dex screener to only valid ones.
+    Tokens are vetted in parallel on a bounded thread pool. Price history
+    comes from one batched lookup for the whole scan.
     :param data: List
-    :return: valid_tokens: List
+    :param snapshots: Dict of price history data per token address, fetched if not given
+    :param max_workers: int
+    :param batch_scoring: bool, vet the scan with vet_tokens_batch instead of token by token
+    :param on_candidate: Callable(tokenMetadata) run for tokens that pass the free checks (optional)
+    :param plan: RulePlan of the users' rule sets, defaults to get_rule_plan()
+    :return: valid_tokens: List of (token, verdicts) tuples, verdicts maps each rule set the token
+        is valid under to its passed_tests
     '''
+    start = time.perf_counter()
+    if snapshots is None:
+        snapshots = get_pricehistory_batch_dexscreener(
+            [token['tokenAddress'] for token in data if token['chainId'] == "solana"])
+    stats = ScanStats()
     valid_tokens = []
-    for token in data:
-        valid,passed_tests = is_valid_dexscreener(token)
-        if valid:
-            valid_tokens.append((token,passed_tests))
+    if batch_scoring:
+        results = vet_tokens_batch(data, snapshots, stats=stats, max_workers=max_workers, on_candidate=on_candidate,
+                                   plan=plan)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as token_pool, \
+                ThreadPoolExecutor(max_workers=max_workers * FETCHES_PER_TOKEN) as fetch_pool:
+            # map() keeps input order, so the output matches the serial scan
+            results = list(token_pool.map(
+                lambda token: is_valid_dexscreener(token, executor=fetch_pool, stats=stats, on_candidate=on_candidate,
+                                                   token_data=snapshots.get(token['tokenAddress']), plan=plan), data))
+    for token, verdicts in zip(data, results):
+        if verdicts:
+            valid_tokens.append((token, verdicts))
+    elapsed = time.perf_counter() - start
+    metrics.count("tokens_vetted", len(data))
+    metrics.count("tokens_valid", len(valid_tokens))
+    print(f"Vetted {len(data)} tokens in {elapsed:.2f}s ({len(valid_tokens)} valid, "
+          f"{stats.remote_calls} remote fetches, {stats.remote_calls_saved} skipped)")
     return valid_tokens
-def is_valid_dexscreener(tokenMetadata):
+class ScanStats:
+    '''
+    Counters shared by the threads vetting one scan.
     '''
-    Determines if dexscreener token is valid for purchase.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remote_calls = 0
+        self.remote_calls_saved = 0
+
+    def add(self, remote_calls=0, remote_calls_saved=0):
+        with self._lock:
+            self.remote_calls += remote_calls
+            self.remote_calls_saved += remote_calls_saved
+def is_valid_dexscreener(tokenMetadata, executor=None, token_data=None, stats=None, on_candidate=None, plan=None):
+    '''
+    Determines if dexscreener token is valid for purchase under each rule set of the plan.
+    Checks run lazily, cheapest first, and remote data is only fetched while
+    a check can still change a verdict. Each distinct rule runs once for
+    every rule set that contains it.
     :param tokenMetadata: Dict
-    :return: valid: Boolean
+    :param executor: Executor used to fetch the token's data concurrently (optional)
+    :param token_data: Price history data already fetched for the token (optional)
+    :param stats: ScanStats to record remote calls made and skipped (optional)
+    :param on_candidate: Callable(tokenMetadata) run once before the first remote check (optional)
+    :param plan: RulePlan, defaults to get_rule_plan()
+    :return: Dict of rule set name -> passed_tests, for the rule sets the token is valid under
     '''
     if tokenMetadata['chainId'] != "solana":
-        return False,[]
-
-    score_sum = 0
-    passed_tests = []
-
-    if check_pool_dexscreener(pool_data= get_pool_dexscreener(tokenAddress=tokenMetadata['tokenAddress'])):
-        score_sum += 1
-        passed_tests.append('pool_test')
-    if check_orderspaid_dexscreener(orders_data= get_orderspaid_dexscreener(tokenAddress=tokenMetadata['tokenAddress'])):
-        score_sum += 1
-        passed_tests.append('orders_test')
-    if check_links(tokenMetadata = tokenMetadata):
-        score_sum += 1
-        passed_tests.append('link_test')
-    if check_pricehistory_dexscreener(token_data = get_pricehistory_dexscreener(tokenAddress=tokenMetadata['tokenAddress'])):
-        score_sum += 1
-        passed_tests.append('pricehistory_test')
-    if score_sum == 3:
-        return True,passed_tests
+        return {}
+    rejected, _ = response_cache.get("rejected", tokenMetadata['tokenAddress'])
+    if rejected:
+        return {}
+
+    evaluation = (get_rule_plan() if plan is None else plan).evaluation()
+    pending = sorted(build_validity_checks(tokenMetadata, token_data=token_data), key=lambda check: check[1])
+    remote_calls = 0
+
+    while pending and evaluation.tests_needed():
+        # A verdict needs max_failures + 1 failures to be decided early, so every
+        # check before that point is needed whatever the outcome: run them together.
+        step = pending[:evaluation.tests_needed()]
+        pending = pending[len(step):]
+        step_remote_calls = sum(1 for check in step if check[2] is not None)
+        if step_remote_calls and on_candidate is not None:
+            # Still able to pass: let speculative work overlap the remote checks
+            on_candidate(tokenMetadata)
+            on_candidate = None
+        remote_calls += step_remote_calls
+        run_validity_checks(step, evaluation, executor=executor)
+
+    if stats is not None:
+        stats.add(remote_calls=remote_calls,
+                  remote_calls_saved=sum(1 for check in pending if check[2] is not None))
+    return record_verdict(tokenMetadata, evaluation)
+def record_verdict(tokenMetadata, evaluation):
+    '''
+    Turns the tests a token passed and failed into its verdicts. Tokens
+    whose STRUCTURAL_TESTS failures alone reject them under every rule set
+    go in the negative cache; a structural failure that other, transient
+    failures tipped over does not.
+    :param tokenMetadata: Dict
+    :param evaluation: PlanEvaluation of the token
+    :return: Dict of rule set name -> passed_tests, for the rule sets the token is valid under
+    '''
+    valid = {name: passed_tests for name, (is_valid, passed_tests) in evaluation.verdicts().items() if is_valid}
+    structural_failures = {name: [test for test in failed_tests if test in STRUCTURAL_TESTS]
+                           for name, failed_tests in evaluation.failed.items()}
+    if not valid and all(len(structural_failures[name]) > rule_set.max_failures
+                         for name, rule_set in evaluation.plan.rule_sets.items()):
+        response_cache.set("rejected", tokenMetadata['tokenAddress'],
+                           sorted({test for failures in structural_failures.values() for test in failures}))
+    return valid
+def vet_tokens_batch(data, snapshots, stats=None, max_workers=VETTING_MAX_WORKERS, on_candidate=None, plan=None):
+    '''
+    Vets a whole scan breadth first. Each test runs for every token that can
+    still pass before the next, more expensive one starts, so price history
+    and pool data are scored with vectorized operations over the whole scan,
+    one call per distinct rule of the plan.
+    Uses the same cost order and skip rule as is_valid_dexscreener and
+    returns the same verdicts. snapshots must cover every token in data.
+    :param data: List
+    :param snapshots: Dict of price history data per token address
+    :param stats: ScanStats (optional)
+    :param max_workers: int, concurrent remote fetches
+    :param on_candidate: Callable(tokenMetadata) run for tokens still open after the free checks (optional)
+    :param plan: RulePlan, defaults to get_rule_plan()
+    :return: List of verdict Dicts in data order, see is_valid_dexscreener
+    '''
+    # NumPy is only loaded when batch scoring is used
+    scoring = metrics.lazy_import("scoring")
+    plan = get_rule_plan() if plan is None else plan
+    candidates = [index for index, token in enumerate(data)
+                  if token['chainId'] == "solana" and not response_cache.get("rejected", token['tokenAddress'])[0]]
+    evaluations = {index: plan.evaluation() for index in candidates}
+
+    def run_test(name, indexes, score):
+        # score(**thresholds) returns one verdict per token in indexes
+        if not indexes:
+            return
+        open_sets = [evaluations[index].open_sets() for index in indexes]
+        results = [{} for _ in indexes]
+        for rule in plan.rules_for(name, list(dict.fromkeys(n for names in open_sets for n in names))):
+            start = time.perf_counter()
+            verdicts = [bool(verdict) for verdict in score(**rule.thresholds)]
+            rule.record(len(verdicts), verdicts.count(False), time.perf_counter() - start)
+            for result, verdict in zip(results, verdicts):
+                result[rule] = verdict
+        for index, names, result in zip(indexes, open_sets, results):
+            evaluations[index].record(names, [name], result)
+
+    def still_open():
+        return [index for index in candidates if evaluations[index].open_sets()]
+
+    def fetch_all(fetch, indexes):
+        return list(fetch_pool.map(lambda index: fetch(tokenAddress=data[index]['tokenAddress']), indexes))
+
+    # Free checks first
+    run_test('link_test', candidates, lambda: [check_links(tokenMetadata=data[index]) for index in candidates])
+    price_indexes = still_open()
+    price_columns = scoring.pricehistory_columns([snapshots.get(data[index]['tokenAddress']) for index in price_indexes],
+                                                 momentum=[entry_momentum(data[index]['tokenAddress'])
+                                                           for index in price_indexes])
+
+    def score_pricehistory(**thresholds):
+        verdicts, masks = scoring.score_pricehistory_columns(price_columns, **thresholds)
+        for index, pending in zip(price_indexes, scoring.momentum_pending(price_columns, masks).tolist()):
+            if pending:
+                entry_watch.add(data[index])
+        return verdicts
+
+    run_test('pricehistory_test', price_indexes, score_pricehistory)
+    if on_candidate is not None:
+        for index in still_open():
+            on_candidate(data[index])
+
+    # Remote checks in cost order, only for tokens whose verdict is still open
+    with ThreadPoolExecutor(max_workers=max_workers) as fetch_pool:
+        orders_indexes = still_open()
+        orders = fetch_all(get_orderspaid_dexscreener, orders_indexes)
+        run_test('orders_test', orders_indexes,
+                 lambda **thresholds: [check_orderspaid_dexscreener(orders_data=order, **thresholds) for order in orders])
+        pool_indexes = still_open()
+        pool_columns = scoring.pool_columns(fetch_all(get_pool_dexscreener, pool_indexes))
+        run_test('pool_test', pool_indexes, lambda **thresholds: scoring.score_pool_columns(pool_columns, **thresholds)[0])
+
+    if stats is not None:
+        stats.add(remote_calls=len(orders_indexes) + len(pool_indexes),
+                  remote_calls_saved=2 * len(candidates) - len(orders_indexes) - len(pool_indexes))
+    results = [{}] * len(data)
+    for index in candidates:
+        results[index] = record_verdict(data[index], evaluations[index])
+    return results
+def build_validity_checks(tokenMetadata, token_data=None):
+    '''
+    Lists the validity checks for a token as (name, cost, fetch, check) tuples.
+    fetch is None for checks that need no remote call, otherwise check is
+    given the fetched data, followed by the thresholds of a rule.
+    :param tokenMetadata: Dict
+    :param token_data: Price history data already fetched for the token (optional)
+    :return: List
+    '''
+    tokenAddress = tokenMetadata['tokenAddress']
+
+    def pricehistory_check(data, min_momentum=MIN_ENTRY_MOMENTUM, **thresholds):
+        if not check_pricehistory_dexscreener(token_data=data, **thresholds):
+            return False
+        trend = check_entry_trend(tokenAddress, min_momentum)
+        if trend is None:
+            # Too short a history to judge: sampled until it is long enough, then vetted again
+            entry_watch.add(tokenMetadata)
+        return bool(trend)
+
+    if token_data is None:
+        pricehistory = ('pricehistory_test', 1,
+                        lambda: get_pricehistory_dexscreener(tokenAddress=tokenAddress), pricehistory_check)
+    else:
+        pricehistory = ('pricehistory_test', 0, None,
+                        lambda data, **thresholds: pricehistory_check(token_data, **thresholds))
+    return [
+        ('pool_test', 2,
+         lambda: get_pool_dexscreener(tokenAddress=tokenAddress),
+         lambda data, **thresholds: check_pool_dexscreener(pool_data=data, **thresholds)),
+        ('orders_test', 1,
+         lambda: get_orderspaid_dexscreener(tokenAddress=tokenAddress),
+         lambda data, **thresholds: check_orderspaid_dexscreener(orders_data=data, **thresholds)),
+        ('link_test', 0, None,
+         lambda data: check_links(tokenMetadata=tokenMetadata)),
+        pricehistory,
+    ]
+def run_validity_checks(checks, evaluation, executor=None):
+    '''
+    Runs a group of validity checks for the rule sets still open. Remote
+    data for the group is fetched once, whatever the number of rules, and
+    at the same time when an executor is given.
+    :param checks: List of (name, cost, fetch, check) tuples
+    :param evaluation: PlanEvaluation of the token
+    :param executor: Executor
+    '''
+    fetched = {name: None for name, cost, fetch, check in checks if fetch is None}
+    remote = [(name, fetch) for name, cost, fetch, check in checks if fetch is not None]
+    if executor is None or len(remote) < 2:
+        fetched.update((name, fetch()) for name, fetch in remote)
     else:
-        return False,passed_tests
+        futures = [(name, executor.submit(fetch)) for name, fetch in remote]
+        fetched.update((name, future.result()) for name, future in futures)
+    evaluation.run([(name, functools.partial(check, fetched[name])) for name, cost, fetch, check in checks])
 def check_links(tokenMetadata):
     if 'links' in tokenMetadata:
         if len(tokenMetadata['links']) >= 2:
@@ -67,58 +355,141 @@ def check_links(tokenMetadata):
     return False
 def get_pool_dexscreener(tokenAddress,chainId = "solana"):
     '''
-    Retrieves the pool data for a token.
+    Retrieves the pool data for a token. Responses are cached for POOL_CACHE_TTL
+    seconds, packed down to the fields the pool check reads.
     :param pair_address: str
-    :return: Pool Data: list
+    :return: Pool Data: list of PoolSnapshot, None for pools missing a field; None when the request failed
     '''
-    response = requests.get(
-        f"https://api.dexscreener.com/token-pairs/v1/{chainId}/{tokenAddress}",
-    )
-    data = response.json()
-    return data
+    def fetch():
+        with metrics.timer("dexscreener_pool"):
+            response = http_client.get(
+                f"https://api.dexscreener.com/token-pairs/v1/{chainId}/{tokenAddress}",
+            )
+        response.raise_for_status()
+        return pack_pools(decode_pools(response.content))
+    try:
+        return unpack_pools(response_cache.get_or_fetch("pool", f"{chainId}/{tokenAddress}", fetch))
+    except requests.exceptions.RequestException as e:
+        # Failed requests fail the test instead of the scan, and are not cached
+        print(f"Failed to fetch pools of {tokenAddress}: {e}")
 def get_orderspaid_dexscreener(tokenAddress, chainId = "solana"):
     '''
     Get data on orders paid for a token. Determines level of advertising
     and helps determine if it's a pump and dump scheme.
+    Responses are cached for ORDERS_CACHE_TTL seconds.
     :param pair_address: str
     :param chainId: str
-    :return: List
+    :return: List, None when the request failed
     '''
-
-    response = requests.get(
-        f"https://api.dexscreener.com/orders/v1/{chainId}/{tokenAddress}",
-    )
-
-    data = response.json()
-    return data
+    def fetch():
+        with metrics.timer("dexscreener_orders"):
+            response = http_client.get(
+                f"https://api.dexscreener.com/orders/v1/{chainId}/{tokenAddress}",
+            )
+        response.raise_for_status()
+        return response.json()
+    try:
+        return response_cache.get_or_fetch("orders", f"{chainId}/{tokenAddress}", fetch)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Failed requests fail the test instead of the scan, and are not cached
+        print(f"Failed to fetch orders of {tokenAddress}: {e}")
+@metrics.timed("dexscreener_pricehistory")
 def get_pricehistory_dexscreener(tokenAddress,chainId = "solana"):
     '''
     Get Price History Data for a specific token.
     :param tokenAddress: str
     :param chainId: str
-    :return: List
+    :return: List of TokenSnapshot, one per pair
     '''
 
-    # data = response.json()
-    # return data
-    retries = 3
-
-    for i in range(retries):
+    # Transient failures are retried with backoff by http_client
+    try:
+        response = http_client.get(
+            f"https://api.dexscreener.com/tokens/v1/{chainId}/{tokenAddress}"
+        )
+        response.raise_for_status()
+        return decode_pairs(response.content)
+    except Exception as e:
+        print(f"Failed after retries: {e}")
+@metrics.timed("jupiter_quote")
+def get_jupiter_swap_quote(from_token_mint, to_token_mint, amount, slippage_bps=50, reserve=None):
+    """Gets a swap quote from Jupiter. reserve makes it a low priority request, see HttpClient.request."""
+    url = f"https://api.jup.ag/swap/v1/quote?inputMint={from_token_mint}&outputMint={to_token_mint}&amount={amount}&slippageBps={slippage_bps}"
+    response = http_client.get(url, reserve=reserve)
+    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+    return response.json()
+def prefetch_jupiter_swap_quote(from_token_mint, to_token_mint, amount, slippage_bps=50):
+    '''
+    get_jupiter_swap_quote for a prefetch. It spends prefetch_budget, and
+    only Jupiter requests the buy path can spare: it never waits for either.
+    :raises http_client.RateLimited: when either has no request to spare
+    '''
+    if not prefetch_budget.try_acquire():
+        raise http_client.RateLimited("Quote prefetch budget spent")
+    return get_jupiter_swap_quote(from_token_mint, to_token_mint, amount, slippage_bps,
+                                  reserve=QUOTE_PREFETCH_RESERVE)
+def prefetch_quotes(tokenAddress, amounts, on_quote=None):
+    '''
+    Caches SOL -> token quotes for every buy amount, ahead of a possible buy.
+    Stops at the first quote the prefetch budget cannot pay for.
+    :param tokenAddress: str
+    :param amounts: List of amounts in lamports
+    :param on_quote: Callable taking each quote fetched (optional)
+    '''
+    for index, amount in enumerate(amounts):
         try:
-            response = requests.get(
-                f"https://api.dexscreener.com/tokens/v1/{chainId}/{tokenAddress}"
-                # DuypYwg2mr5hD9iPJCxiYSEvA4t9dFFGSU2HmF9vFCWu"
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data
-            # break  # Success, exit the loop
+            quote = quote_cache.prefetch(SOL_MINT, tokenAddress, amount)
+            if on_quote is not None:
+                on_quote(quote)
+        except http_client.RateLimited:
+            metrics.count("quote_prefetch_skipped", len(amounts) - index)
+            return
         except Exception as e:
-            print(f"Attempt {i + 1} failed: {e}")
-            if i < retries - 1:
-                time.sleep(2)  # 2-second delay between retries
-            else:
-                print("Failed after retries.")
+            print(f"Error prefetching quote for {tokenAddress}: {e}")
+def prefetch_candidates(executor, amounts, on_quote=None, max_tokens=QUOTE_PREFETCH_MAX):
+    '''
+    Builds the on_candidate callback of filter_dexscreener_data that runs
+    prefetch_quotes on executor. At most max_tokens candidates are
+    prefetched at once; the ones found while that many are in flight are
+    not prefetched, so a large scan cannot queue quotes that would expire
+    before they are used.
+    :param executor: Executor
+    :param amounts: List of amounts in lamports
+    :param on_quote: Callable taking each quote fetched (optional)
+    :param max_tokens: int
+    :return: Callable(tokenMetadata)
+    '''
+    slots = threading.BoundedSemaphore(max_tokens)
+
+    def on_candidate(tokenMetadata):
+        if not slots.acquire(blocking=False):
+            metrics.count("quote_prefetch_dropped")
+            return
+        future = executor.submit(prefetch_quotes, tokenMetadata['tokenAddress'], amounts, on_quote)
+        future.add_done_callback(lambda _: slots.release())
+    return on_candidate
+def get_pricehistory_batch_dexscreener(tokenAddresses, chainId = "solana", batch_size = DEXSCREENER_MAX_ADDRESSES):
+    '''
+    Get Price History Data for many tokens at once. Addresses are packed into
+    comma separated requests to the multi-address endpoint and the returned
+    pairs are split back per token.
+    :param tokenAddresses: List
+    :param chainId: str
+    :param batch_size: int
+    :return: Dict mapping each token address to its list of TokenSnapshots
+    '''
+    snapshots = {tokenAddress: [] for tokenAddress in tokenAddresses}
+    addresses = list(snapshots)
+    for i in range(0, len(addresses), batch_size):
+        data = get_pricehistory_dexscreener(",".join(addresses[i:i + batch_size]), chainId=chainId)
+        for pair in data or []:
+            # A pair belongs to the requested token on whichever side it is quoted
+            if pair.baseAddress in snapshots:
+                snapshots[pair.baseAddress].append(pair)
+            elif pair.quoteAddress in snapshots:
+                snapshots[pair.quoteAddress].append(pair)
+    price_history.update_many(snapshots)
+    return snapshots
 def check_pool_dexscreener(pool_data,
                            min_liquidity_usd=100000,
                            min_pool_age_days=7,
@@ -130,7 +501,8 @@ def check_pool_dexscreener(pool_data,
     Determines if a token is a safe buy based on its liquidity pool data.
 
     Args:
-        pool_data (list): A list of dictionaries containing pool data from Dex Screener's API.
+        pool_data (list): A list of PoolSnapshots from get_pool_dexscreener, None for incomplete pools.
+            None when the pools could not be fetched.
         min_liquidity_usd (float): The minimum liquidity in USD required for a safe buy.
         min_pool_age_days (int): The minimum age of the pool in days required for a safe buy.
         min_volume_usd (float): The minimum 24-hour volume in USD required for a safe buy.
@@ -143,6 +515,9 @@ def check_pool_dexscreener(pool_data,
     '''
 
 
+    if pool_data is None:
+        return False  # The pools could not be fetched
+
     # Check if there are enough pools
     if len(pool_data) < min_num_pools:
         return False
@@ -150,15 +525,14 @@ def check_pool_dexscreener(pool_data,
     # Check each pool for various criteria
     safe_pools = 0
     for pool in pool_data:
-        if 'liquidity' not in pool or 'pairCreatedAt' not in pool or 'priceChange' not in pool or 'volume' not in pool:
+        if pool is None:
             continue
-        liquidity_usd = pool["liquidity"]["usd"]
-        pool_age_seconds = time.time() - pool["pairCreatedAt"]
+        liquidity_usd = pool.liquidity_usd
+        pool_age_seconds = time.time() - pool.pairCreatedAt
         pool_age_days = pool_age_seconds / (60 * 60 * 24)
-        volume_usd = pool["volume"].get("h24", 0)  # Use 0 if h24 volume is not available
-        price_change_percent = abs(pool["priceChange"].get("h24",
-                                                          0)) * 100  # Use 0 if h24 price change is not available
-        fdv_usd = pool.get("fdv", 0)  # Use 0 if fdv is not available
+        volume_usd = pool.volume_h24  # 0 if h24 volume is not available
+        price_change_percent = abs(pool.price_change_h24) * 100  # 0 if h24 price change is not available
+        fdv_usd = pool.fdv_usd  # 0 if fdv is not available
 
         if (liquidity_usd >= min_liquidity_usd and pool_age_days >= min_pool_age_days and
                 volume_usd >= min_volume_usd and price_change_percent <= max_price_change_percent and
@@ -177,6 +551,7 @@ def check_orderspaid_dexscreener(orders_data,
 
     Args:
         orders_data (list): A list of dictionaries containing paid orders data from Dex Screener's API.
+            None when the orders could not be fetched.
         max_recent_ads (int): The maximum number of recent token ads allowed for a legitimate token.
         max_recent_takeovers (int): The maximum number of recent community takeovers allowed.
         ad_window_hours (int): The time window in hours for considering recent token ads.
@@ -185,6 +560,8 @@ def check_orderspaid_dexscreener(orders_data,
     Returns:
         bool: True if the token is likely legitimate, False otherwise.
     '''
+    if orders_data is None:
+        return False  # The orders could not be fetched
     if not orders_data:
         return True  # No paid orders data, assume legitimate for now
 
@@ -220,7 +597,7 @@ def check_pricehistory_dexscreener(token_data,
         Determines if a token should be bought based on various criteria.
 
         Args:
-            token_data (list): A list of dictionaries containing token data from Dex Screener's API.
+            token_data (list): A list of TokenSnapshots from get_pricehistory_dexscreener.
             min_h1_buy_ratio (float): The minimum ratio of buys to sells in the last hour.
             min_h6_buy_ratio (float): The minimum ratio of buys to sells in the last 6 hours.
             max_m5_price_drop_percent (float): The maximum allowed price drop percentage in the last 5 minutes.
@@ -241,19 +618,19 @@ def check_pricehistory_dexscreener(token_data,
         token = token_data[0]  # Assuming only one token's data is provided
 
         # Check buy/sell ratios
-        if token["txns"]["m5"]["sells"] == 0 or token["txns"]["h1"]["sells"] == 0 or token["txns"]["h6"]["sells"] == 0:
+        if token.m5_sells == 0 or token.h1_sells == 0 or token.h6_sells == 0:
             return False
-        m5_buy_ratio = token["txns"]["m5"]["buys"] / token["txns"]["m5"]["sells"]
-        h1_buy_ratio = token["txns"]["h1"]["buys"] / token["txns"]["h1"]["sells"]
-        h6_buy_ratio = token["txns"]["h6"]["buys"] / token["txns"]["h6"]["sells"]
+        m5_buy_ratio = token.m5_buys / token.m5_sells
+        h1_buy_ratio = token.h1_buys / token.h1_sells
+        h6_buy_ratio = token.h6_buys / token.h6_sells
         if m5_buy_ratio < min_m5_buy_ratio or h1_buy_ratio < min_h1_buy_ratio or h6_buy_ratio < min_h6_buy_ratio:
             return False
 
         # Check recent price drop
-        m5_price_drop_percent = token["priceChange"].get("m5",0)
+        m5_price_drop_percent = token.price_change_m5
         if m5_price_drop_percent < -max_m5_price_drop_percent:
             return False
-        m5_volume = token["volume"].get("m5",0)
+        m5_volume = token.volume_m5
         if m5_volume < min_m5_volume:
             return False
 
@@ -261,66 +638,268 @@ def check_pricehistory_dexscreener(token_data,
 
         # All checks passed, so the token should be bought
         return True
-def checkWalletSize():
-    walletTokenLimit = 5
-    userID = 0
-
-    # Use application default credentials
-    cred = credentials.ApplicationDefault()
-    firebase_admin.initialize_app(cred)
-
-    db = firestore.client()
-    doc_ref = db.collection("user").document(str(userID))
-    data = doc_ref.get().to_dict()
-    walletSize = 5
-    if walletSize <= walletTokenLimit:
+def entry_momentum(tokenAddress):
+    '''
+    :param tokenAddress: str
+    :return: float, the token's momentum over PRICE_MOMENTUM_WINDOW seconds, None while its history is shorter
+    '''
+    history = price_history.get(tokenAddress)
+    return history.momentum if history is not None else None
+def check_entry_trend(tokenAddress, min_momentum=MIN_ENTRY_MOMENTUM):
+    '''
+    Part of the price history test: rejects tokens whose price history shows
+    momentum below min_momentum. Every token passes when min_momentum is
+    -inf; otherwise a token not seen for long enough to have a momentum is
+    undecided, and build_validity_checks hands it to entry_watch.
+    :param tokenAddress: str
+    :param min_momentum: float
+    :return: bool, None when undecided
+    '''
+    if min_momentum == -math.inf:
         return True
-    # get wallet size
-    return False
+    momentum = entry_momentum(tokenAddress)
+    return None if momentum is None else momentum >= min_momentum
+def load_users():
+    '''
+    Users served by this service. USERS holds a JSON list of users
+    ({"user_id", "function_trigger_1", "function_trigger_3"}, the buy and
+    sell functions' URLs) for the shared scanner and USER_SETTINGS a JSON object of strategy settings per user_id,
+    see DEFAULT_USER_SETTINGS and compile_rule_plan.
+    Without USERS the service runs for the single USER_ID.
+    :return: List of Dicts
+    '''
+    users = json.loads(os.environ.get("USERS") or "[]")
+    if not users:
+        users = [{
+            "user_id": os.environ.get("USER_ID"),
+            "function_trigger_1": os.environ.get("FUNCTION_TRIGGER_1"),
+            "function_trigger_3": os.environ.get("FUNCTION_TRIGGER_3"),
+        }]
+    settings = json.loads(os.environ.get("USER_SETTINGS") or "{}")
+    return [dict(DEFAULT_USER_SETTINGS, **user, **settings.get(user["user_id"], {})) for user in users]
+def load_private_key(user):
+    '''
+    A user's wallet key for pipeline mode. Read from the Secret Manager secret
+    version named by the user's "private_key_secret" setting, or from
+    PRIVATE_KEY_BASE58.
+    :param user: Dict
+    :return: str, base58 private key
+    '''
+    secret = user.get("private_key_secret")
+    if not secret:
+        return os.environ.get("PRIVATE_KEY_BASE58", "")
+    client = metrics.lazy_import("google.cloud.secretmanager").SecretManagerServiceClient()
+    # Terraform stores the key base64 encoded (base64encode(var.private_key))
+    return base64.b64decode(client.access_secret_version(name=secret).payload.data).decode()
+def compile_rule_plan(users):
+    '''
+    Compiles the users' rule sets into one RulePlan. A user's "rules" setting
+    maps backtest.py's "<group>.<threshold>" names (e.g.
+    "pool.min_liquidity_usd") to the values that replace the check's
+    defaults, and "required_passes" replaces REQUIRED_PASSES. Users without
+    either share the default rule set.
+    :param users: List of user Dicts from load_users
+    :return: RulePlan
+    :raises ValueError: for a rule naming an unknown test group or threshold
+    '''
+    rule_sets = {rule_set_name(user): user for user in users}
+    return RulePlan(rule_tests(), rule_sets or {DEFAULT_RULE_SET: {}}, REQUIRED_PASSES)
+def rule_tests():
+    '''
+    The tests rules can tune, as RulePlan takes them, with the RULE_THRESHOLDS of each.
+    :return: Dict of test -> (group, Dict of threshold name -> default), in VALIDITY_TESTS order
+    '''
+    return {
+        'pool_test': ('pool', threshold_defaults(check_pool_dexscreener, RULE_THRESHOLDS['pool_test'])),
+        'orders_test': ('orders', threshold_defaults(check_orderspaid_dexscreener, RULE_THRESHOLDS['orders_test'])),
+        'link_test': ('link', {}),
+        'pricehistory_test': ('pricehistory', threshold_defaults(check_pricehistory_dexscreener,
+                                                                 RULE_THRESHOLDS['pricehistory_test'],
+                                                                 min_momentum=MIN_ENTRY_MOMENTUM)),
+    }
+def get_rule_plan():
+    '''
+    Rule plan of the default rule set, for callers that vet tokens without users.
+    '''
+    global _rule_plan
+    if _rule_plan is None:
+        _rule_plan = compile_rule_plan([])
+    return _rule_plan
+def build_entry_metadata(tokenData):
+    '''
+    Entry values of a new position, used as the baseline for its exit conditions.
+    :param tokenData: TokenSnapshot
+    :return: Dict
+    '''
+    return {
+        'priceNative': tokenData.priceNative,
+        'm5_buys': tokenData.m5_buys,
+        'm5_buysell_ratio': tokenData.m5_buys / tokenData.m5_sells,
+        'm5_volume': tokenData.volume_m5,
+        'm5_priceChange': tokenData.price_change_m5,
+    }
+def fan_out_tokens(valid_tokens, snapshots, users, trigger_buy):
+    '''
+    Hands one scan's valid tokens to every user. Each user buys the tokens
+    that passed their required tests while their wallet has room. No market
+    data is fetched here, so extra users add no Dex Screener requests.
+    Wallet room is checked and reserved in one step through wallet_state,
+    which also keeps a user from buying a token they hold or are buying;
+    trigger_buy hands the position to the monitor once the buy confirms.
+    Tokens whose snapshot gives no entry values (no pairs, or no m5 sells
+    for the buy/sell ratio) are skipped.
+    :param valid_tokens: List of (token, verdicts) tuples from filter_dexscreener_data
+    :param snapshots: Dict of price history data per token address
+    :param users: List of user Dicts from load_users
+    :param trigger_buy: Callable(user, tokenAddress, tokenMetadata)
+    :return: List of (user_id, tokenAddress) buys triggered
+    '''
+    entries = {}  # tokenAddress -> entry values, None when the snapshot has none
+    buys = []
+    for user in users:
+        user_id = user['user_id']
+        rule_set = rule_set_name(user)
+        for token, verdicts in valid_tokens:
+            tokenAddress = token['tokenAddress']
+            passed_tests = verdicts.get(rule_set)
+            if passed_tests is None or not set(user['required_tests']) <= set(passed_tests):
+                continue
+            if tokenAddress not in entries:
+                pairs = snapshots.get(tokenAddress)
+                entries[tokenAddress] = build_entry_metadata(pairs[0]) if pairs and pairs[0].m5_sells else None
+                if entries[tokenAddress] is None:
+                    print(f"Skipping {tokenAddress}: its snapshot has no entry values")
+            if entries[tokenAddress] is None:
+                continue
+            with metrics.timer("wallet_check"):
+                reserved = wallet_state.try_buy(user_id, tokenAddress, user['wallet_limit'], entries[tokenAddress])
+            if not reserved:
+                continue
+            try:
+                trigger_buy(user, tokenAddress, entries[tokenAddress])
+            except Exception:
+                wallet_state.record_sell(user_id, tokenAddress)
+                raise
+            buys.append((user_id, tokenAddress))
+    return buys
+def restore_positions(monitor):
+    '''
+    Hands the positions wallet_state loaded back to the monitor, e.g. after a
+    restart. Holdings stored without entry values take the token's current
+    snapshot as their baseline; tokens without one cannot be watched and are
+    left out.
+    :param monitor: PositionMonitor
+    :return: int, number of positions restored
+    '''
+    positions = wallet_state.positions()
+    missing = list(dict.fromkeys(tokenAddress for _, tokenAddress, tokenMetadata in positions if tokenMetadata is None))
+    snapshots = get_pricehistory_batch_dexscreener(missing) if missing else {}
+    restored = 0
+    for user_id, tokenAddress, tokenMetadata in positions:
+        if tokenMetadata is None:
+            pairs = snapshots.get(tokenAddress)
+            if not pairs or not pairs[0].m5_sells:
+                print(f"Cannot restore {tokenAddress} for user: {user_id}, its snapshot has no entry values")
+                continue
+            tokenMetadata = build_entry_metadata(pairs[0])
+            wallet_state.record_entry(user_id, tokenAddress, tokenMetadata)
+        monitor.add_position(tokenAddress, tokenMetadata, user_id=user_id)
+        restored += 1
+    return restored
 def main():
-    project_id = os.environ.get("PROJECT_ID")
-    region = os.environ.get("REGION")
-    function_trigger_1 = os.environ.get("FUNCTION_TRIGGER_1")
-    user_id = os.environ.get("USER_ID")
-
-    while True:
+    users = load_users()
+    users_by_id = {user['user_id']: user for user in users}
+    # Every user's rule set, evaluated in one pass per token
+    plan = compile_rule_plan(users)
+
+    def invoke_function(function_url, position):
+        with metrics.timer("invoke_function"):
+            return http_client.invoke_function(function_url, position.to_json())
+
+    wallet_state.load(list(users_by_id))
+    wallet_state.start()
+
+    if CAPTURE_PATH:
+        # Record every Dex Screener and Jupiter response for backtest.py
+        http_client.client.on_response = CaptureWriter(CAPTURE_PATH).record_response
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    profiler = metrics.start_profiler()
+
+    on_candidate = None
+    # In function mode trigger_function_1 fetches its own quote, so prefetching here would only cost requests
+    prefetch = QUOTE_PREFETCH and PIPELINE_MODE
+    if QUOTE_PREFETCH and not PIPELINE_MODE:
+        print("QUOTE_PREFETCH is ignored without PIPELINE_MODE=1: the buys run in trigger_function_1")
+    if prefetch:
+        prefetch_pool = ThreadPoolExecutor(max_workers=QUOTE_PREFETCH_MAX)
+        amounts = sorted({int(user['amount_in_sol'] * 10**9) for user in users})
+        # The fee estimates of the quoted pools are sampled before the buy bids on them
+        watch_pools = lambda quote: swap_executor.executor.fees.watch(*swap_executor.pool_accounts(quote))
+        on_candidate = prefetch_candidates(prefetch_pool, amounts, on_quote=watch_pools)
+
+    if PIPELINE_MODE:
+        # Buy, monitor and sell run as in-process stages fed by queues, with no function hops
+        # The Solana SDK is only loaded in pipeline mode, and warmed up while the first scan runs
+        swap_executor = metrics.lazy_import("swap_executor")
+        swap_executor.executor.quotes = quote_cache
+        # This process lives on, so the fees of the pools it quotes are kept fresh in the background
+        swap_executor.executor.fees.start()
+        swap_executor.executor.warm()
+        Pipeline = metrics.lazy_import("pipeline").Pipeline
+        pipeline = Pipeline(get_pricehistory_batch_dexscreener, wallet_state,
+                            {user['user_id']: load_private_key(user) for user in users},
+                            buy_workers=BUY_WORKERS, monitor_interval=MONITOR_INTERVAL,
+                            price_history=price_history, trailing_stop=TRAILING_STOP)
+        pipeline.start()
+        monitor, trigger_buy = pipeline.monitor, pipeline.enqueue_buy
+    else:
+        # One monitor watches every open position, replacing a trigger_function_2 instance per token
+        dispatch = FunctionDispatch(get_pricehistory_batch_dexscreener, wallet_state, invoke_function, users_by_id,
+                                    workers=BUY_WORKERS, monitor_interval=MONITOR_INTERVAL,
+                                    price_history=price_history, trailing_stop=TRAILING_STOP)
+        dispatch.start()
+        monitor, trigger_buy = dispatch.monitor, dispatch.trigger_buy
+    print(f"Restored {restore_positions(monitor)} open positions")
+
+    def revet(profiles, snapshots):
+        # Tokens entry_watch sampled until their momentum was known, bought at their latest snapshot
+        fan_out_tokens(filter_dexscreener_data(profiles, snapshots=snapshots, plan=plan), snapshots, users,
+                       trigger_buy)
+
+    entry_watch.vet = revet
+    entry_watch.start()
+
+    # Only profiles not seen before (or changed since) are vetted, as soon as they are listed
+    intake = ProfileIntake(get_latest_tokens_dexscreener, min_interval=INTAKE_MIN_INTERVAL,
+                           max_interval=INTAKE_MAX_INTERVAL)
+    for api_data in intake.stream():
+        metrics.cold_start(service="start-service")
         try:
-            # Fetch API data (token List)
-            api_data = get_latest_tokens_dexscreener()
-            # Filter API data
-            valid_tokens = filter_dexscreener_data(api_data)
-            # Loop through each valid token and purchase if wallet not full
-            for token in valid_tokens:
-                valid_token_dict = dict()
-                # Trigger condition
-                if token[0]['tokenAddress'] not in valid_token_dict and checkWalletSize():
-                    valid_token_dict[token[0]['tokenAddress']] = dict()
-                    tokenData = get_pricehistory_dexscreener(token[0]['tokenAddress'])[0]
-                    valid_token_dict[token[0]['tokenAddress']]['priceNative'] = float(tokenData['priceNative'])
-                    valid_token_dict[token[0]['tokenAddress']]['m5_buys'] = tokenData['txns']['m5']['buys']
-                    valid_token_dict[token[0]['tokenAddress']]['m5_buysell_ratio'] = tokenData['txns']['m5'][
-                                                                                         'buys'] / \
-                                                                                     tokenData['txns']['m5'][
-                                                                                         'sells']
-                    valid_token_dict[token[0]['tokenAddress']]['m5_volume'] = tokenData['volume']['m5']
-                    valid_token_dict[token[0]['tokenAddress']]['m5_priceChange'] = tokenData['priceChange']
-
-                    # ts.purchase_token(token[0]['tokenAddress'])
-                    print(f"Trigger condition met for user: {user_id}")
-                    client = functions_v2.FunctionServiceClient()
-                    request = functions_v2.InvokeFunctionRequest(
-                        name=f"projects/{project_id}/locations/{region}/functions/{function_trigger_1}")
-                    response = client.invoke_function(request=request)
-                    print(f"Function {function_trigger_1} triggered for user: {user_id}")
-                    # += 1 wallet size
-
-            else:
-              print(f"Trigger condition not met for user: {user_id}")
+            # Fetch the new tokens' price snapshots in one batch
+            snapshots = get_pricehistory_batch_dexscreener(
+                [token['tokenAddress'] for token in api_data if token['chainId'] == "solana"])
+            # Filter API data once, then purchase for every user whose wallet is not full
+            valid_tokens = filter_dexscreener_data(api_data, snapshots=snapshots, on_candidate=on_candidate,
+                                                   plan=plan)
+            buys = fan_out_tokens(valid_tokens, snapshots, users, trigger_buy)
+            if not buys:
+                print(f"Trigger condition not met for users: {list(users_by_id)}")
+            print(f"Profile intake: {intake.stats()}")
+            print(f"Response cache: {response_cache.stats()}")
+            print(f"Price history: {price_history.stats()}")
+            print(f"Entry watch: {entry_watch.stats()}")
+            print(f"Rule plan: {plan.stats()}")
+            if prefetch:
+                print(f"Quote cache: {quote_cache.stats()}")
+            if PIPELINE_MODE:
+                print(f"Swaps: {swap_executor.executor.stats()}")
+            metrics.log_snapshot(service="start-service")
+            if profiler is not None:
+                profiler.log_report()
 
         except Exception as e:
-            print(f"Error in start-service for user: {user_id}: {e}")
-
-        time.sleep(300) # 5 minutes (300 seconds)
+            print(f"Error in start-service for users: {list(users_by_id)}: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
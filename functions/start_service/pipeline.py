@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+import metrics
+from position_monitor import PositionMonitor
+from position_record import PositionRecord
+from swap_executor import buy_position, sell_landed, sell_positions
+
+
+class Pipeline:
+    '''
+    Buy, monitor and sell stages running in the scanner's own process.
+    The scan hands positions to enqueue_buy, buy workers send the swaps
+    through the shared swap executor and hand the positions whose buy
+    confirmed to the PositionMonitor, which hands exits to enqueue_sell, and
+    a sell worker sells them, several per user at once. A wallet slot is
+    freed once its buy fails or its sell confirms.
+    Stages are connected by queues of PositionRecords, so no stage waits on
+    a function invocation or a cold start.
+    '''
+    def __init__(self, fetch_snapshots, wallet_state, private_keys, buy_workers=4, monitor_interval=10,
+                 price_history=None, trailing_stop=0):
+        '''
+        :param fetch_snapshots: Callable taking a list of token addresses, see PositionMonitor
+        :param wallet_state: WalletState, released when a buy fails or a sell confirms
+        :param private_keys: Dict of user_id -> base58 private key
+        :param buy_workers: int, buys sent and awaiting confirmation at the same time
+        :param monitor_interval: float, seconds between open position checks
+        :param price_history: PriceHistoryStore, see PositionMonitor
+        :param trailing_stop: float, see PositionMonitor
+        '''
+        self.wallet_state = wallet_state
+        self.private_keys = private_keys
+        self.buy_workers = buy_workers
+        self.monitor = PositionMonitor(fetch_snapshots, self.enqueue_sell, interval=monitor_interval,
+                                       price_history=price_history, trailing_stop=trailing_stop)
+        self.buy_queue = queue.Queue()  # (enqueued_at, PositionRecord)
+        self.sell_queue = queue.Queue()
+        self._threads = []
+
+    def enqueue_buy(self, user, tokenAddress, tokenMetadata):
+        '''
+        Scan stage output, with the trigger_buy signature fan_out_tokens expects.
+        '''
+        position = PositionRecord(user['user_id'], tokenAddress, tokenMetadata, amount_in_sol=user['amount_in_sol'])
+        self.buy_queue.put((time.perf_counter(), position))
+
+    def enqueue_sell(self, tokenAddress, tokenMetadata, tokenLiveData, user_id):
+        '''
+        Monitor stage output, with the dispatch_sell signature PositionMonitor expects.
+        '''
+        position = PositionRecord(user_id, tokenAddress, tokenMetadata, tokenLiveData=tokenLiveData)
+        self.sell_queue.put((time.perf_counter(), position))
+
+    def buy_worker(self):
+        while True:
+            item = self.buy_queue.get()
+            if item is None:
+                return
+            enqueued_at, position = item
+            metrics.observe("pipeline_buy_wait", time.perf_counter() - enqueued_at)
+            try:
+                with metrics.timer("pipeline_buy"):
+                    result = buy_position(position, self.private_keys[position.user_id], confirm=True)
+            except Exception as e:
+                result = {"outcome": str(e)}
+            if result["outcome"] == "confirmed":
+                print(f"Bought {position.tokenAddress} for user: {position.user_id}: "
+                      f"https://explorer.solana.com/tx/{result['signature']}")
+                # Only a position that landed is watched for its exit
+                self.monitor.add_position(position.tokenAddress, position.tokenMetadata, user_id=position.user_id)
+            else:
+                print(f"Error buying {position.tokenAddress} for user: {position.user_id}: {result['outcome']}")
+                # Release the wallet slot of a position that was never opened
+                self.wallet_state.record_sell(position.user_id, position.tokenAddress)
+
+    def sell_worker(self):
+        while True:
+            item = self.sell_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # Exits found by the same monitor tick are sold together
+            while True:
+                try:
+                    item = self.sell_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.sell_queue.put(None)
+                    break
+                batch.append(item)
+            by_user = {}
+            for enqueued_at, position in batch:
+                metrics.observe("pipeline_sell_wait", time.perf_counter() - enqueued_at)
+                by_user.setdefault(position.user_id, []).append(position)
+            for user_id, positions in by_user.items():
+                self.sell(user_id, positions)
+
+    def sell(self, user_id, positions):
+        try:
+            with metrics.timer("pipeline_sell"):
+                results = sell_positions(positions, self.private_keys[user_id], confirm=True)
+        except Exception as e:
+            results = {position.tokenAddress: {"error": str(e)} for position in positions}
+        for position in positions:
+            result = results[position.tokenAddress]
+            if sell_landed(result):
+                self.wallet_state.record_sell(user_id, position.tokenAddress)
+                print(f"Sold {position.tokenAddress} for user: {user_id}: {result.get('signature', 'no balance')}")
+            else:
+                print(f"Error selling {position.tokenAddress} for user: {user_id}: "
+                      f"{result.get('error', result.get('outcome'))}")
+                # Watch it again so the next tick retries the exit
+                self.monitor.add_position(position.tokenAddress, position.tokenMetadata, user_id=user_id)
+
+    def start(self):
+        self.monitor.start()
+        for index in range(self.buy_workers):
+            self._threads.append(threading.Thread(target=self.buy_worker, name=f"pipeline-buy-{index}", daemon=True))
+        self._threads.append(threading.Thread(target=self.sell_worker, name="pipeline-sell", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        '''
+        Stops the monitor, then lets the workers finish the queued positions.
+        '''
+        self.monitor.stop()
+        for _ in range(self.buy_workers):
+            self.buy_queue.put(None)
+        self.sell_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,94 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+class ProfileIntake:
+    '''
+    Incremental intake of the Dex Screener token-profiles feed. Each poll is
+    diffed against an index of the profiles already seen, and only new or
+    changed profiles are passed on. The poll interval halves while new
+    listings keep arriving and doubles while the feed is quiet or failing,
+    within [min_interval, max_interval].
+    '''
+    def __init__(self, fetch_profiles, min_interval=5, max_interval=60, max_seen=10000):
+        '''
+        :param fetch_profiles: Callable returning the latest profiles as a list, or an error string
+        :param min_interval: float, shortest wait between polls in seconds
+        :param max_interval: float, longest wait between polls in seconds
+        :param max_seen: int, least recently listed profiles are forgotten past this size
+        '''
+        self.fetch_profiles = fetch_profiles
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_seen = max_seen
+        self.interval = min_interval
+        self._seen = OrderedDict()  # (chainId, tokenAddress) -> profile fingerprint
+        self._stop = threading.Event()
+        self.polls = 0
+        self.yielded = 0
+
+    @staticmethod
+    def fingerprint(profile):
+        return json.dumps(profile, sort_keys=True, separators=(",", ":"))
+
+    def diff(self, profiles):
+        '''
+        Records a poll in the seen index.
+        :param profiles: List of profiles from one poll
+        :return: List of the profiles that are new or changed since they were last seen
+        '''
+        fresh = []
+        for profile in profiles:
+            key = (profile.get('chainId'), profile.get('tokenAddress'))
+            fingerprint = self.fingerprint(profile)
+            if self._seen.get(key) != fingerprint:
+                fresh.append(profile)
+            self._seen.pop(key, None)
+            self._seen[key] = fingerprint
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+        return fresh
+
+    def adjust_interval(self, new_profiles):
+        '''
+        Polls faster after a poll with new listings and slower after an empty or failed one.
+        '''
+        if new_profiles:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 2)
+
+    def poll(self):
+        '''
+        Fetches the feed once.
+        :return: List of new or changed profiles, empty if the fetch failed
+        '''
+        self.polls += 1
+        profiles = self.fetch_profiles()
+        if not isinstance(profiles, list):
+            print(f"Profile intake poll failed: {profiles}")
+            fresh = []
+        else:
+            fresh = self.diff(profiles)
+        self.adjust_interval(len(fresh))
+        self.yielded += len(fresh)
+        return fresh
+
+    def stream(self):
+        '''
+        Generator over the feed. Polls until stop() and yields each non-empty
+        batch of new or changed profiles; the wait before the next poll starts
+        once the consumer hands control back.
+        '''
+        while not self._stop.is_set():
+            fresh = self.poll()
+            if fresh:
+                yield fresh
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"polls": self.polls, "yielded": self.yielded, "seen": len(self._seen), "interval": self.interval}
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    '''
+    In-process cache for API responses, keyed by endpoint and token address.
+    Every endpoint has its own TTL and the least recently used entries are
+    evicted once the cache grows past its memory budget. Safe to share
+    between the vetting threads.
+    '''
+    def __init__(self, ttls, max_bytes=32 * 1024 * 1024, default_ttl=60):
+        '''
+        :param ttls: Dict of TTL in seconds per endpoint
+        :param max_bytes: int, approximate memory budget for cached values
+        :param default_ttl: int, TTL for endpoints missing from ttls
+        '''
+        self.ttls = dict(ttls)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # (endpoint, key) -> (expires_at, size, value)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+
+    def get(self, endpoint, key):
+        '''
+        Looks up a cached value.
+        :param endpoint: str
+        :param key: str
+        :return: (found, value): Tuple
+        '''
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove((endpoint, key))
+                entry = None
+            if entry is None:
+                self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+                return False, None
+            self._entries.move_to_end((endpoint, key))
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+            return True, entry[2]
+
+    def set(self, endpoint, key, value, ttl=None):
+        '''
+        Stores a value, evicting least recently used entries to stay under max_bytes.
+        :param endpoint: str
+        :param key: str
+        :param value: JSON serializable response data, or bytes
+        :param ttl: int, overrides the endpoint's TTL (optional)
+        '''
+        if ttl is None:
+            ttl = self.ttls.get(endpoint, self.default_ttl)
+        size = len(value) if isinstance(value, bytes) else len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((endpoint, key))
+            self._entries[(endpoint, key)] = (time.monotonic() + ttl, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_fetch(self, endpoint, key, fetch):
+        '''
+        Returns the cached value, calling fetch() and caching its result on a miss.
+        Exceptions from fetch() are not cached.
+        :param endpoint: str
+        :param key: str
+        :param fetch: Callable returning the response data
+        :return: Response data
+        '''
+        found, value = self.get(endpoint, key)
+        if found:
+            return value
+        value = fetch()
+        self.set(endpoint, key, value)
+        return value
+
+    def stats(self):
+        '''
+        :return: Dict of hit and miss counters per endpoint, plus size and evictions
+        '''
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._size -= entry[1]
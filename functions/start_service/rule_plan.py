@@ -0,0 +1,214 @@
+import inspect
+import threading
+import time
+import metrics
+
+DEFAULT_RULE_SET = "default"  # Rule set of users without rules of their own
+
+
+def rule_set_name(user):
+    '''
+    :param user: Dict from load_users
+    :return: str, the name of the user's rule set in a RulePlan
+    '''
+    return user['user_id'] if user.get('rules') or user.get('required_passes') is not None else DEFAULT_RULE_SET
+
+
+def threshold_defaults(check, names=None, **extra):
+    '''
+    Thresholds a check function takes, from its keyword arguments after the data.
+    :param check: Function such as check_pool_dexscreener
+    :param names: Iterable of the thresholds to keep, defaults to all of the check's
+    :param extra: Further thresholds and their defaults
+    :return: Dict of threshold name -> default value
+    :raises ValueError: for a name the check does not take
+    '''
+    parameters = list(inspect.signature(check).parameters.values())[1:]
+    defaults = {parameter.name: parameter.default for parameter in parameters}
+    if names is not None:
+        unknown = sorted(set(names) - set(defaults))
+        if unknown:
+            raise ValueError(f"{check.__name__} takes no threshold {', '.join(unknown)}")
+        defaults = {name: defaults[name] for name in names}
+    return dict(defaults, **extra)
+
+
+class Rule:
+    '''
+    One validity test with one set of thresholds. A rule in several users'
+    rule sets is evaluated once per token for all of them. Counts its
+    evaluations, rejections and the time spent in the check.
+    '''
+    __slots__ = ("test", "thresholds", "name", "evaluations", "rejections", "seconds", "_lock")
+
+    def __init__(self, test, thresholds):
+        '''
+        :param test: str, one of VALIDITY_TESTS
+        :param thresholds: Dict of the thresholds that differ from the check's defaults
+        '''
+        self.test = test
+        self.thresholds = dict(thresholds)
+        self.name = test if not thresholds else \
+            f"{test}[{','.join(f'{name}={value}' for name, value in sorted(thresholds.items()))}]"
+        self.evaluations = 0
+        self.rejections = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Rule({self.name!r})"
+
+    def record(self, evaluations, rejections, seconds):
+        with self._lock:
+            self.evaluations += evaluations
+            self.rejections += rejections
+            self.seconds += seconds
+        metrics.observe(f"rule.{self.name}", seconds)
+        metrics.count(f"rule_rejections.{self.name}", rejections)
+
+    def evaluate(self, check):
+        '''
+        :param check: Callable(**thresholds) -> bool
+        :return: bool
+        '''
+        start = time.perf_counter()
+        passed = bool(check(**self.thresholds))
+        self.record(1, not passed, time.perf_counter() - start)
+        return passed
+
+    def stats(self):
+        return {"rule": self.name, "evaluations": self.evaluations, "rejections": self.rejections,
+                "rejection_rate": round(self.rejections / self.evaluations, 3) if self.evaluations else None,
+                "mean_ms": round(self.seconds / self.evaluations * 1000, 4) if self.evaluations else None}
+
+
+class RuleSet:
+    '''
+    One user's rules, one per test, and the number of tests a token must pass.
+    '''
+    __slots__ = ("name", "rules", "required_passes", "max_failures")
+
+    def __init__(self, name, rules, required_passes):
+        self.name = name
+        self.rules = rules  # test -> Rule
+        self.required_passes = required_passes
+        self.max_failures = len(rules) - required_passes
+
+
+class RulePlan:
+    '''
+    Every user's rule set compiled into one plan. Rules with the same test
+    and thresholds are shared between the rule sets, so a scan evaluates
+    each distinct rule once per token and gets every rule set's verdict
+    from that single pass.
+    '''
+    def __init__(self, tests, rule_sets, required_passes):
+        '''
+        :param tests: Dict of test name -> (group, Dict of threshold name -> default), in VALIDITY_TESTS order
+        :param rule_sets: Dict of rule set name -> Dict with "rules", "<group>.<threshold>" -> value
+            as in backtest.py's sweeps, and optionally "required_passes"
+        :param required_passes: int, default number of tests a token must pass
+        :raises ValueError: for a rule naming an unknown test group or threshold
+        '''
+        self.tests = list(tests)
+        groups = {group: test for test, (group, defaults) in tests.items()}
+        self.rules = {}  # (test, thresholds) -> Rule, the distinct rules
+        self.rule_sets = {}
+        for name, settings in rule_sets.items():
+            overrides = {test: {} for test in tests}
+            for key, value in (settings.get('rules') or {}).items():
+                group, _, threshold = key.partition(".")
+                test = groups.get(group)
+                if test is None:
+                    raise ValueError(f"Unknown rule {key!r} in the rule set of {name}, "
+                                     f"the groups are {', '.join(groups)}")
+                if threshold not in tests[test][1]:
+                    raise ValueError(f"Unknown rule {key!r} in the rule set of {name}, "
+                                     f"the {group} thresholds are {', '.join(tests[test][1]) or 'none'}")
+                # A threshold set to its default is the default rule
+                if value != tests[test][1][threshold]:
+                    overrides[test][threshold] = value
+            rules = {test: self._rule(test, thresholds) for test, thresholds in overrides.items()}
+            passes = settings.get('required_passes')
+            self.rule_sets[name] = RuleSet(name, rules, required_passes if passes is None else passes)
+
+    def _rule(self, test, thresholds):
+        key = (test, tuple(sorted(thresholds.items())))
+        if key not in self.rules:
+            self.rules[key] = Rule(test, thresholds)
+        return self.rules[key]
+
+    def rules_for(self, test, rule_sets=None):
+        '''
+        :param test: str
+        :param rule_sets: List of rule set names, defaults to all
+        :return: List of the distinct rules of test in those rule sets
+        '''
+        names = self.rule_sets if rule_sets is None else rule_sets
+        return list(dict.fromkeys(self.rule_sets[name].rules[test] for name in names))
+
+    def evaluation(self):
+        return PlanEvaluation(self)
+
+    def stats(self):
+        '''
+        :return: List of per-rule counters, the rules rejecting most tokens first
+        '''
+        return sorted((rule.stats() for rule in self.rules.values()), key=lambda stats: -stats["rejections"])
+
+
+class PlanEvaluation:
+    '''
+    Verdicts of one token under every rule set of a plan, filled in as its
+    tests run. A rule set stays open while it can still pass, the same
+    early-exit rule is_valid_dexscreener uses for a single rule set.
+    '''
+    def __init__(self, plan):
+        self.plan = plan
+        self.passed = {name: [] for name in plan.rule_sets}
+        self.failed = {name: [] for name in plan.rule_sets}
+
+    def open_sets(self):
+        return [name for name, rule_set in self.plan.rule_sets.items()
+                if len(self.failed[name]) <= rule_set.max_failures]
+
+    def tests_needed(self):
+        '''
+        :return: int, tests any open rule set needs whatever their outcome, 0 once every verdict is decided
+        '''
+        rule_sets = self.plan.rule_sets
+        return max((rule_sets[name].max_failures - len(self.failed[name]) + 1 for name in self.open_sets()),
+                   default=0)
+
+    def run(self, checks):
+        '''
+        Evaluates a group of tests for the rule sets open before any of them
+        ran, each distinct rule once.
+        :param checks: List of (test, check) tuples, check is a Callable(**thresholds) -> bool
+        '''
+        open_sets = self.open_sets()
+        results = {}
+        for test, check in checks:
+            for rule in self.plan.rules_for(test, open_sets):
+                results[rule] = rule.evaluate(check)
+        self.record(open_sets, [test for test, _ in checks], results)
+
+    def record(self, rule_sets, tests, results):
+        '''
+        :param rule_sets: List of rule set names the results apply to
+        :param tests: List of test names
+        :param results: Dict of Rule -> bool
+        '''
+        for name in rule_sets:
+            rules = self.plan.rule_sets[name].rules
+            for test in tests:
+                (self.passed if results[rules[test]] else self.failed)[name].append(test)
+
+    def verdicts(self):
+        '''
+        :return: Dict of rule set name -> (valid, passed_tests)
+        '''
+        order = self.plan.tests.index
+        return {name: (len(self.passed[name]) == rule_set.required_passes,
+                       sorted(self.passed[name], key=order))
+                for name, rule_set in self.plan.rule_sets.items()}
@@ -0,0 +1,232 @@
+import time
+import numpy as np
+from token_snapshot import TXN_WINDOWS
+
+# Per-rule masks returned by the batch scorers, one entry per token
+POOL_RULES = ['num_pools', 'liquidity', 'pool_age', 'volume', 'price_change', 'fdv']
+PRICEHISTORY_RULES = ['has_data', 'sells', 'm5_buy_ratio', 'h1_buy_ratio', 'h6_buy_ratio',
+                      'm5_price_drop', 'm5_volume', 'momentum']
+
+
+def pool_columns(pool_data_list):
+    '''
+    Loads the pools of many tokens into NumPy columns. Incomplete pools
+    (None) are left out, like check_pool_dexscreener does.
+    :param pool_data_list: List of PoolSnapshot lists from get_pool_dexscreener, one per token
+    :return: Dict of column name -> np.ndarray, plus 'num_pools' per token
+    '''
+    num_pools = np.zeros(len(pool_data_list), dtype=np.int64)
+    rows = []
+    for index, pool_data in enumerate(pool_data_list):
+        if not isinstance(pool_data, list):
+            continue
+        num_pools[index] = len(pool_data)
+        for pool in pool_data:
+            if pool is None:
+                continue
+            rows.append((index, pool.liquidity_usd, pool.pairCreatedAt, pool.volume_h24, pool.price_change_h24,
+                         pool.fdv_usd))
+    table = np.array(rows, dtype=np.float64).reshape(-1, 6)
+    return {
+        'num_pools': num_pools,
+        'token_index': table[:, 0].astype(np.int64),
+        'liquidity_usd': table[:, 1],
+        'pair_created_at': table[:, 2],
+        'volume_h24': table[:, 3],
+        'price_change_h24': table[:, 4],
+        'fdv_usd': table[:, 5],
+    }
+
+
+def score_pools_batch(pool_data_list,
+                      min_liquidity_usd=100000,
+                      min_pool_age_days=7,
+                      min_volume_usd=10000,
+                      max_price_change_percent=20,
+                      min_num_pools=2,
+                      max_fdv_usd=1000000,
+                      now=None):
+    '''
+    Vectorized check_pool_dexscreener for many tokens at once. Takes the same
+    thresholds and returns the same verdicts.
+
+    Args:
+        pool_data_list (list): PoolSnapshot lists from get_pool_dexscreener, one per token.
+        now (float): Current unix time, defaults to time.time().
+
+    Returns:
+        tuple: (verdicts, masks). verdicts is a boolean array with one entry per
+        token. masks maps each of POOL_RULES to a boolean array that is True when
+        at least min_num_pools of the token's pools pass that rule on its own.
+    '''
+    return score_pool_columns(pool_columns(pool_data_list), min_liquidity_usd, min_pool_age_days, min_volume_usd,
+                              max_price_change_percent, min_num_pools, max_fdv_usd, now)
+
+
+def score_pool_columns(columns,
+                       min_liquidity_usd=100000,
+                       min_pool_age_days=7,
+                       min_volume_usd=10000,
+                       max_price_change_percent=20,
+                       min_num_pools=2,
+                       max_fdv_usd=1000000,
+                       now=None):
+    '''
+    score_pools_batch over columns already loaded with pool_columns, so the
+    same scan can be scored with many thresholds. now may also be an array
+    with one unix time per pool row.
+    '''
+    count = len(columns['num_pools'])
+    now = time.time() if now is None else now
+    token_index = columns['token_index']
+    pool_masks = {
+        'liquidity': columns['liquidity_usd'] >= min_liquidity_usd,
+        'pool_age': (now - columns['pair_created_at']) / (60 * 60 * 24) >= min_pool_age_days,
+        'volume': columns['volume_h24'] >= min_volume_usd,
+        'price_change': np.abs(columns['price_change_h24']) * 100 <= max_price_change_percent,
+        'fdv': columns['fdv_usd'] <= max_fdv_usd,
+    }
+    safe = np.logical_and.reduce(list(pool_masks.values())) if len(token_index) else np.zeros(0, dtype=bool)
+
+    def enough_pools(pool_mask):
+        counts = np.bincount(token_index, weights=pool_mask, minlength=count)
+        return counts >= min_num_pools
+
+    masks = {'num_pools': columns['num_pools'] >= min_num_pools}
+    masks.update({rule: enough_pools(pool_mask) for rule, pool_mask in pool_masks.items()})
+    verdicts = masks['num_pools'] & enough_pools(safe)
+    return verdicts, masks
+
+
+def pricehistory_columns(token_data_list, momentum=None):
+    '''
+    Loads the first pair of each token's price history into NumPy columns.
+    :param token_data_list: List of TokenSnapshot lists, one per token
+    :param momentum: List of each token's PriceHistory momentum, None where unknown (optional)
+    :return: Dict of column name -> np.ndarray, 'momentum' NaN where unknown
+    '''
+    count = len(token_data_list)
+    has_data = np.zeros(count, dtype=bool)
+    table = np.zeros((count, 8), dtype=np.float64)
+    for index, token_data in enumerate(token_data_list):
+        if not token_data:
+            continue
+        token = token_data[0]
+        try:
+            table[index] = (token.m5_buys, token.m5_sells, token.h1_buys, token.h1_sells, token.h6_buys,
+                            token.h6_sells, token.price_change_m5, token.volume_m5)
+        except (TypeError, ValueError):
+            continue
+        has_data[index] = True
+    columns = {'has_data': has_data, 'price_change_m5': table[:, 6], 'volume_m5': table[:, 7],
+               'momentum': np.full(count, np.nan) if momentum is None else
+               np.array([np.nan if value is None else value for value in momentum], dtype=np.float64)}
+    for offset, window in enumerate(TXN_WINDOWS):
+        columns[f'{window}_buys'] = table[:, 2 * offset]
+        columns[f'{window}_sells'] = table[:, 2 * offset + 1]
+    return columns
+
+
+def score_pricehistory_batch(token_data_list,
+                             min_m5_buy_ratio=0.8,
+                             min_h1_buy_ratio=1.2,
+                             min_h6_buy_ratio=1.1,
+                             max_m5_price_drop_percent=5,
+                             min_m5_volume=500):
+    '''
+    Vectorized check_pricehistory_dexscreener for many tokens at once. Takes
+    the same thresholds and returns the same verdicts.
+
+    Args:
+        token_data_list (list): TokenSnapshot lists from get_pricehistory_dexscreener, one per token.
+
+    Returns:
+        tuple: (verdicts, masks). verdicts is a boolean array with one entry per
+        token, masks maps each of PRICEHISTORY_RULES to a boolean array.
+    '''
+    return score_pricehistory_columns(pricehistory_columns(token_data_list), min_m5_buy_ratio, min_h1_buy_ratio,
+                                      min_h6_buy_ratio, max_m5_price_drop_percent, min_m5_volume)
+
+
+def score_pricehistory_columns(columns,
+                               min_m5_buy_ratio=0.8,
+                               min_h1_buy_ratio=1.2,
+                               min_h6_buy_ratio=1.1,
+                               max_m5_price_drop_percent=5,
+                               min_m5_volume=500,
+                               min_momentum=-np.inf):
+    '''
+    score_pricehistory_batch over columns already loaded with pricehistory_columns.
+    min_momentum is the entry trend gate of check_entry_trend: tokens whose
+    momentum is unknown fail it unless it is -inf, see momentum_pending.
+    '''
+    sells = np.stack([columns[f'{window}_sells'] for window in TXN_WINDOWS])
+    masks = {'has_data': columns['has_data'], 'sells': columns['has_data'] & np.all(sells > 0, axis=0)}
+    min_ratios = {'m5': min_m5_buy_ratio, 'h1': min_h1_buy_ratio, 'h6': min_h6_buy_ratio}
+    for window, min_ratio in min_ratios.items():
+        buys = columns[f'{window}_buys']
+        window_sells = columns[f'{window}_sells']
+        ratio = np.divide(buys, window_sells, out=np.zeros_like(buys), where=window_sells > 0)
+        masks[f'{window}_buy_ratio'] = masks['sells'] & (ratio >= min_ratio)
+    masks['m5_price_drop'] = columns['has_data'] & (columns['price_change_m5'] >= -max_m5_price_drop_percent)
+    masks['m5_volume'] = columns['has_data'] & (columns['volume_m5'] >= min_m5_volume)
+    momentum = columns['momentum']
+    masks['momentum'] = np.isneginf(min_momentum) | (momentum >= min_momentum)
+    verdicts = np.logical_and.reduce([masks[rule] for rule in PRICEHISTORY_RULES])
+    return verdicts, masks
+
+
+def momentum_pending(columns, masks):
+    '''
+    Tokens that fail score_pricehistory_columns only because their momentum
+    is not known yet, the ones the entry watch keeps sampling.
+    :param columns: Dict from pricehistory_columns
+    :param masks: Dict of rule masks from score_pricehistory_columns over these columns
+    :return: np.ndarray of bool, one per token
+    '''
+    others = np.logical_and.reduce([masks[rule] for rule in PRICEHISTORY_RULES if rule != 'momentum'])
+    return others & np.isnan(columns['momentum']) & ~masks['momentum']
+
+
+def orders_columns(orders_data_list, now=None):
+    '''
+    Loads the approved paid orders of many tokens into NumPy columns.
+    :param orders_data_list: List of orders data lists, one per token
+    :param now: float or np.ndarray with one unix time per token, defaults to time.time()
+    :return: Dict of column name -> np.ndarray, plus 'count' tokens
+    '''
+    now = np.broadcast_to(time.time() if now is None else now, (len(orders_data_list),))
+    rows = []
+    for index, orders_data in enumerate(orders_data_list):
+        if not isinstance(orders_data, list):
+            continue
+        for order in orders_data:
+            if "type" not in order or "status" not in order or order["status"] != "approved":
+                continue
+            if order["type"] in ("tokenAd", "communityTakeover"):
+                rows.append((index, order["type"] == "tokenAd", now[index] * 1000 - order["paymentTimestamp"]))
+    table = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    return {
+        'count': len(orders_data_list),
+        'token_index': table[:, 0].astype(np.int64),
+        'is_ad': table[:, 1].astype(bool),
+        'age_ms': table[:, 2],
+    }
+
+
+def score_orders_columns(columns,
+                         max_recent_ads=2,
+                         max_recent_takeovers=1,
+                         ad_window_hours=24,
+                         takeover_window_hours=72):
+    '''
+    Vectorized check_orderspaid_dexscreener over columns loaded with orders_columns.
+    :return: boolean np.ndarray, one verdict per token
+    '''
+    token_index = columns['token_index']
+    is_ad = columns['is_ad']
+    recent_ads = is_ad & (columns['age_ms'] <= ad_window_hours * 60 * 60 * 1000)
+    recent_takeovers = ~is_ad & (columns['age_ms'] <= takeover_window_hours * 60 * 60 * 1000)
+    ads = np.bincount(token_index, weights=recent_ads, minlength=columns['count'])
+    takeovers = np.bincount(token_index, weights=recent_takeovers, minlength=columns['count'])
+    return (ads <= max_recent_ads) & (takeovers <= max_recent_takeovers)
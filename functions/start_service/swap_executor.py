@@ -0,0 +1,345 @@
+#Shared swap executor: start_service, trigger_function_1 and trigger_function_3 ship identical copies of this file, keep them in sync.
+import asyncio
+import base64
+import os
+import threading
+import time
+from collections import deque
+import http_client
+import metrics
+from fee_estimator import MAX_PRIORITY_FEE_LAMPORTS, FeeEstimator
+from quote_cache import QuoteCache
+
+SOLANA_RPC_URL = os.environ.get("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com")
+SKIP_PREFLIGHT = os.environ.get("SKIP_PREFLIGHT", "1") == "1"  # Skip simulation to submit sooner
+JUPITER_QUOTE_URL = "https://api.jup.ag/swap/v1/quote"
+JUPITER_SWAP_URL = "https://api.jup.ag/swap/v1/swap"
+QUOTE_TTL = float(os.environ.get("QUOTE_TTL", 3))  # Seconds a cached quote may be reused
+SOL_MINT = "So11111111111111111111111111111111111111112"
+TOKEN_PROGRAM_IDS = [
+    "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA",  # SPL Token
+    "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb",  # Token-2022
+]
+
+
+@metrics.timed("jupiter_quote")
+def get_jupiter_swap_quote(from_token_mint, to_token_mint, amount, slippage_bps=50):
+    """Gets a swap quote from Jupiter."""
+    url = f"{JUPITER_QUOTE_URL}?inputMint={from_token_mint}&outputMint={to_token_mint}&amount={amount}&slippageBps={slippage_bps}"
+    response = http_client.get(url)
+    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+    return response.json()
+
+
+def get_jupiter_swap_transaction(quote_response, user_public_key, compute_unit_price=None):
+    """Builds the unsigned swap transaction for a quote with the Jupiter swap API.
+    Bids compute_unit_price micro-lamports per compute unit when given, otherwise
+    Jupiter's veryHigh priority level capped at MAX_PRIORITY_FEE_LAMPORTS.
+    Returns the transaction and the block height after which its blockhash expires."""
+    from solders.transaction import VersionedTransaction
+    body = {
+        "quoteResponse": quote_response,  # Include the entire quoteResponse
+        "userPublicKey": str(user_public_key),
+        "wrapUnwrapSOL": True,
+        "dynamicComputeUnitLimit": True,  # Add additional parameters
+        "dynamicSlippage": True,
+    }
+    if compute_unit_price is not None:
+        body["computeUnitPriceMicroLamports"] = compute_unit_price
+    else:
+        body["prioritizationFeeLamports"] = {
+            "priorityLevelWithMaxLamports": {
+                "maxLamports": MAX_PRIORITY_FEE_LAMPORTS,
+                "priorityLevel": "veryHigh"
+            }
+        }
+    response = http_client.post(JUPITER_SWAP_URL, headers={"Content-Type": "application/json"}, json=body)
+    response.raise_for_status()
+    data = response.json()
+    return VersionedTransaction.from_bytes(base64.b64decode(data["swapTransaction"])), data.get("lastValidBlockHeight")
+
+
+def pool_accounts(quote_response):
+    '''
+    The AMM pool accounts of a quote's route. The swap write-locks them, so
+    their local fee markets set the priority fee it competes with; the mint
+    accounts are only read and have no fee market of their own.
+    :return: List of account addresses in route order, without repeats
+    '''
+    return list(dict.fromkeys(step["swapInfo"]["ammKey"] for step in quote_response.get("routePlan") or []
+                              if (step.get("swapInfo") or {}).get("ammKey")))
+
+
+# Quotes reused by the swap path while they are fresh
+quote_cache = QuoteCache(get_jupiter_swap_quote, ttl=QUOTE_TTL)
+
+
+class SwapExecutor:
+    '''
+    Long-lived swap pipeline. Owns one pooled AsyncClient RPC connection on a
+    background event loop, caches each user's decoded keypair and runs quote,
+    build, sign and send as coroutines, so several swaps can be in flight at
+    once. The time spent in every stage is recorded per swap. Quotes come
+    from a QuoteCache, so a fresh prefetched quote skips the quote round trip.
+    Sent transactions are handed to a ConfirmationTracker on the same loop.
+    Each swap bids the priority fee a FeeEstimator estimates for the pools of
+    its route, sampling them first when its cache has no fresh estimate, and
+    reports back to it how the swap landed.
+    The Solana SDK is only imported by start(), so a cold start that has
+    not reached a swap yet does not pay for it.
+    '''
+    def __init__(self, rpc_url=SOLANA_RPC_URL, skip_preflight=SKIP_PREFLIGHT, max_concurrency=8, history=1000,
+                 quotes=None, fees=None):
+        '''
+        :param rpc_url: str
+        :param skip_preflight: bool
+        :param max_concurrency: int, swaps in flight at the same time
+        :param history: int, number of swap timings kept
+        :param quotes: QuoteCache, defaults to the module's quote_cache
+        :param fees: FeeEstimator, defaults to one sampling rpc_url
+        '''
+        self.rpc_url = rpc_url
+        self.quotes = quote_cache if quotes is None else quotes
+        self.fees = FeeEstimator(rpc_url) if fees is None else fees
+        self.skip_preflight = skip_preflight
+        self.opts = None
+        self.max_concurrency = max_concurrency
+        self.timings = deque(maxlen=history)
+        self._keypairs = {}  # user_id -> (private_key_base58, Keypair)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self.confirmations = None
+
+    def start(self):
+        '''
+        Starts the event loop thread and opens the RPC connection, once.
+        '''
+        with self._lock:
+            if self._loop is not None:
+                return
+            # The Solana SDK is loaded here, by the first swap or by warm(), instead of at import
+            metrics.lazy_import("solana.rpc.async_api")
+            from solana.rpc.commitment import Processed
+            from solana.rpc.types import TxOpts
+            self.opts = TxOpts(skip_preflight=self.skip_preflight, preflight_commitment=Processed)
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="swap-executor", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            self._loop = loop
+
+    def warm(self, user_id=None, private_key_base58=None):
+        '''
+        Starts the executor from a background thread, so importing the Solana
+        SDK and opening the RPC connection overlap the rest of a cold start
+        and the first quote, and decodes the user's keypair ahead of the first
+        swap. Callers of run() wait for the warm-up to finish.
+        :param user_id: str (optional)
+        :param private_key_base58: str (optional)
+        '''
+        def warm_up():
+            try:
+                self.start()
+                if private_key_base58:
+                    self.keypair_for(user_id, private_key_base58)
+            except Exception as e:
+                print(f"Swap executor warm-up failed: {e}")
+        threading.Thread(target=warm_up, name="swap-executor-warm", daemon=True).start()
+
+    async def _open(self):
+        from solana.rpc.async_api import AsyncClient
+        from confirmation_tracker import ConfirmationTracker
+        self._client = AsyncClient(self.rpc_url)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.confirmations = ConfirmationTracker(self._client, on_resolved=self.fees.record_landing)
+        asyncio.ensure_future(self.confirmations.run())
+
+    def run(self, coro):
+        '''
+        Runs a coroutine on the executor's loop and waits for its result.
+        '''
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def keypair_for(self, user_id, private_key_base58):
+        '''
+        Returns the user's keypair, decoding the base58 key only the first time.
+        '''
+        from solders.keypair import Keypair
+        with self._lock:
+            cached = self._keypairs.get(user_id)
+            if cached is None or cached[0] != private_key_base58:
+                cached = (private_key_base58, Keypair.from_base58_string(private_key_base58))
+                self._keypairs[user_id] = cached
+            return cached[1]
+
+    async def execute(self, user_id, private_key_base58, quote_response, timings=None, confirm=False):
+        '''
+        Builds, signs and sends the swap transaction for a quote, bidding the
+        priority fee estimate of the pools it swaps through, timed as 'fee'.
+        :param confirm: bool, wait until the confirmation tracker resolves the transaction
+        :return: Dict with the transaction 'signature', the 'compute_unit_price' bid (None for
+            Jupiter's priority level) and the stage 'timings' in seconds, plus its 'outcome'
+            ("confirmed", "failed" or "expired") and the 'confirm' timing, left out of the
+            'total', when confirm is set
+        '''
+        from solders.message import to_bytes_versioned
+        from solders.transaction import VersionedTransaction
+        timings = {} if timings is None else timings
+        keypair_ = self.keypair_for(user_id, private_key_base58)
+        pools = pool_accounts(quote_response)
+        start = time.perf_counter()
+        compute_unit_price = await asyncio.to_thread(self.fees.estimate, *pools)
+        timings["fee"] = time.perf_counter() - start
+        async with self._semaphore:
+            start = time.perf_counter()
+            tx, last_valid_block_height = await asyncio.to_thread(
+                get_jupiter_swap_transaction, quote_response, keypair_.pubkey(), compute_unit_price)
+            timings["build"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            signature = keypair_.sign_message(to_bytes_versioned(tx.message))
+            signed_tx = VersionedTransaction.populate(tx.message, [signature])
+            timings["sign"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            sent_tx = await self._client.send_raw_transaction(bytes(signed_tx), opts=self.opts)
+            timings["send"] = time.perf_counter() - start
+        confirmation = self.confirmations.track(sent_tx.value, bytes(signed_tx), last_valid_block_height,
+                                                compute_unit_price=compute_unit_price)
+        timings["total"] = sum(timings.values())
+        self.timings.append(timings)
+        for stage, seconds in timings.items():
+            metrics.observe(f"swap_{stage}", seconds)
+        result = {"signature": str(sent_tx.value), "compute_unit_price": compute_unit_price, "timings": timings}
+        if confirm:
+            start = time.perf_counter()
+            result["outcome"] = await confirmation
+            timings["confirm"] = time.perf_counter() - start
+            metrics.observe("swap_confirm", timings["confirm"])
+        return result
+
+    async def swap(self, user_id, private_key_base58, from_token_mint, to_token_mint, amount, slippage_bps=50,
+                   confirm=False):
+        '''
+        Quotes and executes one swap, reusing a fresh cached quote when there is one.
+        :return: Dict with the transaction 'signature' and the stage 'timings' in seconds, see execute
+        '''
+        start = time.perf_counter()
+        quote = await asyncio.to_thread(self.quotes.get, from_token_mint, to_token_mint, amount, slippage_bps)
+        timings = {"quote": time.perf_counter() - start}
+        return await self.execute(user_id, private_key_base58, quote, timings=timings, confirm=confirm)
+
+    async def get_token_balances(self, owner):
+        '''
+        Reads every token balance of a wallet with one parsed owner-wide query
+        per token program, run at the same time.
+        :param owner: Pubkey
+        :return: Dict of mint address -> raw amount
+        '''
+        from solana.rpc.types import TokenAccountOpts
+        from solders.pubkey import Pubkey
+        responses = await asyncio.gather(*(
+            self._client.get_token_accounts_by_owner_json_parsed(owner, TokenAccountOpts(
+                program_id=Pubkey.from_string(program_id)))
+            for program_id in TOKEN_PROGRAM_IDS))
+        balances = {}
+        for response in responses:
+            for account in response.value:
+                info = account.account.data.parsed["info"]
+                balances[info["mint"]] = balances.get(info["mint"], 0) + int(info["tokenAmount"]["amount"])
+        return balances
+
+    async def sell_many(self, user_id, private_key_base58, token_mints, to_token_mint=SOL_MINT, slippage_bps=50,
+                        confirm=False):
+        '''
+        Sells the whole balance of several tokens at once: one balance lookup
+        for the wallet, then the quotes and sends of all sells run concurrently.
+        :param token_mints: List of mint addresses to sell
+        :param confirm: bool, wait for every sell's outcome, see execute
+        :return: Dict of mint address -> swap() result, or {"error": str}
+        '''
+        owner = self.keypair_for(user_id, private_key_base58).pubkey()
+        balances = await self.get_token_balances(owner)
+        results = {str(mint): {"error": "no balance"} for mint in token_mints}
+        to_sell = [mint for mint in results if balances.get(mint, 0) > 0]
+        swaps = await asyncio.gather(*(
+            self.swap(user_id, private_key_base58, mint, to_token_mint, balances[mint], slippage_bps, confirm=confirm)
+            for mint in to_sell), return_exceptions=True)
+        for mint, result in zip(to_sell, swaps):
+            results[mint] = {"error": str(result)} if isinstance(result, Exception) else result
+        return results
+
+    def stats(self):
+        '''
+        :return: Dict with the confirmation tracker's outcome counters and time-to-confirm
+            percentiles, and the fee estimator's stats with the landing rate of each fee level,
+            empty before the executor has started
+        '''
+        if self.confirmations is None:
+            return {}
+        return {"confirmations": self.confirmations.stats(), "priority_fees": self.fees.stats()}
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self.confirmations.stop)
+            self.fees.stop()
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# Module level so the connection and keypairs survive warm invocations
+executor = SwapExecutor()
+
+
+def buy_position(position, private_key_base58, confirm=False):
+    '''
+    Buy stage: spends the position's amount_in_sol on its token and records
+    the transaction on the position. Used by trigger_function_1 and by
+    start_service's pipeline mode.
+    :param position: PositionRecord
+    :param private_key_base58: str
+    :param confirm: bool, wait for the buy's outcome, see SwapExecutor.execute
+    :return: Dict with the transaction 'signature' and the stage 'timings' in seconds
+    '''
+    amount_in_lamports = int(position.amount_in_sol * 10**9)
+    # The quote only needs HTTP, so on a cold start it is fetched while warm() is still loading the SDK
+    start = time.perf_counter()
+    quote = executor.quotes.get(SOL_MINT, position.tokenAddress, amount_in_lamports)
+    timings = {"quote": time.perf_counter() - start}
+    result = executor.run(executor.execute(position.user_id, private_key_base58, quote, timings=timings,
+                                           confirm=confirm))
+    position.buy_signature = result["signature"]
+    position.bought_at = time.time()
+    return result
+
+
+def sell_landed(result):
+    '''
+    Whether a confirmed sell_positions result leaves the wallet without the
+    token: the sell confirmed, or there was no balance left to sell.
+    :param result: Dict, one token's result from sell_positions(confirm=True)
+    :return: bool
+    '''
+    return result.get("outcome") == "confirmed" or result.get("error") == "no balance"
+
+
+def sell_positions(positions, private_key_base58, confirm=False):
+    '''
+    Sell stage: sells the whole balance of one user's positions at once and
+    records each transaction on its position. Used by trigger_function_3 and
+    by start_service's pipeline mode.
+    :param positions: List of PositionRecords of the same user
+    :param private_key_base58: str
+    :param confirm: bool, wait for every sell's outcome, see SwapExecutor.execute
+    :return: Dict of mint address -> swap result or {"error": str}
+    '''
+    results = executor.run(executor.sell_many(positions[0].user_id, private_key_base58,
+                                              [position.tokenAddress for position in positions], confirm=confirm))
+    for position in positions:
+        position.sell_signature = results[position.tokenAddress].get("signature")
+    return results
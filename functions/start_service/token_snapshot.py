@@ -0,0 +1,162 @@
+#Shared token snapshots: start_service and trigger_function_2 ship identical copies of this file, keep them in sync.
+import json
+import math
+import struct
+
+TXN_WINDOWS = ('m5', 'h1', 'h6')
+POOL_FIELDS = ('liquidity', 'pairCreatedAt', 'priceChange', 'volume')
+_POOL = struct.Struct("<5d")  # One complete pool, a row of NaN for an incomplete one
+_POOL_COUNT = struct.Struct("<I")
+
+
+def _load(body):
+    '''
+    :param body: bytes or str of JSON, or data already parsed
+    '''
+    return json.loads(body) if isinstance(body, (bytes, bytearray, str)) else body
+
+
+class TokenSnapshot:
+    '''
+    The fields of one Dex Screener pair that the price history check, the
+    entry values and the exit rule read, about a tenth of the pair's JSON.
+    '''
+    __slots__ = ("baseAddress", "quoteAddress", "priceNative", "m5_buys", "m5_sells", "h1_buys", "h1_sells",
+                 "h6_buys", "h6_sells", "price_change_m5", "volume_m5")
+
+    def __init__(self, baseAddress, quoteAddress, priceNative, m5_buys, m5_sells, h1_buys, h1_sells,
+                 h6_buys, h6_sells, price_change_m5=0, volume_m5=0):
+        self.baseAddress = baseAddress
+        self.quoteAddress = quoteAddress
+        self.priceNative = priceNative
+        self.m5_buys = m5_buys
+        self.m5_sells = m5_sells
+        self.h1_buys = h1_buys
+        self.h1_sells = h1_sells
+        self.h6_buys = h6_buys
+        self.h6_sells = h6_sells
+        self.price_change_m5 = price_change_m5
+        self.volume_m5 = volume_m5
+
+    def __repr__(self):
+        return f"TokenSnapshot(baseAddress={self.baseAddress!r}, priceNative={self.priceNative!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, TokenSnapshot) and self.to_dict() == other.to_dict()
+
+    @classmethod
+    def from_pair(cls, pair):
+        '''
+        :param pair: Dict, one pair from Dex Screener's API
+        :return: TokenSnapshot
+        :raises KeyError, TypeError, ValueError: when the pair has no price or transaction counts
+        '''
+        txns = pair['txns']
+        m5, h1, h6 = txns['m5'], txns['h1'], txns['h6']
+        return cls((pair.get('baseToken') or {}).get('address'), (pair.get('quoteToken') or {}).get('address'),
+                   float(pair['priceNative']), m5['buys'], m5['sells'], h1['buys'], h1['sells'],
+                   h6['buys'], h6['sells'], (pair.get('priceChange') or {}).get('m5', 0),
+                   (pair.get('volume') or {}).get('m5', 0))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+class PoolSnapshot:
+    '''
+    The fields of one Dex Screener pool that the pool check reads.
+    '''
+    __slots__ = ("liquidity_usd", "pairCreatedAt", "volume_h24", "price_change_h24", "fdv_usd")
+
+    def __init__(self, liquidity_usd, pairCreatedAt, volume_h24=0, price_change_h24=0, fdv_usd=0):
+        self.liquidity_usd = liquidity_usd
+        self.pairCreatedAt = pairCreatedAt
+        self.volume_h24 = volume_h24
+        self.price_change_h24 = price_change_h24
+        self.fdv_usd = fdv_usd
+
+    def __repr__(self):
+        return f"PoolSnapshot(liquidity_usd={self.liquidity_usd!r}, pairCreatedAt={self.pairCreatedAt!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, PoolSnapshot) and self.to_dict() == other.to_dict()
+
+    @classmethod
+    def from_pool(cls, pool):
+        '''
+        :param pool: Dict, one pool from Dex Screener's API
+        :return: PoolSnapshot, None when the pool lacks one of POOL_FIELDS, like check_pool_dexscreener skips it
+        '''
+        if any(field not in pool for field in POOL_FIELDS):
+            return None
+        return cls(float(pool['liquidity'].get('usd', math.nan)), float(pool['pairCreatedAt']),
+                   float(pool['volume'].get('h24', 0)), float(pool['priceChange'].get('h24', 0)),
+                   float(pool.get('fdv', 0)))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def decode_pairs(body):
+    '''
+    Decodes a /tokens/v1 response into TokenSnapshots, dropping the rest of
+    each pair as soon as it is parsed. Pairs without a price or transaction
+    counts are left out.
+    :param body: bytes or str of JSON, or data already parsed
+    :return: List of TokenSnapshot
+    '''
+    snapshots = []
+    data = _load(body)
+    for pair in data if isinstance(data, list) else []:
+        try:
+            snapshots.append(TokenSnapshot.from_pair(pair))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return snapshots
+
+
+def decode_pools(body):
+    '''
+    Decodes a /token-pairs/v1 response into PoolSnapshots. Incomplete pools
+    stay in the list as None, because they still count towards the number
+    of pools.
+    :param body: bytes or str of JSON, or data already parsed
+    :return: List of PoolSnapshot or None
+    '''
+    data = _load(body)
+    pools = []
+    for pool in data if isinstance(data, list) else []:
+        try:
+            pools.append(PoolSnapshot.from_pool(pool))
+        except (TypeError, ValueError, AttributeError):
+            pools.append(None)
+    return pools
+
+
+def pack_pools(pools):
+    '''
+    :param pools: List of PoolSnapshot or None, from decode_pools
+    :return: bytes, a count and 40 bytes per pool
+    '''
+    rows = [(math.nan,) * 5 if pool is None else
+            (pool.liquidity_usd, pool.pairCreatedAt, pool.volume_h24, pool.price_change_h24, pool.fdv_usd)
+            for pool in pools]
+    return _POOL_COUNT.pack(len(rows)) + b"".join(_POOL.pack(*row) for row in rows)
+
+
+def unpack_pools(data):
+    '''
+    Inverse of pack_pools.
+    :param data: bytes
+    :return: List of PoolSnapshot or None
+    '''
+    count, = _POOL_COUNT.unpack_from(data)
+    pools = []
+    for row in _POOL.iter_unpack(data[_POOL_COUNT.size:_POOL_COUNT.size + count * _POOL.size]):
+        # An incomplete pool is a row of NaN; a complete one always has its creation time
+        pools.append(None if math.isnan(row[1]) else PoolSnapshot(*row))
+    return pools
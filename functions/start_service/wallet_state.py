@@ -0,0 +1,213 @@
+import threading
+from abc import ABC, abstractmethod
+import metrics
+
+
+class WalletStore(ABC):
+    '''
+    Storage backend for WalletState. A user's state is a dict with the
+    tokens they hold, their count and the entry values of each position.
+    '''
+    @abstractmethod
+    def load(self, user_ids):
+        '''
+        :param user_ids: List
+        :return: Dict of user_id -> state Dict, users without stored state are left out
+        '''
+
+    @abstractmethod
+    def save(self, states):
+        '''
+        Writes many users' states in one batch.
+        :param states: Dict of user_id -> state Dict
+        '''
+
+
+class MemoryWalletStore(WalletStore):
+    '''
+    Local backend that keeps states in a dict, for the tests and local runs.
+    '''
+    def __init__(self, states=None):
+        self.states = dict(states or {})
+        self.saves = 0
+
+    def load(self, user_ids):
+        return {user_id: dict(self.states[user_id]) for user_id in user_ids if user_id in self.states}
+
+    def save(self, states):
+        self.saves += 1
+        self.states.update({user_id: dict(state) for user_id, state in states.items()})
+
+
+class FirestoreWalletStore(WalletStore):
+    '''
+    Keeps each user's state in the "user" collection, one document per user.
+    The Firebase SDK is imported and the app and client are created once,
+    on first use, so a cold start that has not reached the store yet does
+    not pay for them.
+    '''
+    MAX_BATCH_WRITES = 500  # Firestore limit per batch
+
+    def __init__(self, collection="user"):
+        self.collection = collection
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        with self._lock:
+            if self._db is None:
+                firebase_admin = metrics.lazy_import("firebase_admin")
+                from firebase_admin import credentials, firestore
+                try:
+                    firebase_admin.get_app()
+                except ValueError:
+                    # No app yet: use application default credentials
+                    firebase_admin.initialize_app(credentials.ApplicationDefault())
+                self._db = firestore.client()
+            return self._db
+
+    def load(self, user_ids):
+        states = {}
+        for user_id in user_ids:
+            data = self.db.collection(self.collection).document(str(user_id)).get().to_dict()
+            if data:
+                states[user_id] = data
+        return states
+
+    def save(self, states):
+        items = list(states.items())
+        for i in range(0, len(items), self.MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for user_id, state in items[i:i + self.MAX_BATCH_WRITES]:
+                # Replaces the state's fields whole, so entries of sold tokens do not linger
+                batch.set(self.db.collection(self.collection).document(str(user_id)), state, merge=list(state))
+            batch.commit()
+
+
+class WalletState:
+    '''
+    In-memory holdings per user, with the entry values of each position so
+    the position monitor can pick them up again after a restart. Buys and
+    sells update memory atomically and mark the user dirty; a background
+    thread writes dirty users back to the store in batches, so the buy path
+    never waits on the store.
+    '''
+    def __init__(self, store, flush_interval=5):
+        '''
+        :param store: WalletStore
+        :param flush_interval: float, seconds between write-behind flushes
+        '''
+        self.store = store
+        self.flush_interval = flush_interval
+        self._holdings = {}  # user_id -> Dict of token address -> entry tokenMetadata, None when unknown
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self, user_ids):
+        '''
+        Reloads the given users' holdings from the store, e.g. on startup.
+        '''
+        states = self.store.load(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                state = states.get(user_id, {})
+                entries = state.get("entries") or {}
+                self._holdings[user_id] = {tokenAddress: entries.get(tokenAddress)
+                                           for tokenAddress in state.get("tokens", [])}
+
+    def count(self, user_id):
+        with self._lock:
+            return len(self._holdings.get(user_id, ()))
+
+    def holdings(self, user_id):
+        with self._lock:
+            return set(self._holdings.get(user_id, ()))
+
+    def positions(self):
+        '''
+        :return: List of (user_id, tokenAddress, tokenMetadata) for every token held, tokenMetadata
+            None for holdings stored without entry values
+        '''
+        with self._lock:
+            return [(user_id, tokenAddress, tokenMetadata) for user_id, tokens in self._holdings.items()
+                    for tokenAddress, tokenMetadata in tokens.items()]
+
+    def try_buy(self, user_id, tokenAddress, walletTokenLimit, tokenMetadata=None):
+        '''
+        Records a buy if the user does not hold the token and has room for it.
+        The check and the update happen under one lock.
+        :param tokenMetadata: Dict of entry values of the position, stored with it (optional)
+        :return: bool, True if the buy was recorded
+        '''
+        with self._lock:
+            tokens = self._holdings.setdefault(user_id, {})
+            if tokenAddress in tokens or len(tokens) >= walletTokenLimit:
+                return False
+            tokens[tokenAddress] = tokenMetadata
+            self._dirty.add(user_id)
+            return True
+
+    def record_entry(self, user_id, tokenAddress, tokenMetadata):
+        '''
+        Stores the entry values of a token the user already holds.
+        '''
+        with self._lock:
+            tokens = self._holdings.get(user_id, {})
+            if tokenAddress in tokens:
+                tokens[tokenAddress] = tokenMetadata
+                self._dirty.add(user_id)
+
+    def record_sell(self, user_id, tokenAddress):
+        with self._lock:
+            tokens = self._holdings.setdefault(user_id, {})
+            if tokenAddress in tokens:
+                del tokens[tokenAddress]
+                self._dirty.add(user_id)
+
+    def flush(self):
+        '''
+        Writes every dirty user to the store in one batch. Users whose write
+        fails stay dirty and are retried on the next flush.
+        :return: int, number of users written
+        '''
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            states = {user_id: self._state(self._holdings.get(user_id, {})) for user_id in dirty}
+        if not states:
+            return 0
+        try:
+            with metrics.timer("firestore_save"):
+                self.store.save(states)
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        return len(states)
+
+    @staticmethod
+    def _state(tokens):
+        return {"tokens": sorted(tokens), "count": len(tokens),
+                "entries": {tokenAddress: tokenMetadata for tokenAddress, tokenMetadata in tokens.items()
+                            if tokenMetadata is not None}}
+
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing wallet state: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="wallet-state-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
@@ -0,0 +1,336 @@
+#Shared metrics: every function directory ships an identical copy of this file, keep them in sync.
+import bisect
+import collections
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("METRICS", "1") == "1"  # Set METRICS=0 to turn every timer and counter into a no-op
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0))  # Seconds between profiler samples, 0 is off
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Upper bounds in seconds
+PREFIX = "buzzbot"
+_LOADED_AT = time.perf_counter()
+
+
+class Histogram:
+    '''
+    Cumulative-bucket latency histogram, as Prometheus expects it.
+    '''
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        '''
+        Upper bound of the bucket holding the q quantile, None when empty.
+        '''
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Registry:
+    '''
+    Process-wide stage timings and event counters.
+    '''
+    def __init__(self):
+        self.stages = {}  # stage -> Histogram of seconds
+        self.counters = collections.defaultdict(int)  # event -> count
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def histograms(self):
+        with self._lock:
+            return sorted(self.stages.items())
+
+    def count(self, event, amount=1):
+        with self._lock:
+            self.counters[event] += amount
+
+    def render_prometheus(self):
+        '''
+        :return: str, every metric in the Prometheus text exposition format
+        '''
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        for stage, histogram in self.histograms():
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append(f"# TYPE {PREFIX}_events_total counter")
+        with self._lock:
+            counters = sorted(self.counters.items())
+        lines.extend(f'{PREFIX}_events_total{{event="{event}"}} {value}' for event, value in counters)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        '''
+        :return: Dict of per-stage count, total seconds and approximate p50/p95/p99, plus the counters
+        '''
+        stages = {stage: {"count": histogram.count, "sum": round(histogram.sum, 6),
+                          "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95),
+                          "p99": histogram.quantile(0.99)}
+                  for stage, histogram in self.histograms()}
+        with self._lock:
+            counters = dict(self.counters)
+        return {"stages": stages, "counters": counters}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.stage, time.perf_counter() - self.start)
+        if exc_type is not None:
+            registry.count(f"{self.stage}_errors")
+        return False
+
+
+registry = Registry()
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    '''
+    Context manager that records how long its block took under stage.
+    Errors raised in the block are also counted as <stage>_errors.
+    '''
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+
+def timed(stage):
+    '''
+    Decorator form of timer(). Returns the function unchanged when metrics are disabled.
+    '''
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(stage, seconds):
+    '''
+    Records a duration measured elsewhere, e.g. the swap executor's stage timings.
+    '''
+    if ENABLED:
+        registry.observe(stage, seconds)
+
+
+def count(event, amount=1):
+    if ENABLED:
+        registry.count(event, amount)
+
+
+def lazy_import(name):
+    '''
+    Imports a module the first time a stage needs it instead of at cold
+    start, and records how long that import took as import_<name>.
+    :param name: str, dotted module name
+    :return: module
+    '''
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        observe(f"import_{name}", time.perf_counter() - start)
+    return module
+
+
+def process_age():
+    '''
+    Seconds since this process started, interpreter start-up and imports
+    included. Falls back to the time since this module was imported where
+    /proc is not available.
+    '''
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _LOADED_AT
+
+
+_cold_start_lock = threading.Lock()
+_served = False
+
+
+def cold_start(**fields):
+    '''
+    Call at the top of every request. The first call in a process records
+    the process age as cold_start and prints it with the imports timed so
+    far; later calls only count warm_requests.
+    :param fields: extra fields for the log entry, e.g. function
+    :return: bool, True on the cold start
+    '''
+    global _served
+    with _cold_start_lock:
+        first, _served = not _served, True
+    if not first:
+        count("warm_requests")
+        return False
+    if ENABLED:
+        age = process_age()
+        observe("cold_start", age)
+        print(json.dumps(dict(fields, severity="INFO", message="cold start", seconds=round(age, 4),
+                              imports={stage: round(histogram.sum, 4) for stage, histogram in registry.histograms()
+                                       if stage.startswith("import_")})))
+    return True
+
+
+def render_prometheus():
+    return registry.render_prometheus()
+
+
+def log_snapshot(**fields):
+    '''
+    Prints every metric as one JSON line, which Cloud Logging stores as a structured entry.
+    :param fields: extra fields for the entry, e.g. user_id
+    '''
+    if ENABLED:
+        print(json.dumps(dict(fields, severity="INFO", message="metrics", **registry.snapshot())))
+
+
+def serve(port):
+    '''
+    Serves render_prometheus() on /metrics from a daemon thread.
+    :param port: int
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = render_prometheus().encode()
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+class SamplingProfiler:
+    '''
+    Statistical profiler for production: a daemon thread samples the stack
+    of every other thread at a fixed interval and counts the collapsed
+    stacks, in the format flame graph tools read.
+    '''
+    def __init__(self, interval=0.01, max_depth=40):
+        '''
+        :param interval: float, seconds between samples
+        :param max_depth: int, innermost frames kept per stack
+        '''
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self, limit=20):
+        '''
+        :return: List of (collapsed stack, samples), most sampled first
+        '''
+        return self.stacks.most_common(limit)
+
+    def log_report(self, limit=20):
+        print(json.dumps({"severity": "INFO", "message": "profile", "samples": self.samples,
+                          "stacks": [{"stack": stack, "samples": samples} for stack, samples in self.report(limit)]}))
+
+
+def start_profiler():
+    '''
+    Starts a SamplingProfiler when PROFILE_SAMPLE_INTERVAL is set.
+    :return: SamplingProfiler, or None when profiling is off
+    '''
+    if PROFILE_SAMPLE_INTERVAL <= 0:
+        return None
+    profiler = SamplingProfiler(PROFILE_SAMPLE_INTERVAL)
+    profiler.start()
+    return profiler
@@ -0,0 +1,66 @@
+#Shared position record: every function directory ships an identical copy of this file, keep them in sync.
+import json
+
+
+class PositionRecord:
+    '''
+    One user's position in a token as it moves through the scan, buy,
+    monitor and sell stages. In pipeline mode it travels on in-memory
+    queues; otherwise it is the JSON event data of each function invocation.
+    '''
+    __slots__ = ("user_id", "tokenAddress", "tokenMetadata", "passed_tests", "amount_in_sol",
+                 "buy_signature", "bought_at", "tokenLiveData", "sell_signature")
+
+    def __init__(self, user_id, tokenAddress, tokenMetadata=None, passed_tests=(), amount_in_sol=0.03,
+                 buy_signature=None, bought_at=None, tokenLiveData=None, sell_signature=None):
+        '''
+        :param user_id: str
+        :param tokenAddress: str, mint address
+        :param tokenMetadata: Dict of entry values, the baseline of the exit conditions
+        :param passed_tests: List of VALIDITY_TESTS the token passed
+        :param amount_in_sol: float, SOL spent on the buy
+        :param buy_signature: str, set by the buy stage
+        :param bought_at: float, unix time, set by the buy stage
+        :param tokenLiveData: TokenSnapshot that triggered the exit, set by the monitor; a Dict once sent as event data
+        :param sell_signature: str, set by the sell stage
+        '''
+        self.user_id = user_id
+        self.tokenAddress = tokenAddress
+        self.tokenMetadata = tokenMetadata
+        self.passed_tests = list(passed_tests)
+        self.amount_in_sol = amount_in_sol
+        self.buy_signature = buy_signature
+        self.bought_at = bought_at
+        self.tokenLiveData = tokenLiveData
+        self.sell_signature = sell_signature
+
+    def __repr__(self):
+        return f"PositionRecord(user_id={self.user_id!r}, tokenAddress={self.tokenAddress!r})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_json(self):
+        # Typed records such as the TokenSnapshot are sent as their dicts
+        return json.dumps(self.to_dict(), default=lambda value: value.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    @classmethod
+    def from_event(cls, data, user_id=None):
+        '''
+        Reads a record from a function invocation's event data.
+        :param data: Dict, JSON str or bytes
+        :param user_id: str, used when the event does not name the user
+        :return: PositionRecord, None when the event carries no token address
+        '''
+        if isinstance(data, (bytes, str)):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                return None
+        if not isinstance(data, dict) or not data.get("tokenAddress"):
+            return None
+        return cls.from_dict(dict({"user_id": user_id}, **{key: value for key, value in data.items() if value is not None}))
@@ -0,0 +1,95 @@
+#Shared quote cache: start_service, trigger_function_1 and trigger_function_3 ship identical copies of this file, keep them in sync.
+import threading
+import time
+from collections import OrderedDict
+
+
+class QuoteCache:
+    '''
+    Short-lived cache of Jupiter quotes keyed by input mint, output mint,
+    amount and slippage. Quotes can be prefetched speculatively so the buy
+    path finds a fresh one instead of waiting for a new round trip. Counts
+    how often a prefetched quote was still valid when it was needed, apart
+    from the reuse of quotes fetched on a miss.
+    '''
+    def __init__(self, fetch_quote, ttl=3.0, max_entries=1024, prefetch_quote=None):
+        '''
+        :param fetch_quote: Callable(from_token_mint, to_token_mint, amount, slippage_bps) returning a quote
+        :param ttl: float, seconds a quote stays usable
+        :param max_entries: int, oldest quotes are dropped past this size
+        :param prefetch_quote: Callable like fetch_quote used by prefetch, e.g. on a lower priority budget,
+            defaults to fetch_quote
+        '''
+        self.fetch_quote = fetch_quote
+        self.prefetch_quote = fetch_quote if prefetch_quote is None else prefetch_quote
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._quotes = OrderedDict()  # key -> (fetched_at, quote, prefetched and not used yet)
+        self._lock = threading.Lock()
+        self.prefetched = 0
+        self.prefetch_hits = 0
+        self.hits = 0
+        self.expired = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(from_token_mint, to_token_mint, amount, slippage_bps):
+        return str(from_token_mint), str(to_token_mint), int(amount), int(slippage_bps)
+
+    def put(self, from_token_mint, to_token_mint, amount, slippage_bps, quote, prefetched=False):
+        with self._lock:
+            key = self.key(from_token_mint, to_token_mint, amount, slippage_bps)
+            self._quotes.pop(key, None)
+            self._quotes[key] = (time.monotonic(), quote, prefetched)
+            while len(self._quotes) > self.max_entries:
+                self._quotes.popitem(last=False)
+
+    def prefetch(self, from_token_mint, to_token_mint, amount, slippage_bps=50):
+        '''
+        Fetches and caches a quote ahead of a possible swap. Blocking; run it off the hot path.
+        '''
+        quote = self.prefetch_quote(from_token_mint, to_token_mint, amount, slippage_bps)
+        self.put(from_token_mint, to_token_mint, amount, slippage_bps, quote, prefetched=True)
+        with self._lock:
+            self.prefetched += 1
+        return quote
+
+    def get(self, from_token_mint, to_token_mint, amount, slippage_bps=50):
+        '''
+        Returns a cached quote younger than ttl, otherwise fetches a new one.
+        '''
+        key = self.key(from_token_mint, to_token_mint, amount, slippage_bps)
+        with self._lock:
+            entry = self._quotes.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self.hits += 1
+                if entry[2]:
+                    # First use of a prefetched quote, later ones are plain reuse
+                    self.prefetch_hits += 1
+                    self._quotes[key] = (entry[0], entry[1], False)
+                return entry[1]
+            if entry is not None:
+                self.expired += 1
+                del self._quotes[key]
+            else:
+                self.misses += 1
+        quote = self.fetch_quote(from_token_mint, to_token_mint, amount, slippage_bps)
+        self.put(from_token_mint, to_token_mint, amount, slippage_bps, quote)
+        return quote
+
+    def stats(self):
+        '''
+        :return: Dict of counters. valid_rate is the share of cached quotes still fresh when used,
+            prefetch_hit_rate the share of prefetched quotes used while fresh.
+        '''
+        with self._lock:
+            cached = self.hits + self.expired
+            return {
+                "prefetched": self.prefetched,
+                "prefetch_hits": self.prefetch_hits,
+                "prefetch_hit_rate": self.prefetch_hits / self.prefetched if self.prefetched else None,
+                "hits": self.hits,
+                "expired": self.expired,
+                "misses": self.misses,
+                "valid_rate": self.hits / cached if cached else None,
+            }
@@ -0,0 +1,218 @@
+#Shared HTTP client: every function directory ships an identical copy of this file, keep them in sync.
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# API name -> (requests per second, burst size). Matches the published quotas.
+RATE_LIMITS = {
+    "dexscreener_profiles": (float(os.environ.get("DEXSCREENER_PROFILES_RPS", 1.0)), 5),  # 60 requests/min
+    "dexscreener": (float(os.environ.get("DEXSCREENER_RPS", 5.0)), 10),  # 300 requests/min
+    "dexscreener_orders": (float(os.environ.get("DEXSCREENER_ORDERS_RPS", 1.0)), 5),  # 60 requests/min
+    "jupiter": (float(os.environ.get("JUPITER_RPS", 1.0)), 5),  # 60 requests/min
+}
+# URL prefix -> API name, first match wins
+API_PREFIXES = [
+    ("https://api.dexscreener.com/token-profiles/", "dexscreener_profiles"),
+    ("https://api.dexscreener.com/orders/", "dexscreener_orders"),
+    ("https://api.dexscreener.com/", "dexscreener"),
+    ("https://api.jup.ag/", "jupiter"),
+    ("https://lite-api.jup.ag/", "jupiter"),
+]
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+FUNCTION_TIMEOUT = float(os.environ.get("FUNCTION_TIMEOUT", 130))  # Seconds to wait on an invoked function, above its own timeout
+ID_TOKEN_TTL = 3000  # Seconds an ID token is reused, Google's are valid for an hour
+
+
+class RateLimited(Exception):
+    '''
+    A low priority request found no token to spare in its API's bucket.
+    '''
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limiter. acquire() blocks until a request may be sent.
+    '''
+    def __init__(self, rate, capacity):
+        '''
+        :param rate: float, tokens added per second
+        :param capacity: int, maximum burst size
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self, reserve=0):
+        '''
+        Takes a token without waiting, only while reserve tokens are left for acquire() callers.
+        :param reserve: int
+        :return: bool, False if no token could be spared
+        '''
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1 + reserve:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class HttpClient:
+    '''
+    HTTP client shared by all requests of a process. Keeps a keep-alive
+    connection pool per host, rate limits every API with its own token
+    bucket and retries transient failures with exponential backoff and jitter.
+    '''
+    def __init__(self, rate_limits=RATE_LIMITS, pool_maxsize=32, retries=3,
+                 backoff=0.5, max_backoff=8.0, timeout=10.0):
+        '''
+        :param rate_limits: Dict of API name -> (requests per second, burst size)
+        :param pool_maxsize: int, connections kept open per host
+        :param retries: int, attempts per request
+        :param backoff: float, base delay in seconds before the first retry
+        :param max_backoff: float, maximum delay in seconds between retries
+        :param timeout: float, default request timeout in seconds
+        '''
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.buckets = {api: TokenBucket(rate, capacity) for api, (rate, capacity) in rate_limits.items()}
+        self.on_response = None  # Optional Callable(method, url, response), e.g. a capture recorder
+
+    def request(self, method, url, reserve=None, **kwargs):
+        '''
+        Sends a request. Connection errors, timeouts and RETRY_STATUSES
+        responses are retried; the last response or exception is returned
+        or raised once the attempts run out.
+        With reserve, the request is low priority: it is sent once, and only
+        if the API's bucket can spare a token right away while keeping
+        reserve tokens for other requests.
+        :param method: str
+        :param url: str
+        :param reserve: int, tokens a low priority request leaves in the bucket (optional)
+        :return: requests.Response
+        :raises RateLimited: when a low priority request finds no token to spare
+        '''
+        kwargs.setdefault("timeout", self.timeout)
+        bucket = self.bucket_for(url)
+        attempts = self.retries if reserve is None else 1
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            if bucket is not None:
+                if reserve is None:
+                    bucket.acquire()
+                elif not bucket.try_acquire(reserve):
+                    raise RateLimited(f"No request to spare for {url}")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                if self.on_response is not None:
+                    self.on_response(method, url, response)
+                return response
+            time.sleep(self.backoff_delay(attempt, response.headers.get("Retry-After")))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def bucket_for(self, url):
+        for prefix, api in API_PREFIXES:
+            if url.startswith(prefix):
+                return self.buckets.get(api)
+        return None
+
+    def backoff_delay(self, attempt, retry_after=None):
+        '''
+        Full jitter exponential backoff, or the server's Retry-After when given.
+        :param attempt: int, zero based attempt that just failed
+        :param retry_after: str, Retry-After header value (optional)
+        :return: float, seconds to wait
+        '''
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+client = HttpClient()
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
+
+
+_id_tokens = {}  # audience -> (expires_at, token)
+_id_tokens_lock = threading.Lock()
+
+
+def id_token_for(audience):
+    '''
+    ID token of the process's service account for audience, fetched from
+    the metadata server and reused until shortly before it expires.
+    :param audience: str, URL of the function called
+    :return: str
+    '''
+    now = time.monotonic()
+    with _id_tokens_lock:
+        cached = _id_tokens.get(audience)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+    transport = metrics.lazy_import("google.auth.transport.requests")
+    token = metrics.lazy_import("google.oauth2.id_token").fetch_id_token(transport.Request(), audience)
+    with _id_tokens_lock:
+        _id_tokens[audience] = (now + ID_TOKEN_TTL, token)
+    return token
+
+
+def invoke_function(url, data, timeout=FUNCTION_TIMEOUT):
+    '''
+    Calls an HTTP Cloud Function with an authenticated POST. Sent once: a
+    retry could repeat the function's swap.
+    :param url: str, the function's URL
+    :param data: str, JSON request body
+    :param timeout: float, seconds
+    :return: str, the function's response body
+    :raises requests.exceptions.RequestException: when the call fails, times out or returns an error status
+    '''
+    response = client.session.post(url, data=data, timeout=timeout, headers={
+        "Authorization": f"Bearer {id_token_for(url)}", "Content-Type": "application/json"})
+    response.raise_for_status()
+    return response.text
@@ -1,70 +1,67 @@
 import functions_framework
 import os
-from google.cloud import functions_v2
 import time
-import requests
+import http_client
+import metrics
+from position_record import PositionRecord
+from token_snapshot import decode_pairs
+from price_history import PriceHistory
+from position_monitor import exit_conditions_met
+
+PRICE_HISTORY_SAMPLES = int(os.environ.get("PRICE_HISTORY_SAMPLES", 60))  # Price samples kept for the trailing stop
+TRAILING_STOP = float(os.environ.get("TRAILING_STOP", 0))  # Sell at this drawdown from the price history's high, 0 for off
 
 @functions_framework.cloud_event
 def main(cloud_event):
     data = cloud_event.data
     user_id = os.environ.get("USER_ID")
     trigger_function_3 = os.environ.get("FUNCTION_TRIGGER_3")
+    metrics.cold_start(function="trigger-function-2", user_id=user_id)
 
     print(f"Trigger function 2 for user: {user_id} triggered with data: {data}")
 
-    # Your logic here.
-    tokenAddress = "INSERT TOKEN ADDRESS"
-    tokenMetaData = "INSERT TOKEN METADATA"
+    # The bought position, with its entry values, comes as the event data
+    position = PositionRecord.from_event(data, user_id=user_id)
+    if position is None or not position.tokenMetadata:
+        print(f"No position with entry values in the event data for user: {user_id}")
+        return "Function 2 executed."
+    tokenAddress = position.tokenAddress
+    tokenMetadata = position.tokenMetadata
+    history = PriceHistory(capacity=PRICE_HISTORY_SAMPLES)
     while(True):
         tokenLiveData = get_pricehistory_dexscreener(tokenAddress)[0]
-        condition_count = 0
-        if (tokenMetadata['priceNative'] * 0.92) <= float(tokenLiveData['priceNative']):
-            condition_count += 1
-            # valid_token_dict[tokenAddress]['priceNative'] = float(tokenLiveData['priceNative'])
-        if tokenMetadata['m5_buys'] <= tokenLiveData['txns']['m5']['buys']:
-            condition_count += 1
-            # valid_token_dict[tokenAddress]['m5_buys'] = tokenLiveData['txns']['m5']['buys']
-        if tokenMetadata['m5_buysell_ratio'] <= tokenLiveData['txns']['m5']['buys'] / tokenLiveData['txns']['m5'][
-            'sells']:
-            condition_count += 1
-        if tokenMetadata['m5_volume'] <= tokenLiveData['volume']['m5']:
-            condition_count += 1
-            # valid_token_dict[tokenAddress]['m5_volume'] = tokenLiveData['2volume']['m5']
-        if condition_count == 0:
-            client = functions_v2.FunctionServiceClient()
-            request = functions_v2.InvokeFunctionRequest(name=f"projects/{os.environ.get('PROJECT_ID')}/locations/{os.environ.get('REGION')}/functions/{trigger_function_3}")
-            response = client.invoke_function(request=request)
-
-            print(f"Triggered function 3 for user: {user_id}")
-            return "Function 2 executed."
+        history.add_snapshot(tokenLiveData)
+        if exit_conditions_met(tokenMetadata, tokenLiveData, history=history, trailing_stop=TRAILING_STOP):
+            position.tokenLiveData = tokenLiveData
+            # FUNCTION_TRIGGER_3 is trigger_function_3's URL; it answers "sold" once the sell has landed
+            try:
+                with metrics.timer("invoke_function"):
+                    outcome = http_client.invoke_function(trigger_function_3, position.to_json())
+            except Exception as e:
+                outcome = str(e)
+            print(f"Triggered function 3 for user: {user_id}: {outcome}")
+            if outcome == "sold":
+                metrics.log_snapshot(function="trigger-function-2", user_id=user_id)
+                return "Function 2 executed."
+            # Not sold, the next check retries the exit
 
         time.sleep(60)
 
+@metrics.timed("dexscreener_pricehistory")
 def get_pricehistory_dexscreener(tokenAddress,chainId = "solana"):
     '''
     Get Price History Data for a specific token.
     :param tokenAddress: str
     :param chainId: str
-    :return: List
+    :return: List of TokenSnapshot, one per pair
     '''
 
-    # data = response.json()
-    # return data
-    retries = 3
-
-    for i in range(retries):
-        try:
-            response = requests.get(
-                f"https://api.dexscreener.com/tokens/v1/{chainId}/{tokenAddress}"
-                # DuypYwg2mr5hD9iPJCxiYSEvA4t9dFFGSU2HmF9vFCWu"
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data
-            # break  # Success, exit the loop
-        except Exception as e:
-            print(f"Attempt {i + 1} failed: {e}")
-            if i < retries - 1:
-                time.sleep(2)  # 2-second delay between retries
-            else:
-                print("Failed after retries.")
\ No newline at end of file
+    # Transient failures are retried with backoff by http_client
+    try:
+        response = http_client.get(
+            f"https://api.dexscreener.com/tokens/v1/{chainId}/{tokenAddress}"
+        )
+        response.raise_for_status()
+        return decode_pairs(response.content)
+    except Exception as e:
+        print(f"Failed after retries: {e}")
\ No newline at end of file
@@ -0,0 +1,126 @@
+#Shared position monitor: start_service and trigger_function_2 ship identical copies of this file, keep them in sync.
+import threading
+import time
+
+
+def exit_conditions_met(tokenMetadata, tokenLiveData, history=None, trailing_stop=0):
+    '''
+    The exit rule of PositionMonitor and of trigger_function_2: sell once the
+    price is below 92% of the entry price and m5 buys, m5 buy/sell ratio and
+    m5 volume have all dropped below their entry values, or, with a trailing
+    stop, once the price has fallen that far from the high of the token's
+    price history.
+    :param tokenMetadata: Dict of entry values
+    :param tokenLiveData: TokenSnapshot, latest pair data from Dex Screener
+    :param history: PriceHistory of the token (optional)
+    :param trailing_stop: float, drawdown from the history's high that sells, 0 for none
+    :return: bool
+    '''
+    if trailing_stop and history is not None and history.count and history.drawdown >= trailing_stop:
+        return True
+    # No sells in the window counts as a healthy ratio instead of dividing by zero
+    live_ratio = tokenLiveData.m5_buys / tokenLiveData.m5_sells if tokenLiveData.m5_sells else float('inf')
+    condition_count = 0
+    if (tokenMetadata['priceNative'] * 0.92) <= tokenLiveData.priceNative:
+        condition_count += 1
+    if tokenMetadata['m5_buys'] <= tokenLiveData.m5_buys:
+        condition_count += 1
+    if tokenMetadata['m5_buysell_ratio'] <= live_ratio:
+        condition_count += 1
+    if tokenMetadata['m5_volume'] <= tokenLiveData.volume_m5:
+        condition_count += 1
+    return condition_count == 0
+
+
+class PositionMonitor:
+    '''
+    Watches every open position from one thread. Each tick refreshes all
+    positions with one batched price lookup, checks the exit conditions for
+    all of them in a single pass and dispatches the sells. Positions are
+    kept per user, and a token held by several users is fetched once.
+    '''
+    def __init__(self, fetch_snapshots, dispatch_sell, interval=10, price_history=None, trailing_stop=0):
+        '''
+        :param fetch_snapshots: Callable taking a list of token addresses and
+            returning a dict of address -> list of TokenSnapshots
+        :param dispatch_sell: Callable(tokenAddress, tokenMetadata, tokenLiveData, user_id) run for each exit
+        :param interval: float, seconds between ticks
+        :param price_history: PriceHistoryStore that fetch_snapshots records into, read by the trailing stop (optional)
+        :param trailing_stop: float, see exit_conditions_met
+        '''
+        self.fetch_snapshots = fetch_snapshots
+        self.dispatch_sell = dispatch_sell
+        self.interval = interval
+        self.price_history = price_history
+        self.trailing_stop = trailing_stop
+        self.positions = {}  # (user_id, tokenAddress) -> entry tokenMetadata
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_position(self, tokenAddress, tokenMetadata, user_id=None):
+        with self._lock:
+            self.positions[(user_id, tokenAddress)] = tokenMetadata
+
+    def remove_position(self, tokenAddress, user_id=None):
+        with self._lock:
+            return self.positions.pop((user_id, tokenAddress), None)
+
+    def has_position(self, tokenAddress, user_id=None):
+        with self._lock:
+            return (user_id, tokenAddress) in self.positions
+
+    def tick(self):
+        '''
+        Refreshes every open position and sells the ones whose exit conditions are met.
+        :return: List of (user_id, tokenAddress) positions sold
+        '''
+        with self._lock:
+            positions = dict(self.positions)
+        if not positions:
+            return []
+        addresses = list(dict.fromkeys(tokenAddress for _, tokenAddress in positions))
+        snapshots = self.fetch_snapshots(addresses)
+        exits = []
+        for (user_id, tokenAddress), tokenMetadata in positions.items():
+            pairs = snapshots.get(tokenAddress)
+            if not pairs:
+                continue
+            history = self.price_history.get(tokenAddress) if self.price_history is not None else None
+            try:
+                if exit_conditions_met(tokenMetadata, pairs[0], history=history, trailing_stop=self.trailing_stop):
+                    exits.append((user_id, tokenAddress, tokenMetadata, pairs[0]))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping malformed snapshot for {tokenAddress}: {e}")
+        sold = []
+        for user_id, tokenAddress, tokenMetadata, tokenLiveData in exits:
+            # Drop the position first so the next tick cannot sell it twice
+            if self.remove_position(tokenAddress, user_id=user_id) is None:
+                continue
+            try:
+                self.dispatch_sell(tokenAddress, tokenMetadata, tokenLiveData, user_id)
+                sold.append((user_id, tokenAddress))
+            except Exception as e:
+                print(f"Error dispatching sell for {tokenAddress}: {e}")
+                self.add_position(tokenAddress, tokenMetadata, user_id=user_id)
+        return sold
+
+    def run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error in position monitor: {e}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="position-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,167 @@
+#Shared price history: start_service and trigger_function_2 ship identical copies of this file, keep them in sync.
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+
+class PriceHistory:
+    '''
+    The latest price samples of one token in fixed-size ring buffers, with
+    the window's high, the drawdown from it and the momentum over the last
+    momentum_window seconds kept up to date per sample. Memory is fixed by
+    capacity whatever the number of samples added.
+    '''
+    __slots__ = ("capacity", "momentum_window", "times", "prices", "count", "added", "_next", "_highs")
+
+    def __init__(self, capacity=60, momentum_window=60):
+        '''
+        :param capacity: int, samples kept
+        :param momentum_window: float, seconds between the prices momentum compares
+        '''
+        self.capacity = capacity
+        self.momentum_window = momentum_window
+        self.times = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.count = 0  # Samples in the window
+        self.added = 0  # Samples ever added
+        self._next = 0
+        self._highs = deque()  # (sample number, price), prices decreasing: the window's high is first
+
+    def add(self, at, price):
+        '''
+        :param at: float, unix time of the sample
+        :param price: float
+        '''
+        index = self._next
+        if self.count < self.capacity:
+            self.count += 1
+        self.times[index] = at
+        self.prices[index] = price
+        self._next = (index + 1) % self.capacity
+        while self._highs and self._highs[-1][1] <= price:
+            self._highs.pop()
+        self._highs.append((self.added, price))
+        while self._highs[0][0] <= self.added - self.capacity:
+            self._highs.popleft()
+        self.added += 1
+
+    def add_snapshot(self, snapshot, at=None):
+        '''
+        :param snapshot: TokenSnapshot
+        :param at: float, unix time, defaults to now
+        '''
+        self.add(time.time() if at is None else at, snapshot.priceNative)
+
+    def _at(self, age):
+        # Slot of the sample added age samples before the latest one
+        return (self._next - 1 - age) % self.capacity
+
+    @property
+    def price(self):
+        return self.prices[self._at(0)] if self.count else None
+
+    @property
+    def high(self):
+        return self._highs[0][1] if self._highs else None
+
+    @property
+    def drawdown(self):
+        '''
+        Fraction the latest price is below the window's high, 0 at a new high.
+        '''
+        high = self.high
+        return 1 - self.price / high if high else None
+
+    @property
+    def momentum(self):
+        '''
+        Latest price over the price momentum_window seconds before it, minus
+        one, whatever the number of samples in between. The past price is
+        the latest sample at least that old; None until the window reaches
+        back that far.
+        '''
+        if not self.count:
+            return None
+        cutoff = self.times[self._at(0)] - self.momentum_window
+        # Sample times only grow, so the first sample old enough is found by bisecting over the ages
+        low, high = 1, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._at(middle)] <= cutoff:
+                high = middle
+            else:
+                low = middle + 1
+        if low == self.count:
+            return None
+        past = self.prices[self._at(low)]
+        return self.price / past - 1 if past else None
+
+
+class PriceHistoryStore:
+    '''
+    PriceHistory per token, shared by the scan and the position monitor.
+    Holds at most max_tokens histories, dropping the least recently
+    updated, so its memory is bounded at about max_tokens * capacity * 16
+    bytes.
+    '''
+    def __init__(self, capacity=60, max_tokens=10000, momentum_window=60):
+        '''
+        :param capacity: int, samples kept per token
+        :param max_tokens: int, tokens tracked at once
+        :param momentum_window: float, see PriceHistory
+        '''
+        self.capacity = capacity
+        self.max_tokens = max_tokens
+        self.momentum_window = momentum_window
+        self._histories = OrderedDict()  # tokenAddress -> PriceHistory
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def update(self, tokenAddress, snapshot, at=None):
+        '''
+        Adds a token's latest snapshot to its history.
+        :param tokenAddress: str
+        :param snapshot: TokenSnapshot
+        :param at: float, unix time, defaults to now
+        :return: PriceHistory
+        '''
+        with self._lock:
+            history = self._histories.get(tokenAddress)
+            if history is None:
+                history = PriceHistory(self.capacity, self.momentum_window)
+                self._histories[tokenAddress] = history
+                if len(self._histories) > self.max_tokens:
+                    self._histories.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._histories.move_to_end(tokenAddress)
+            history.add_snapshot(snapshot, at)
+            return history
+
+    def update_many(self, snapshots, at=None):
+        '''
+        :param snapshots: Dict of token address -> list of TokenSnapshots, the first pair is recorded
+        :param at: float, unix time, defaults to now
+        '''
+        at = time.time() if at is None else at
+        for tokenAddress, pairs in snapshots.items():
+            if pairs:
+                self.update(tokenAddress, pairs[0], at)
+
+    def get(self, tokenAddress):
+        '''
+        :return: PriceHistory, None for a token without samples
+        '''
+        with self._lock:
+            return self._histories.get(tokenAddress)
+
+    def remove(self, tokenAddress):
+        with self._lock:
+            return self._histories.pop(tokenAddress, None)
+
+    def __len__(self):
+        return len(self._histories)
+
+    def stats(self):
+        return {"tokens": len(self._histories), "max_tokens": self.max_tokens, "evictions": self.evictions}
@@ -0,0 +1,149 @@
+#Shared confirmation tracker: start_service, trigger_function_1 and trigger_function_3 ship identical copies of this file, keep them in sync.
+import asyncio
+import math
+import time
+from collections import deque
+import metrics
+from solana.rpc.commitment import Confirmed
+from solana.rpc.types import TxOpts
+from solders.transaction_status import TransactionConfirmationStatus
+
+CONFIRMED_STATUSES = (TransactionConfirmationStatus.Confirmed, TransactionConfirmationStatus.Finalized)
+DEFAULT_VALID_BLOCKS = 150  # Blocks a blockhash stays valid for, used when the expiry height is not known
+
+
+def percentile(values, percent):
+    '''
+    Nearest-rank percentile of a list of numbers.
+    :param values: List
+    :param percent: float, 0 to 100
+    :return: float, None for an empty list
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+
+
+class ConfirmationTracker:
+    '''
+    Tracks in-flight transactions in the background. Every poll checks all of
+    them with one getSignatureStatuses call per 256 signatures, rebroadcasts
+    the ones still unconfirmed until their blockhash expires, and records the
+    time from send to confirmation. Runs on the event loop of the AsyncClient
+    it is given. A transaction sent without its expiry height is given
+    DEFAULT_VALID_BLOCKS from the first block height seen after it was sent.
+    '''
+    MAX_SIGNATURES_PER_CALL = 256  # getSignatureStatuses limit
+
+    def __init__(self, client, poll_interval=1.0, rebroadcast_interval=2.0, history=1000, on_resolved=None):
+        '''
+        :param client: solana.rpc.async_api.AsyncClient
+        :param poll_interval: float, seconds between status polls
+        :param rebroadcast_interval: float, seconds between resends of an unconfirmed transaction
+        :param history: int, number of confirmation times kept
+        :param on_resolved: Callable(compute_unit_price, outcome, seconds) run for every resolved transaction (optional)
+        '''
+        self.client = client
+        self.poll_interval = poll_interval
+        self.rebroadcast_interval = rebroadcast_interval
+        self.opts = TxOpts(skip_preflight=True, max_retries=0)
+        self.pending = {}  # str(signature) -> in-flight transaction Dict
+        self.confirm_times = deque(maxlen=history)
+        self.counts = {"confirmed": 0, "failed": 0, "expired": 0, "rebroadcasts": 0}
+        self.on_resolved = on_resolved
+        self._stop = None
+
+    def track(self, signature, raw_tx, last_valid_block_height=None, compute_unit_price=None):
+        '''
+        Starts tracking a sent transaction. Must be called on the tracker's loop.
+        :param signature: solders Signature
+        :param raw_tx: bytes of the signed transaction, resent while unconfirmed
+        :param last_valid_block_height: int, block height after which the blockhash expires (optional,
+            DEFAULT_VALID_BLOCKS past the next polled height when not given)
+        :param compute_unit_price: int, micro-lamports the transaction bid, passed to on_resolved (optional)
+        :return: asyncio.Future resolving to "confirmed", "failed" or "expired"
+        '''
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[str(signature)] = {
+            "signature": signature,
+            "raw_tx": raw_tx,
+            "last_valid_block_height": last_valid_block_height,
+            "sent_at": now,
+            "last_sent": now,
+            "compute_unit_price": compute_unit_price,
+            "future": future,
+        }
+        return future
+
+    def resolve(self, key, outcome):
+        entry = self.pending.pop(key)
+        elapsed = time.monotonic() - entry["sent_at"]
+        self.counts[outcome] += 1
+        metrics.count(f"transactions_{outcome}")
+        if outcome == "confirmed":
+            self.confirm_times.append(elapsed)
+            metrics.observe("confirmation", elapsed)
+        if self.on_resolved is not None:
+            self.on_resolved(entry["compute_unit_price"], outcome, elapsed)
+        if not entry["future"].done():
+            entry["future"].set_result(outcome)
+
+    async def poll_once(self):
+        '''
+        Checks every pending transaction once and resends or expires the unconfirmed ones.
+        '''
+        keys = list(self.pending)
+        for i in range(0, len(keys), self.MAX_SIGNATURES_PER_CALL):
+            batch = keys[i:i + self.MAX_SIGNATURES_PER_CALL]
+            response = await self.client.get_signature_statuses([self.pending[key]["signature"] for key in batch])
+            for key, status in zip(batch, response.value):
+                if status is None:
+                    continue
+                if status.err is not None:
+                    self.resolve(key, "failed")
+                elif status.confirmation_status in CONFIRMED_STATUSES:
+                    self.resolve(key, "confirmed")
+        if not self.pending:
+            return
+        block_height = (await self.client.get_block_height(Confirmed)).value
+        now = time.monotonic()
+        for key, entry in list(self.pending.items()):
+            if entry["last_valid_block_height"] is None:
+                entry["last_valid_block_height"] = block_height + DEFAULT_VALID_BLOCKS
+            if block_height > entry["last_valid_block_height"]:
+                self.resolve(key, "expired")
+            elif now - entry["last_sent"] >= self.rebroadcast_interval:
+                entry["last_sent"] = now
+                self.counts["rebroadcasts"] += 1
+                metrics.count("rebroadcasts")
+                try:
+                    await self.client.send_raw_transaction(entry["raw_tx"], opts=self.opts)
+                except Exception as e:
+                    print(f"Error rebroadcasting {key}: {e}")
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        while not self._stop.is_set():
+            if self.pending:
+                try:
+                    await self.poll_once()
+                except Exception as e:
+                    print(f"Error polling signature statuses: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def stats(self):
+        '''
+        :return: Dict of outcome counters, in-flight count and time-to-confirm percentiles in seconds
+        '''
+        times = list(self.confirm_times)
+        return dict(self.counts, in_flight=len(self.pending),
+                    p50=percentile(times, 50), p90=percentile(times, 90), p99=percentile(times, 99))
@@ -1,98 +1,56 @@
 import functions_framework
 import os
-import requests
-import json
+import metrics
+from position_record import PositionRecord
+from swap_executor import executor, sell_landed, sell_positions
 
-import base64
-import json
-import requests
-from solana.rpc.api import Client
-from solana.rpc.api import Pubkey
-from solana.rpc.api import VersionedTransaction
-from solana.rpc.types import TokenAccountOpts
-from solana.rpc.types import TxOpts
-from solana.rpc.async_api import AsyncClient
-from solana.rpc.commitment import Processed
+# Load the Solana SDK, open the RPC connection and decode the wallet key in the
+# background, so they are ready by the time the first request needs them
+executor.warm(os.environ.get("USER_ID"), os.environ.get("PRIVATE_KEY_BASE58", ""))
 
-from solders import keypair
-from solders import message
-from solders import keypair
-
-@functions_framework.cloud_event
-def main(cloud_event):
-    data = cloud_event.data
+@functions_framework.http
+def main(request):
+    data = request.get_data()
     user_id = os.environ.get("USER_ID")
+    metrics.cold_start(function="trigger-function-3", user_id=user_id)
 
     print(f"Trigger function 2 for user: {user_id} triggered with data: {data}")
 
-    # Your logic here.
-    tokenAddress = ""
-    sell_token(tokenAddress)
-    # wallet -= 1
-
-def sell_token(tokenAddress):
-    SOLANA_RPC_URL = "https://api.mainnet-beta.solana.com"  # Replace with your Solana RPC URL
-    PRIVATE_KEY_BASE58 = ""  # Replace with your private key
-    FROM_TOKEN_MINT = Pubkey.from_string("So11111111111111111111111111111111111111112")  # SOL
-    client = Client(SOLANA_RPC_URL)
-    private_key = keypair.Keypair.from_base58_string(PRIVATE_KEY_BASE58)
-    public_key = private_key.pubkey()
-    mint_key = Pubkey.from_string(tokenAddress)
-    # balance = get_altcoin_balance(client,owner_pubkey=public_key,altcoin_mint_address="6V4TgjgAmDHPSW4kgFjegnhHaSk4eBeydZdRxjNhpump")
-    # print(balance)
-    token_account = client.get_token_accounts_by_owner(public_key, TokenAccountOpts(mint=mint_key))
-    token_account_pubkey = token_account.value[0].pubkey
-
-    balance = client.get_token_account_balance(token_account_pubkey)
-    # print(f"Token Account: {token_account}, Balance: {balance.value.ui_amount}")  # balance.value.amount
-    # print(balance)
-    quote = get_jupiter_swap_quote(mint_key, FROM_TOKEN_MINT, balance.value.amount)
-    execute_jupiter_swap(PRIVATE_KEY_BASE58, quote)
-    print("Swap complete for: ", tokenAddress)
-def get_jupiter_swap_quote(from_token_mint, to_token_mint, amount, slippage_bps=50):
-    """Gets a swap quote from Jupiter."""
-    url = f"https://api.jup.ag/swap/v1/quote?inputMint={from_token_mint}&outputMint={to_token_mint}&amount={amount}&slippageBps={slippage_bps}"
-    response = requests.get(url)
-    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-    return response.json()
-def execute_jupiter_swap(private_key_base58, quote_response,SOLANA_RPC_URL = "https://api.mainnet-beta.solana.com"):
-    """Executes a swap using the Jupiter swap API."""
-    client = Client(SOLANA_RPC_URL) #ASyncClient
-    keypair_ = keypair.Keypair.from_base58_string(private_key_base58)
-    user_address = keypair_.pubkey()
-
-    # Get the swap transaction
-    swap_transaction = requests.post(
-        "https://api.jup.ag/swap/v1/swap",
-        headers={"Content-Type": "application/json"},
-        json={
-            "quoteResponse": quote_response,  # Include the entire quoteResponse
-            "userPublicKey": str(user_address),
-            "wrapUnwrapSOL": True,
-            "dynamicComputeUnitLimit": True,  # Add additional parameters
-            "dynamicSlippage": True,
-            "prioritizationFeeLamports": {
-                "priorityLevelWithMaxLamports": {
-                    "maxLamports": 1000000,
-                    "priorityLevel": "veryHigh"
-                }
-            }
-        },
-    )
-    swap_transaction.raise_for_status()
-    swap_transaction_data = swap_transaction.json()
-
-    tx_base64 = swap_transaction_data["swapTransaction"]
-    tx = VersionedTransaction.from_bytes(base64.b64decode(tx_base64))
-
-    # Sign and send the transaction
-    try:
-        signature = keypair_.sign_message(message.to_bytes_versioned(tx.message))
-        signed_tx = VersionedTransaction.populate(tx.message,[signature])
-        opts = TxOpts(skip_preflight=False, preflight_commitment=Processed)
-        sent_tx = client.send_raw_transaction(txn=bytes(signed_tx),opts = opts)
-        print(f"Transaction signature: {sent_tx}")
-        transaction_id = json.loads(sent_tx.to_json())['result']
-        print(f"Transaction sent: https://explorer.solana.com/tx/{transaction_id}")
-    except Exception as e:
-        print(f"Error executing swap: {e}")
+    # start_service or trigger_function_2 POSTs the position to sell as JSON
+    position = PositionRecord.from_event(data, user_id=user_id)
+    if position is None:
+        print(f"No token address in the request data for user: {user_id}")
+        return "No token address in the request data", 400
+    result = sell_token(position.tokenAddress, position=position)
+    metrics.log_snapshot(function="trigger-function-3", user_id=user_id, swaps=executor.stats())
+    # The response body is read by start_service, which frees the wallet slot only once the sell has landed
+    return "sold" if sell_landed(result) else result.get("error", result.get("outcome"))
+
+def sell_token(tokenAddress, position=None):
+    result = sell_tokens([tokenAddress], positions=None if position is None else [position])[tokenAddress]
+    if "error" in result:
+        print(f"Error selling {tokenAddress}: {result['error']}")
+    elif result["outcome"] != "confirmed":
+        print(f"Sell of {tokenAddress} {result['outcome']}: https://explorer.solana.com/tx/{result['signature']}")
+    else:
+        print("Swap complete for: ", tokenAddress)
+    return result
+def sell_tokens(tokenAddresses, positions=None):
+    '''
+    Sells the whole balance of several tokens at once with the sell stage
+    shared with start_service's pipeline mode. All of the wallet's token
+    balances are read with one owner-wide query, then the sells are quoted
+    and sent concurrently through the swap executor, and their confirmation
+    awaited.
+    :param tokenAddresses: List of mint addresses
+    :param positions: List of PositionRecords for the tokens (optional)
+    :return: Dict of mint address -> swap result with its 'outcome', or {"error": str}
+    '''
+    PRIVATE_KEY_BASE58 = os.environ.get("PRIVATE_KEY_BASE58", "")  # Replace with your private key
+    if positions is None:
+        positions = [PositionRecord(os.environ.get("USER_ID"), tokenAddress) for tokenAddress in tokenAddresses]
+    results = sell_positions(positions, PRIVATE_KEY_BASE58, confirm=True)
+    for tokenAddress, result in results.items():
+        if "signature" in result:
+            print(f"Transaction sent: https://explorer.solana.com/tx/{result['signature']}")
+    return results
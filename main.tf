@@ -49,6 +49,49 @@ module "user_services" {
   region       = var.region
   source_bucket = var.source_bucket
   secret_id = google_secret_manager_secret.user_private_keys.id
+  deploy_start_service = !var.shared_scanner
+  function_invokers = var.shared_scanner ? ["serviceAccount:${module.shared_scanner[0].service_account}"] : []
+}
+
+# One scanner that fetches and vets the market once per cycle for all users
+module "shared_scanner" {
+  count  = var.shared_scanner ? 1 : 0
+  source = "./modules/cloud_run_service"
+
+  name     = "shared-start"
+  location = var.region
+  image    = "gcr.io/${var.project_id}/start-service:latest"
+  envs = [
+    {
+      name  = "PROJECT_ID"
+      value = var.project_id
+    },
+    {
+      name  = "REGION"
+      value = var.region
+    },
+    {
+      name = "USERS"
+      value = jsonencode([
+        for user in var.users : {
+          user_id            = user.user_id
+          function_trigger_1 = module.user_services[user.user_id].trigger_function_1_url
+          function_trigger_3 = module.user_services[user.user_id].trigger_function_3_url
+        }
+      ])
+    },
+    {
+      name  = "USER_SETTINGS"
+      value = jsonencode(var.user_settings)
+    }
+  ]
+}
+
+resource "google_secret_manager_secret_iam_member" "shared_scanner_access" {
+  count     = var.shared_scanner ? 1 : 0
+  secret_id = google_secret_manager_secret.user_private_keys.id
+  role      = "roles/secretmanager.secretAccessor"
+  member    = "serviceAccount:${module.shared_scanner[0].service_account}"
 }
 
 # Cloud Scheduler to trigger the "start" cloud run service every 5 minutes
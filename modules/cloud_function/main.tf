@@ -44,11 +44,19 @@ resource "google_cloudfunctions2_function" "function" {
   service_config {
     max_instance_count = 10
     available_memory   = "256Mi"
-    timeout_seconds    = 60
-    all_users_granted_access = true
+    timeout_seconds    = var.timeout_seconds
     environment_variables = var.envs
   }
 }
+
+# Members allowed to call the function's URL with an ID token
+resource "google_cloud_run_service_iam_member" "invoker" {
+  for_each = toset(var.invokers)
+  location = var.location
+  service  = google_cloudfunctions2_function.function.service_config[0].service
+  role     = "roles/run.invoker"
+  member   = each.value
+}
 output "service_account" {
   value = google_cloudfunctions2_function.function.service_config[0].service_account_email
 }
\ No newline at end of file
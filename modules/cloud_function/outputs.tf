@@ -1,3 +1,6 @@
 output "service_account" {
   value = google_cloudfunctions2_function.function.service_config[0].service_account_email
-}
\ No newline at end of file
+}
+output "url" {
+  value = google_cloudfunctions2_function.function.url
+}
@@ -6,4 +6,12 @@ variable "source_bucket" {}
 variable "source_object" {}
 variable "envs" {
   type = map(string)
-}
\ No newline at end of file
+}
+variable "timeout_seconds" {
+  type    = number
+  default = 60
+}
+variable "invokers" {
+  type    = list(string)
+  default = []
+}
@@ -22,7 +22,25 @@ variable "secret_id" {
   type = string
 }
 
+variable "deploy_start_service" {
+  type    = bool
+  default = true
+}
+
+variable "function_invokers" {
+  type        = list(string)
+  description = "Members that invoke the buy and sell functions besides this user's start service, e.g. the shared scanner"
+  default     = []
+}
+
+locals {
+  # start_service reads the buy's and the sell's outcome from the functions' HTTP responses
+  function_invokers = concat(var.function_invokers,
+    var.deploy_start_service ? ["serviceAccount:${module.start_service[0].service_account}"] : [])
+}
+
 module "start_service" {
+  count  = var.deploy_start_service ? 1 : 0
   source = "../cloud_run_service"
 
   name     = "${var.user_id}-start"
@@ -39,7 +57,7 @@ module "start_service" {
     },
     {
       name = "FUNCTION_TRIGGER_1"
-      value = "${var.user_id}-trigger_function_1"
+      value = module.trigger_function_1.url
     },
     {
       name = "FUNCTION_TRIGGER_2"
@@ -47,7 +65,7 @@ module "start_service" {
     },
     {
       name = "FUNCTION_TRIGGER_3"
-      value = "${var.user_id}-trigger_function_3"
+      value = module.trigger_function_3.url
     },
     {
         name = "USER_ID"
@@ -65,8 +83,10 @@ module "trigger_function_1" {
   entry_point   = "main"
   source_bucket = var.source_bucket
   source_object = "trigger_function_1.zip"
+  # Long enough to wait for the buy's confirmation
+  timeout_seconds = 120
+  invokers        = local.function_invokers
   envs = {
-    "FUNCTION_TRIGGER_2" = "${var.user_id}-trigger_function_2"
     "USER_ID" = var.user_id
   }
 }
@@ -81,7 +101,7 @@ module "trigger_function_2" {
   source_bucket = var.source_bucket
   source_object = "trigger_function_2.zip"
   envs = {
-    "FUNCTION_TRIGGER_3" = "${var.user_id}-trigger_function_3"
+    "FUNCTION_TRIGGER_3" = module.trigger_function_3.url
     "USER_ID" = var.user_id
   }
 }
@@ -95,6 +115,9 @@ module "trigger_function_3" {
   entry_point   = "main"
   source_bucket = var.source_bucket
   source_object = "trigger_function_3.zip"
+  # Long enough to wait for the sell's confirmation
+  timeout_seconds = 120
+  invokers        = concat(local.function_invokers, ["serviceAccount:${module.trigger_function_2.service_account}"])
   envs = {
     "USER_ID" = var.user_id
   }
@@ -106,9 +129,10 @@ resource "google_secret_manager_secret_version" "user_private_key_version" {
 }
 
 resource "google_secret_manager_secret_iam_member" "cloud_run_access" {
+  count     = var.deploy_start_service ? 1 : 0
   secret_id = var.secret_id
   role      = "roles/secretmanager.secretAccessor"
-  member    = "serviceAccount:${module.start_service.service_account}"
+  member    = "serviceAccount:${module.start_service[0].service_account}"
 }
 
 resource "google_secret_manager_secret_iam_member" "cloud_functions_access_1" {
@@ -130,5 +154,13 @@ resource "google_secret_manager_secret_iam_member" "cloud_functions_access_3" {
 }
 
 output "start_service_url" {
-  value = module.start_service.url
+  value = var.deploy_start_service ? module.start_service[0].url : null
+}
+
+output "trigger_function_1_url" {
+  value = module.trigger_function_1.url
+}
+
+output "trigger_function_3_url" {
+  value = module.trigger_function_3.url
 }
\ No newline at end of file
@@ -4,4 +4,8 @@ output "user_service_urls" {
     for user_id, module in module.user_services :
     user_id => module.start_service_url
   }
+}
+
+output "shared_scanner_url" {
+  value = var.shared_scanner ? module.shared_scanner[0].url : null
 }
\ No newline at end of file
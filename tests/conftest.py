@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import time
+import pytest
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# Shared modules are identical copies, so start_service's copies stand in for every function directory's
+sys.path[:0] = [os.path.join(ROOT, "functions", "start_service"), os.path.join(ROOT, "benchmarks")]
+
+DEXSCREENER_URL = "https://api.dexscreener.com"
+
+
+def make_token(address, links=2, sells=40, pairs=1, pools=2, orders=()):
+    '''
+    A token as the stub Dex Screener serves it. The defaults pass the link,
+    orders and price history tests; the pool test needs older pools than
+    the stub's, so it fails unless pools are given.
+    :param links: int, links in the profile
+    :param sells: int, m5 sells of the token's pairs
+    :param pairs: int, pairs returned by /tokens/v1
+    :param pools: int or List of pool Dicts returned by /token-pairs/v1
+    :param orders: List of paid order Dicts
+    :return: Dict
+    '''
+    pair = {
+        "baseToken": {"address": address},
+        "quoteToken": {"address": "So11111111111111111111111111111111111111112"},
+        "priceNative": "0.001",
+        "txns": {"m5": {"buys": 100, "sells": sells}, "h1": {"buys": 1200, "sells": 480},
+                 "h6": {"buys": 7200, "sells": 2880}},
+        "volume": {"m5": 1000, "h24": 50000},
+        "priceChange": {"m5": 0, "h24": 0.1},
+        "liquidity": {"usd": 200000},
+        "pairCreatedAt": time.time() * 1000,
+        "fdv": 500000,
+    }
+    return {
+        "profile": {"chainId": "solana", "tokenAddress": address,
+                    "links": [{"type": "website"}] * links},
+        "pairs": [pair] * pairs,
+        "pools": [pair] * pools if isinstance(pools, int) else list(pools),
+        "orders": list(orders),
+    }
+
+
+class StubDexScreener:
+    '''
+    Stand-in for http_client's client that answers Dex Screener requests
+    from a dict of tokens, without the network, and records every request.
+    '''
+    def __init__(self, tokens=None, statuses=None):
+        '''
+        :param tokens: Dict of token address -> make_token() Dict
+        :param statuses: Dict of URL path prefix -> status code returned instead of the data
+        '''
+        self.tokens = dict(tokens or {})
+        self.statuses = dict(statuses or {})
+        self.requests = []
+        self.on_response = None
+
+    def profiles(self):
+        return [token["profile"] for token in self.tokens.values()]
+
+    def payload(self, path):
+        parts = path.strip("/").split("/")
+        if parts[0] == "token-profiles":
+            return self.profiles()
+        if parts[0] == "tokens":
+            return [pair for address in parts[3].split(",") for pair in self.tokens.get(address, {}).get("pairs", [])]
+        token = self.tokens.get(parts[-1], {})
+        return {"token-pairs": token.get("pools", []), "orders": token.get("orders", [])}.get(parts[0], [])
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(url)
+        path = url[len(DEXSCREENER_URL):]
+        response = requests.Response()
+        response.url = url
+        response.status_code = next((status for prefix, status in self.statuses.items() if path.startswith(prefix)), 200)
+        response._content = json.dumps(self.payload(path) if response.status_code == 200 else
+                                       {"error": "stub status"}).encode()
+        if self.on_response is not None:
+            self.on_response(method, url, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+@pytest.fixture
+def dexscreener(monkeypatch):
+    '''
+    StubDexScreener installed as http_client's client.
+    '''
+    import http_client
+    stub = StubDexScreener()
+    monkeypatch.setattr(http_client, "client", stub)
+    return stub
+
+
+def fresh_scanner(monkeypatch):
+    '''
+    start_service's main module with empty caches and entry watch, and an in-memory wallet store.
+    '''
+    import main
+    from entry_watch import EntryWatch
+    from price_history import PriceHistoryStore
+    from response_cache import ResponseCache
+    from wallet_state import MemoryWalletStore, WalletState
+    monkeypatch.setattr(main, "response_cache", ResponseCache(ttls=main.response_cache.ttls))
+    monkeypatch.setattr(main, "wallet_state", WalletState(MemoryWalletStore()))
+    monkeypatch.setattr(main, "price_history", PriceHistoryStore())
+    monkeypatch.setattr(main, "entry_watch", EntryWatch(main.entry_watch.fetch_snapshots, main.entry_watch.momentum))
+    return main
+
+
+@pytest.fixture
+def scanner(monkeypatch, dexscreener):
+    '''
+    fresh_scanner(), answered by the dexscreener stub.
+    '''
+    return fresh_scanner(monkeypatch)
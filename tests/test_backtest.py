@@ -0,0 +1,93 @@
+import json
+import pytest
+from conftest import DEXSCREENER_URL, StubDexScreener, make_token
+from response_cache import ResponseCache
+
+
+def test_replays_start_from_an_empty_response_cache(scanner, dexscreener, tmp_path):
+    import backtest
+    from capture import CaptureReader, CaptureWriter
+    writer = CaptureWriter(str(tmp_path / "capture.bin"))
+    dexscreener.on_response = writer.record_response
+    dexscreener.tokens["token_a"] = make_token("token_a")
+    profiles = scanner.get_latest_tokens_dexscreener()
+    snapshots = scanner.get_pricehistory_batch_dexscreener(["token_a"])
+    assert len(scanner.filter_dexscreener_data(profiles, snapshots=snapshots, max_workers=1)) == 1
+    writer.close()
+    # The live service has since rejected the token; a replay must not see that
+    live_cache = ResponseCache(ttls=scanner.response_cache.ttls)
+    live_cache.set("rejected", "token_a", ["link_test"])
+    scanner.response_cache = live_cache
+    results = backtest.replay_filter(CaptureReader(str(tmp_path / "capture.bin")))
+    assert [[token['tokenAddress'] for token, _ in valid_tokens] for _, valid_tokens in results] == [["token_a"]]
+    assert scanner.response_cache is live_cache
+    assert live_cache.get("orders", "token_a") == (False, None)
+
+
+def test_grids_sweep_the_entry_momentum_gate(tmp_path):
+    import backtest
+    from capture import CaptureReader, CaptureWriter
+    falling, fresh = make_token("token_a"), make_token("token_b")
+    falling_before = make_token("token_a")
+    falling_before["pairs"][0] = dict(falling["pairs"][0], priceNative="0.00125")
+    writer = CaptureWriter(str(tmp_path / "capture.bin"))
+
+    def record(at, path, tokens):
+        payload = StubDexScreener({token["profile"]["tokenAddress"]: token for token in tokens}).payload(path)
+        writer.record("GET", DEXSCREENER_URL + path, 200, json.dumps(payload).encode(), captured_at=at)
+    # token_a was seen a minute before the poll that lists both tokens, 20% higher
+    record(900, "/tokens/v1/solana/token_a", [falling_before])
+    record(1000, "/token-profiles/latest/v1", [falling, fresh])
+    record(1001, "/tokens/v1/solana/token_a,token_b", [falling, fresh])
+    for token in (falling, fresh):
+        record(1002, f"/orders/v1/solana/{token['profile']['tokenAddress']}", [token])
+    # token_b had no history at the scan: the entry watch samples it again, 10% higher
+    fresh_later = make_token("token_b")
+    fresh_later["pairs"][0] = dict(fresh["pairs"][0], priceNative="0.0011")
+    record(1065, "/tokens/v1/solana/token_b", [fresh_later])
+    writer.close()
+    dataset = backtest.Dataset(CaptureReader(str(tmp_path / "capture.bin")))
+    ungated = dataset.evaluate({})
+    assert (ungated["valid"], ungated["mean_return"]) == (2, pytest.approx(0.05))
+    # token_a is rejected, token_b is bought when the watch vets it again, at the later price
+    gated = dataset.evaluate({"pricehistory.min_momentum": 0})
+    assert (gated["valid"], gated["mean_return"]) == (1, 0)
+    assert dataset.evaluate({"pricehistory.min_momentum": 0.2})["valid"] == 0
+
+
+def test_grids_reject_thresholds_the_live_rules_cannot_set(tmp_path):
+    import backtest
+    from capture import CaptureReader, CaptureWriter
+    writer = CaptureWriter(str(tmp_path / "capture.bin"))
+    writer.record("GET", DEXSCREENER_URL + "/token-profiles/latest/v1", 200, b"[]", captured_at=1000)
+    writer.close()
+    dataset = backtest.Dataset(CaptureReader(str(tmp_path / "capture.bin")))
+    with pytest.raises(ValueError, match="pricehistory.min_liquidity_usd"):
+        dataset.evaluate({"pricehistory.min_liquidity_usd": 50000})
+
+
+def test_captured_error_responses_fail_their_fetch(tmp_path):
+    import backtest
+    from capture import CaptureReader, CaptureWriter
+    tokens = {address: make_token(address) for address in ("token_a", "token_b", "token_c")}
+    stub = StubDexScreener(tokens)
+    writer = CaptureWriter(str(tmp_path / "capture.bin"))
+    bad_gateway = b"<html><body>502 Bad Gateway</body></html>"
+    # A failed poll and a failed snapshot batch before the poll the tokens are vetted in
+    writer.record("GET", DEXSCREENER_URL + "/token-profiles/latest/v1", 502, bad_gateway, captured_at=900)
+    writer.record("GET", DEXSCREENER_URL + "/tokens/v1/solana/token_a", 502, bad_gateway, captured_at=950)
+    writer.record("GET", DEXSCREENER_URL + "/token-profiles/latest/v1", 200,
+                  json.dumps(stub.payload("/token-profiles/latest/v1")).encode(), captured_at=1000)
+    path = "/tokens/v1/solana/token_a,token_b,token_c"
+    writer.record("GET", DEXSCREENER_URL + path, 200, json.dumps(stub.payload(path)).encode(), captured_at=1001)
+    # Live, both of these fail the orders test
+    writer.record("GET", DEXSCREENER_URL + "/orders/v1/solana/token_a", 429, b'{"error": "rate limited"}',
+                  captured_at=1002)
+    writer.record("GET", DEXSCREENER_URL + "/orders/v1/solana/token_b", 502, bad_gateway, captured_at=1002)
+    writer.record("GET", DEXSCREENER_URL + "/orders/v1/solana/token_c", 200, b"[]", captured_at=1002)
+    writer.close()
+    dataset = backtest.Dataset(CaptureReader(str(tmp_path / "capture.bin")))
+    assert dataset.count == 3
+    assert dataset.orders_known.tolist() == [False, False, True]
+    # Links, price history and, for token_c only, orders pass; no pools were captured
+    assert dataset.evaluate({})["valid"] == 1
@@ -0,0 +1,65 @@
+import asyncio
+from solana.rpc.async_api import AsyncClient
+from solders.signature import Signature
+from confirmation_tracker import DEFAULT_VALID_BLOCKS, ConfirmationTracker
+from mock_services import MockSolanaRpc
+
+
+class PendingSolanaRpc(MockSolanaRpc):
+    '''
+    Node that never sees the sent transactions, while the block height rises by 100 per poll.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.block_height = 10
+
+    def call(self, method, params):
+        if method == "getSignatureStatuses":
+            return {"context": {"slot": 1}, "value": [None for _ in params[0]]}
+        if method == "getBlockHeight":
+            self.block_height += 100
+            return self.block_height
+        return super().call(method, params)
+
+
+def track_and_poll(rpc, polls, **track):
+    '''
+    Tracks one transaction against a mock node and polls it.
+    :return: (tracker, future)
+    '''
+    async def run():
+        client = AsyncClient(rpc.url)
+        tracker = ConfirmationTracker(client, rebroadcast_interval=0)
+        future = tracker.track(Signature.new_unique(), b"raw transaction", **track)
+        for _ in range(polls):
+            await tracker.poll_once()
+        await client.close()
+        return tracker, future
+    rpc.start()
+    try:
+        return asyncio.run(run())
+    finally:
+        rpc.stop()
+
+
+def test_confirmed_transactions_resolve_with_their_time():
+    tracker, future = track_and_poll(MockSolanaRpc(), 1)
+    assert future.result() == "confirmed"
+    stats = tracker.stats()
+    assert (stats["confirmed"], stats["in_flight"]) == (1, 0)
+    assert stats["p50"] is not None
+
+
+def test_transactions_expire_at_their_last_valid_block_height():
+    tracker, future = track_and_poll(PendingSolanaRpc(), 2, last_valid_block_height=150)
+    assert future.result() == "expired"
+    # Rebroadcast once, at height 110, before the expiry at 210
+    assert tracker.counts["rebroadcasts"] == 1
+
+
+def test_transactions_without_an_expiry_height_still_expire():
+    polls = DEFAULT_VALID_BLOCKS // 100 + 2
+    tracker, future = track_and_poll(PendingSolanaRpc(), polls)
+    assert future.result() == "expired"
+    assert tracker.stats()["expired"] == 1
+    assert tracker.counts["rebroadcasts"] == polls - 1
@@ -0,0 +1,135 @@
+import importlib.util
+import os
+import pytest
+import http_client
+import pipeline
+import swap_executor
+from conftest import ROOT
+from function_dispatch import FunctionDispatch
+from mock_services import FunctionHost
+from wallet_state import MemoryWalletStore, WalletState
+
+USER = {"user_id": "user0", "amount_in_sol": 0.03}
+ENTRY = {'priceNative': 0.001, 'm5_buys': 100, 'm5_buysell_ratio': 2.5, 'm5_volume': 1000, 'm5_priceChange': 0}
+
+
+def reserve(wallet, tokenAddress):
+    assert wallet.try_buy(USER["user_id"], tokenAddress, 5, ENTRY)
+
+
+def load_trigger_function(directory, monkeypatch):
+    '''
+    Imports a trigger function's main.py under its own name. Its shared
+    modules are start_service's identical copies, and its executor is not
+    warmed up.
+    '''
+    monkeypatch.setattr(swap_executor.executor, "warm", lambda *args: None)
+    spec = importlib.util.spec_from_file_location(directory, os.path.join(ROOT, "functions", directory, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def functions(monkeypatch):
+    '''
+    trigger_function_1 and trigger_function_3 served over local HTTP, with
+    their swaps replaced by the results in buys and sells, keyed by token.
+    '''
+    buy = load_trigger_function("trigger_function_1", monkeypatch)
+    sell = load_trigger_function("trigger_function_3", monkeypatch)
+    buys, sells = {}, {}
+
+    def purchase_token(tokenAddress, position=None):
+        if isinstance(buys[tokenAddress], Exception):
+            raise buys[tokenAddress]
+        return buys[tokenAddress]
+    monkeypatch.setattr(buy, "purchase_token", purchase_token)
+    monkeypatch.setattr(sell, "sell_token", lambda tokenAddress, position=None: sells[tokenAddress])
+    monkeypatch.setattr(http_client, "id_token_for", lambda audience: "token")
+    hosts = FunctionHost(buy.main).start(), FunctionHost(sell.main).start()
+    yield buys, sells, hosts
+    for host in hosts:
+        host.stop()
+
+
+def make_dispatch(hosts):
+    '''
+    FunctionDispatch invoking the hosted functions the way main() does.
+    '''
+    wallet = WalletState(MemoryWalletStore())
+    user = dict(USER, function_trigger_1=hosts[0].url, function_trigger_3=hosts[1].url)
+    invoke = lambda function_url, position: http_client.invoke_function(function_url, position.to_json())
+    dispatch = FunctionDispatch(lambda addresses: {}, wallet, invoke, {user["user_id"]: user}, workers=2)
+    dispatch.start()
+    return dispatch, wallet, user
+
+
+def test_function_mode_watches_only_confirmed_buys(functions):
+    buys, _, hosts = functions
+    buys.update(token_a={"outcome": "confirmed"}, token_b={"outcome": "expired"}, token_c=None)
+    dispatch, wallet, user = make_dispatch(hosts)
+    for tokenAddress in buys:
+        reserve(wallet, tokenAddress)
+        dispatch.trigger_buy(user, tokenAddress, ENTRY)
+    dispatch.stop()
+    assert hosts[0].stats() == {"calls": 3, "refused": 0}
+    assert set(dispatch.monitor.positions) == {("user0", "token_a")}
+    assert wallet.holdings("user0") == {"token_a"}
+
+
+def test_function_mode_watches_buys_without_a_known_outcome(functions):
+    buys, _, hosts = functions
+    # The function fails after the swap was sent, so it may still land
+    buys["token_a"] = RuntimeError("connection reset while confirming")
+    dispatch, wallet, user = make_dispatch(hosts)
+    reserve(wallet, "token_a")
+    dispatch.trigger_buy(user, "token_a", ENTRY)
+    dispatch.stop()
+    # Not retried, a second call could buy twice
+    assert hosts[0].calls == 1
+    assert set(dispatch.monitor.positions) == {("user0", "token_a")}
+    assert wallet.holdings("user0") == {"token_a"}
+
+
+def test_function_mode_frees_the_wallet_slot_once_the_sell_landed(functions):
+    _, sells, hosts = functions
+    sells.update(token_a={"signature": "signature", "outcome": "confirmed"}, token_b={"error": "no balance"},
+                 token_c={"signature": "signature", "outcome": "expired"})
+    dispatch, wallet, _ = make_dispatch(hosts)
+    for tokenAddress in sells:
+        reserve(wallet, tokenAddress)
+        dispatch.dispatch_sell(tokenAddress, ENTRY, None, "user0")
+    dispatch.stop()
+    assert wallet.holdings("user0") == {"token_c"}
+    # The unconfirmed sell is watched again, so the next tick retries it
+    assert set(dispatch.monitor.positions) == {("user0", "token_c")}
+
+
+def test_pipeline_watches_only_confirmed_buys(monkeypatch):
+    outcomes = {"token_a": "confirmed", "token_b": "failed"}
+    monkeypatch.setattr(pipeline, "buy_position", lambda position, key, confirm: {
+        "signature": "signature", "outcome": outcomes[position.tokenAddress]})
+    wallet = WalletState(MemoryWalletStore())
+    stages = pipeline.Pipeline(lambda addresses: {}, wallet, {"user0": "key"}, buy_workers=2)
+    stages.start()
+    for tokenAddress in outcomes:
+        reserve(wallet, tokenAddress)
+        stages.enqueue_buy(USER, tokenAddress, ENTRY)
+    stages.stop()
+    assert set(stages.monitor.positions) == {("user0", "token_a")}
+    assert wallet.holdings("user0") == {"token_a"}
+
+
+def test_pipeline_frees_the_wallet_slot_once_the_sell_confirmed(monkeypatch):
+    results = {"token_a": {"signature": "signature", "outcome": "confirmed"}, "token_b": {"error": "no balance"},
+               "token_c": {"signature": "signature", "outcome": "expired"}}
+    monkeypatch.setattr(pipeline, "sell_positions", lambda positions, key, confirm: {
+        position.tokenAddress: results[position.tokenAddress] for position in positions})
+    wallet = WalletState(MemoryWalletStore())
+    stages = pipeline.Pipeline(lambda addresses: {}, wallet, {"user0": "key"})
+    for tokenAddress in results:
+        reserve(wallet, tokenAddress)
+    stages.sell("user0", [pipeline.PositionRecord("user0", tokenAddress, ENTRY) for tokenAddress in results])
+    assert wallet.holdings("user0") == {"token_c"}
+    assert set(stages.monitor.positions) == {("user0", "token_c")}
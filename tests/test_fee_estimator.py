@@ -0,0 +1,96 @@
+import time
+import pytest
+from fee_estimator import FeeEstimator
+from mock_services import SOL_MINT, MockJupiter, MockSolanaRpc
+from swap_executor import pool_accounts
+
+# Nearest-rank 75th percentile of the mock node's fees, 10 to 1500 over 150 slots
+NETWORK_FEE = 1130
+POOL_FEE = NETWORK_FEE * 5
+
+
+@pytest.fixture
+def rpc():
+    rpc = MockSolanaRpc()
+    rpc.start()
+    yield rpc
+    rpc.stop()
+
+
+def sampled(rpc, *accounts, **options):
+    fees = FeeEstimator(rpc.url, min_price=0, **options)
+    fees.watch(*accounts)
+    fees.sample()
+    return fees
+
+
+def test_pool_accounts_are_read_from_the_route():
+    quote = {"inputMint": SOL_MINT, "outputMint": "token_a", "routePlan": [
+        {"swapInfo": {"ammKey": "pool_a"}}, {"swapInfo": {"ammKey": "pool_b"}}, {"swapInfo": {"ammKey": "pool_a"}}]}
+    assert pool_accounts(quote) == ["pool_a", "pool_b"]
+    assert pool_accounts({"inputMint": SOL_MINT, "outputMint": "token_a", "routePlan": []}) == []
+
+
+def test_mock_jupiter_routes_each_token_through_its_own_pool():
+    jupiter = MockJupiter()
+    buy = jupiter.handle("GET", f"/swap/v1/quote?inputMint={SOL_MINT}&outputMint=token_a&amount=10", None)[1]
+    sell = jupiter.handle("GET", f"/swap/v1/quote?inputMint=token_a&outputMint={SOL_MINT}&amount=10", None)[1]
+    other = jupiter.handle("GET", f"/swap/v1/quote?inputMint={SOL_MINT}&outputMint=token_b&amount=10", None)[1]
+    assert pool_accounts(buy) == pool_accounts(sell) != pool_accounts(other)
+
+
+def test_busy_pools_raise_the_bid_over_the_network(rpc):
+    fees = sampled(rpc, "pool_a")
+    assert fees.fee_for() == NETWORK_FEE
+    assert fees.fee_for("pool_a") == POOL_FEE
+    # A pool that was never sampled bids the network's estimate
+    assert fees.fee_for("pool_b") == NETWORK_FEE
+    assert (fees.counts["account"], fees.counts["network"]) == (1, 2)
+
+
+def test_quiet_pools_never_lower_the_bid_below_the_network(rpc):
+    rpc.local_fee_multiplier = 0.5
+    fees = sampled(rpc, "pool_a")
+    assert fees.fee_for("pool_a") == NETWORK_FEE
+    assert fees.counts["network"] == 1
+
+
+def test_bids_are_clamped(rpc):
+    fees = sampled(rpc, "pool_a", max_price=2000)
+    assert fees.fee_for("pool_a") == 2000
+    fees.min_price, fees.max_price = 10000, 100000
+    assert fees.fee_for() == 10000
+
+
+def test_stale_estimates_fall_back(rpc):
+    fees = sampled(rpc, "pool_a", ttl=0)
+    assert fees.fee_for("pool_a") is None
+    assert fees.counts["fallback"] == 1
+
+
+def test_landing_rate_per_fee_level():
+    fees = FeeEstimator("http://unused")
+    for outcome in ("confirmed", "confirmed", "confirmed", "expired"):
+        fees.record_landing(POOL_FEE, outcome, 1.5)
+    fees.record_landing(None, "failed", 0.5)
+    landings = fees.stats()["landings"]
+    assert (landings["1e3"]["sent"], landings["1e3"]["landing_rate"], landings["1e3"]["p50"]) == (4, 0.75, 1.5)
+    assert landings["fallback"]["landing_rate"] == 0
+
+
+def test_swaps_sample_their_own_pools_on_demand(rpc):
+    fees = FeeEstimator(rpc.url, min_price=0)
+    # No background sampler: the first swap through a pool samples it before bidding
+    assert fees.estimate("pool_a") == POOL_FEE
+    assert fees.estimate("pool_a") == POOL_FEE
+    assert fees.counts["samples"] == 1
+    assert fees.stats()["fallback_rate"] == 0
+
+
+def test_slow_samples_time_out_to_the_fallback(rpc):
+    rpc.latency = 1.0
+    fees = FeeEstimator(rpc.url, min_price=0, sample_timeout=0.1)
+    start = time.monotonic()
+    assert fees.estimate("pool_a") is None
+    assert time.monotonic() - start < 0.5
+    assert (fees.counts["sample_errors"], fees.stats()["fallback_rate"]) == (1, 1.0)
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+import http_client
+
+
+def test_orders_endpoint_has_its_own_bucket():
+    client = http_client.HttpClient()
+    orders = client.bucket_for("https://api.dexscreener.com/orders/v1/solana/token_a")
+    assert orders is client.buckets["dexscreener_orders"]
+    assert orders.rate == 1.0
+    assert client.bucket_for("https://api.dexscreener.com/tokens/v1/solana/token_a") is client.buckets["dexscreener"]
+    assert client.bucket_for("https://api.dexscreener.com/token-profiles/latest/v1") is \
+        client.buckets["dexscreener_profiles"]
+
+
+def jupiter_client(monkeypatch, rate_limits):
+    '''
+    HttpClient answering every request with an empty quote, and the URLs it sent.
+    '''
+    client = http_client.HttpClient(rate_limits=rate_limits)
+    sent = []
+
+    def request(method, url, **kwargs):
+        sent.append(url)
+        response = requests.Response()
+        response.status_code, response._content = 200, b'{"routePlan": []}'
+        return response
+    monkeypatch.setattr(client.session, "request", request)
+    return client, sent
+
+
+def test_low_priority_requests_leave_the_reserve_to_the_others(monkeypatch):
+    client, sent = jupiter_client(monkeypatch, {"jupiter": (0.001, 3)})
+    url = "https://api.jup.ag/swap/v1/quote"
+    client.get(url, reserve=1)
+    client.get(url, reserve=1)
+    with pytest.raises(http_client.RateLimited):
+        client.get(url, reserve=1)
+    # The token kept in reserve still serves a normal request without waiting
+    client.get(url)
+    assert len(sent) == 3
+
+
+def test_quote_prefetches_are_capped_and_spend_their_own_budget(monkeypatch, scanner):
+    from quote_cache import QuoteCache
+    client, sent = jupiter_client(monkeypatch, {"jupiter": (0.001, 5)})
+    monkeypatch.setattr(http_client, "client", client)
+    monkeypatch.setattr(scanner, "prefetch_budget", http_client.TokenBucket(0.001, 2))
+    monkeypatch.setattr(scanner, "quote_cache", QuoteCache(scanner.get_jupiter_swap_quote,
+                                                           prefetch_quote=scanner.prefetch_jupiter_swap_quote))
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        on_candidate = scanner.prefetch_candidates(executor, [100, 200], on_quote=lambda quote: release.wait(5),
+                                                   max_tokens=1)
+        for tokenAddress in ("token_a", "token_b"):
+            on_candidate({"tokenAddress": tokenAddress})
+        release.set()
+    # token_b came while token_a was still being prefetched
+    assert [url.split("outputMint=")[1].split("&")[0] for url in sent] == ["token_a", "token_a"]
+    # Both prefetch requests are spent, yet the buy path's quotes go out
+    scanner.prefetch_quotes("token_c", [100])
+    scanner.quote_cache.get(scanner.SOL_MINT, "token_d", 100)
+    assert len(sent) == 3
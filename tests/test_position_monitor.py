@@ -0,0 +1,99 @@
+from position_monitor import PositionMonitor, exit_conditions_met
+from price_history import PriceHistoryStore
+from token_snapshot import TokenSnapshot
+
+ENTRY = {"priceNative": 1.0, "m5_buys": 100, "m5_buysell_ratio": 2.0, "m5_volume": 1000}
+
+
+def snapshot(tokenAddress="token_a", price=1.0, m5_buys=100, m5_sells=50, volume=1000):
+    return TokenSnapshot(tokenAddress, "sol", price, m5_buys, m5_sells, 1200, 480, 7200, 2880, volume_m5=volume)
+
+
+# Below the price floor with m5 buys, buy/sell ratio and m5 volume all under their entry values
+FALLING = dict(price=0.9, m5_buys=50, m5_sells=50, volume=500)
+
+
+class Market:
+    '''
+    fetch_snapshots and dispatch_sell of a PositionMonitor, recording the lookups and the sells.
+    '''
+    def __init__(self, **snapshots):
+        self.snapshots = snapshots
+        self.lookups = []
+        self.sells = []
+        self.failing = set()
+
+    def fetch_snapshots(self, addresses):
+        self.lookups.append(list(addresses))
+        return {address: [self.snapshots[address]] for address in addresses if address in self.snapshots}
+
+    def dispatch_sell(self, tokenAddress, tokenMetadata, tokenLiveData, user_id):
+        if tokenAddress in self.failing:
+            raise RuntimeError("stub dispatch failure")
+        self.sells.append((user_id, tokenAddress, tokenLiveData.priceNative))
+
+
+def monitor_for(market, **options):
+    return PositionMonitor(market.fetch_snapshots, market.dispatch_sell, **options)
+
+
+def test_every_exit_condition_has_to_fail_to_sell():
+    assert exit_conditions_met(ENTRY, snapshot(**FALLING))
+    for healthy in (dict(price=0.92), dict(m5_buys=100), dict(m5_sells=25), dict(volume=1000)):
+        assert not exit_conditions_met(ENTRY, snapshot(**dict(FALLING, **healthy))), healthy
+    # No sells in the window is a healthy ratio
+    assert not exit_conditions_met(ENTRY, snapshot(**dict(FALLING, m5_sells=0)))
+
+
+def test_exits_are_sold_once_and_held_positions_stay():
+    market = Market(token_a=snapshot("token_a", **FALLING), token_b=snapshot("token_b"))
+    monitor = monitor_for(market)
+    monitor.add_position("token_a", ENTRY, user_id="user0")
+    monitor.add_position("token_b", ENTRY, user_id="user0")
+    assert monitor.tick() == [("user0", "token_a")]
+    assert market.sells == [("user0", "token_a", 0.9)]
+    assert not monitor.has_position("token_a", user_id="user0")
+    assert monitor.has_position("token_b", user_id="user0")
+    assert monitor.tick() == []
+    assert market.lookups == [["token_a", "token_b"], ["token_b"]]
+
+
+def test_a_token_held_by_several_users_is_looked_up_once_and_sold_for_each():
+    market = Market(token_a=snapshot("token_a", **FALLING))
+    monitor = monitor_for(market)
+    for user_id in ("user0", "user1"):
+        monitor.add_position("token_a", ENTRY, user_id=user_id)
+    assert sorted(monitor.tick()) == [("user0", "token_a"), ("user1", "token_a")]
+    assert market.lookups == [["token_a"]]
+
+
+def test_failed_dispatches_keep_the_position_for_the_next_tick():
+    market = Market(token_a=snapshot("token_a", **FALLING))
+    market.failing.add("token_a")
+    monitor = monitor_for(market)
+    monitor.add_position("token_a", ENTRY, user_id="user0")
+    assert monitor.tick() == []
+    assert monitor.has_position("token_a", user_id="user0")
+    market.failing.clear()
+    assert monitor.tick() == [("user0", "token_a")]
+
+
+def test_missing_and_malformed_snapshots_are_skipped():
+    market = Market(token_b=snapshot("token_b", price=None))
+    monitor = monitor_for(market)
+    monitor.add_position("token_a", ENTRY)
+    monitor.add_position("token_b", ENTRY)
+    assert monitor.tick() == []
+    assert monitor.has_position("token_a") and monitor.has_position("token_b")
+
+
+def test_the_trailing_stop_sells_a_drawdown_from_the_high():
+    history = PriceHistoryStore()
+    for at, price in ((0, 1.0), (10, 2.0), (20, 1.7)):
+        history.update("token_a", snapshot(price=price), at=at)
+    # 15% below the high of 2.0, while the exit conditions hold
+    market = Market(token_a=snapshot(price=1.7))
+    for trailing_stop, sold in ((0.2, []), (0, []), (0.1, [(None, "token_a")])):
+        monitor = monitor_for(market, price_history=history, trailing_stop=trailing_stop)
+        monitor.add_position("token_a", ENTRY)
+        assert monitor.tick() == sold, trailing_stop
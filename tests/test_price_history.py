@@ -0,0 +1,94 @@
+import math
+import time
+import numpy as np
+import scoring
+from conftest import make_token
+from entry_watch import EntryWatch
+from price_history import PriceHistory, PriceHistoryStore
+from token_snapshot import decode_pairs
+
+
+def add_prices(history, samples):
+    for at, price in samples:
+        history.add(at, price)
+
+
+def test_momentum_looks_back_a_time_window_whatever_the_sampling_rate():
+    sparse, dense = PriceHistory(momentum_window=60), PriceHistory(momentum_window=60)
+    add_prices(sparse, [(0, 1.0), (30, 1.1), (60, 1.2)])
+    add_prices(dense, [(at, 1.0 + at / 300) for at in range(0, 61, 5)])
+    assert math.isclose(sparse.momentum, 0.2)
+    assert math.isclose(dense.momentum, 0.2)
+
+
+def test_momentum_compares_with_the_latest_sample_old_enough():
+    history = PriceHistory(momentum_window=60)
+    add_prices(history, [(0, 1.0), (10, 2.0), (75, 3.0)])
+    assert math.isclose(history.momentum, 0.5)
+
+
+def test_momentum_is_unknown_until_the_history_spans_the_window():
+    history = PriceHistory(capacity=5, momentum_window=60)
+    add_prices(history, [(at, 1.0) for at in range(0, 50, 10)])
+    assert history.momentum is None
+    # Once full, the oldest samples drop out: 5 samples 10s apart never span 60s
+    add_prices(history, [(at, 1.0) for at in range(50, 200, 10)])
+    assert history.momentum is None
+
+
+def test_batch_scoring_gates_on_momentum_and_holds_back_unknown_momentum():
+    tokens = [make_token(address) for address in ("token_a", "token_b", "token_c")]
+    columns = scoring.pricehistory_columns([decode_pairs(token["pairs"]) for token in tokens],
+                                           momentum=[None, -0.1, 0.1])
+    verdicts, masks = scoring.score_pricehistory_columns(columns, min_momentum=0)
+    assert masks['momentum'].tolist() == [False, False, True]
+    assert verdicts.tolist() == [False, False, True]
+    assert scoring.momentum_pending(columns, masks).tolist() == [True, False, False]
+    # With the gate off, unknown momentum passes and nothing waits on it
+    verdicts, masks = scoring.score_pricehistory_columns(columns)
+    assert np.all(verdicts)
+    assert not np.any(scoring.momentum_pending(columns, masks))
+
+
+def test_batch_and_token_by_token_scans_apply_the_momentum_rule_alike(scanner, dexscreener):
+    dexscreener.tokens.update((address, make_token(address)) for address in ("token_a", "token_b", "token_c"))
+    # token_a fell 20% over the last minute, token_b rose 20%, token_c has not been seen for a minute yet
+    for address, change in (("token_a", 0.8), ("token_b", 1.2)):
+        snapshot = decode_pairs(dexscreener.tokens[address]["pairs"])[0]
+        add_prices(scanner.price_history.update(address, snapshot, at=0), [(60, snapshot.priceNative * change)])
+    plan = scanner.compile_rule_plan([dict(scanner.DEFAULT_USER_SETTINGS, user_id="user0",
+                                           rules={"pricehistory.min_momentum": 0})])
+    profiles = dexscreener.profiles()
+    snapshots = {address: decode_pairs(token["pairs"]) for address, token in dexscreener.tokens.items()}
+    for batch_scoring in (False, True):
+        valid = scanner.filter_dexscreener_data(profiles, snapshots=snapshots, max_workers=2, plan=plan,
+                                                batch_scoring=batch_scoring)
+        assert [token['tokenAddress'] for token, _ in valid] == ["token_b"]
+        assert list(scanner.entry_watch.tokens) == ["token_c"]
+
+
+def test_the_entry_watch_samples_undecided_tokens_until_the_gate_can_judge_them(scanner, dexscreener, monkeypatch):
+    monkeypatch.setattr(scanner, "price_history", PriceHistoryStore(momentum_window=0.05))
+    dexscreener.tokens.update((address, make_token(address)) for address in ("token_a", "token_b"))
+    plan = scanner.compile_rule_plan([dict(scanner.DEFAULT_USER_SETTINGS, user_id="user0",
+                                           rules={"pricehistory.min_momentum": 0})])
+    vetted = []
+    scanner.entry_watch.vet = lambda profiles, snapshots: vetted.extend(
+        scanner.filter_dexscreener_data(profiles, snapshots=snapshots, max_workers=2, plan=plan))
+    snapshots = scanner.get_pricehistory_batch_dexscreener(["token_a", "token_b"])
+    assert scanner.filter_dexscreener_data(dexscreener.profiles(), snapshots=snapshots, plan=plan) == []
+    # Nothing is known a window later than the first samples until the watch samples again
+    assert scanner.entry_watch.tick() == []
+    time.sleep(0.06)
+    dexscreener.tokens["token_a"]["pairs"] = [dict(dexscreener.tokens["token_a"]["pairs"][0], priceNative="0.0008")]
+    scanner.entry_watch.tick()
+    assert [token['tokenAddress'] for token, _ in vetted] == ["token_b"]
+    assert scanner.entry_watch.stats() == {"watched": 2, "vetted": 2, "expired": 0, "refused": 0, "watching": 0}
+
+
+def test_the_entry_watch_drops_tokens_it_cannot_judge_in_time():
+    watch = EntryWatch(lambda tokenAddresses: {}, lambda tokenAddress: None, max_age=60)
+    watch.add({"tokenAddress": "token_a"})
+    assert watch.tick(now=time.monotonic()) == []
+    assert watch.tick(now=time.monotonic() + 60) == []
+    assert watch.stats()["expired"] == 1 and not watch.tokens
@@ -0,0 +1,25 @@
+import base64
+import sys
+from types import SimpleNamespace
+from solders.keypair import Keypair
+
+
+class SecretManager:
+    '''
+    Secret Manager client serving the secret versions Terraform wrote.
+    '''
+    versions = {}
+
+    def access_secret_version(self, name):
+        return SimpleNamespace(payload=SimpleNamespace(data=self.versions[name]))
+
+
+def test_pipeline_mode_reads_the_key_terraform_stored(monkeypatch, scanner):
+    keypair = Keypair()
+    name = "projects/project/secrets/user-private-keys/versions/1"
+    # modules/user_service/main.tf stores secret_data = base64encode(var.private_key)
+    monkeypatch.setattr(SecretManager, "versions", {name: base64.b64encode(str(keypair).encode())})
+    monkeypatch.setitem(sys.modules, "google.cloud.secretmanager",
+                        SimpleNamespace(SecretManagerServiceClient=SecretManager))
+    key = scanner.load_private_key({"user_id": "user0", "private_key_secret": name})
+    assert Keypair.from_base58_string(key).pubkey() == keypair.pubkey()
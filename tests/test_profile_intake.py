@@ -0,0 +1,66 @@
+from profile_intake import ProfileIntake
+
+
+def profile(address, links=2):
+    return {"chainId": "solana", "tokenAddress": address, "links": [{"type": "website"}] * links}
+
+
+def intake_for(*polls, **options):
+    '''
+    ProfileIntake whose feed returns each of polls in turn.
+    '''
+    feed = iter(polls)
+    return ProfileIntake(lambda: next(feed), **options)
+
+
+def addresses(profiles):
+    return [profile["tokenAddress"] for profile in profiles]
+
+
+def test_only_new_and_changed_profiles_are_passed_on():
+    intake = intake_for([profile("token_a"), profile("token_b")],
+                        [profile("token_a"), profile("token_b", links=3), profile("token_c")],
+                        [profile("token_a"), profile("token_b", links=3), profile("token_c")])
+    assert addresses(intake.poll()) == ["token_a", "token_b"]
+    assert addresses(intake.poll()) == ["token_b", "token_c"]
+    assert intake.poll() == []
+    assert intake.stats() == {"polls": 3, "yielded": 4, "seen": 3, "interval": 10}
+
+
+def test_the_same_address_on_another_chain_is_another_profile():
+    intake = intake_for([profile("token_a")], [profile("token_a"), dict(profile("token_a"), chainId="base")])
+    intake.poll()
+    assert [fresh["chainId"] for fresh in intake.poll()] == ["base"]
+
+
+def test_least_recently_listed_profiles_are_forgotten_past_max_seen():
+    intake = intake_for([profile("token_a"), profile("token_b")], [profile("token_c")], [profile("token_a")],
+                        max_seen=2)
+    intake.poll()
+    intake.poll()
+    assert addresses(intake.poll()) == ["token_a"]
+    assert intake.stats()["seen"] == 2
+
+
+def test_polls_speed_up_with_new_listings_and_slow_down_when_quiet_or_failing():
+    intake = intake_for([profile("token_a")], [profile("token_a")], "Error: 429", [profile("token_a")],
+                        [profile("token_b")], [profile("token_c")], [profile("token_d")],
+                        min_interval=5, max_interval=30)
+    intervals = []
+    for _ in range(7):
+        intake.poll()
+        intervals.append(intake.interval)
+    # Halved after new listings and doubled after an unchanged or failed poll, within [5, 30]
+    assert intervals == [5, 10, 20, 30, 15, 7.5, 5]
+
+
+def test_the_stream_yields_non_empty_batches_until_stopped():
+    intake = intake_for([profile("token_a")], [profile("token_a")], [profile("token_b")],
+                        min_interval=0, max_interval=0)
+    batches = []
+    for fresh in intake.stream():
+        batches.append(addresses(fresh))
+        if len(batches) == 2:
+            intake.stop()
+    assert batches == [["token_a"], ["token_b"]]
+    assert intake.stats()["polls"] == 3
@@ -0,0 +1,39 @@
+from quote_cache import QuoteCache
+
+
+def make_cache(ttl=3.0):
+    fetched = []
+
+    def fetch_quote(from_token_mint, to_token_mint, amount, slippage_bps):
+        fetched.append((from_token_mint, to_token_mint, amount))
+        return {"outAmount": len(fetched)}
+    return QuoteCache(fetch_quote, ttl=ttl), fetched
+
+
+def test_prefetch_hits_count_the_first_use_of_a_prefetched_quote():
+    cache, fetched = make_cache()
+    cache.prefetch("sol", "token_a", 100)
+    assert cache.get("sol", "token_a", 100) == {"outAmount": 1}
+    assert cache.get("sol", "token_a", 100) == {"outAmount": 1}
+    stats = cache.stats()
+    assert (stats["prefetched"], stats["prefetch_hits"], stats["hits"]) == (1, 1, 2)
+    assert stats["prefetch_hit_rate"] == 1.0
+    assert len(fetched) == 1
+
+
+def test_reuse_of_quotes_fetched_on_a_miss_is_not_a_prefetch_hit():
+    cache, fetched = make_cache()
+    cache.get("sol", "token_a", 100)
+    cache.get("sol", "token_a", 100)
+    cache.prefetch("sol", "token_b", 100)
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["prefetch_hits"]) == (1, 1, 0)
+    assert stats["prefetch_hit_rate"] == 0.0
+
+
+def test_expired_prefetched_quotes_are_fetched_again():
+    cache, fetched = make_cache(ttl=-1)
+    cache.prefetch("sol", "token_a", 100)
+    assert cache.get("sol", "token_a", 100) == {"outAmount": 2}
+    stats = cache.stats()
+    assert (stats["expired"], stats["prefetch_hits"]) == (1, 0)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+import pytest
+import response_cache
+from response_cache import ResponseCache
+from test_scanner import vet
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''
+    Monotonic clock of the cache, moved by hand: clock.now += seconds.
+    '''
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_entries_expire_after_their_endpoints_ttl(clock):
+    cache = ResponseCache(ttls={"pool": 900, "orders": 600})
+    cache.set("pool", "token_a", [1])
+    cache.set("orders", "token_a", [2])
+    cache.set("other", "token_a", [3])
+    clock.now += 599
+    assert [cache.get(endpoint, "token_a") for endpoint in ("pool", "orders", "other")] == \
+        [(True, [1]), (True, [2]), (False, None)]
+    clock.now += 1
+    assert cache.get("orders", "token_a") == (False, None)
+    assert cache.get("pool", "token_a") == (True, [1])
+    clock.now += 300
+    assert cache.get("pool", "token_a") == (False, None)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == \
+        ({"pool": 2, "orders": 1}, {"other": 1, "orders": 1, "pool": 1}, 0, 0)
+
+
+def test_least_recently_used_entries_are_evicted_past_the_memory_budget(clock):
+    # Each value is 3 bytes of JSON, so the cache holds three
+    cache = ResponseCache(ttls={}, max_bytes=9)
+    for key in ("token_a", "token_b", "token_c"):
+        cache.set("pool", key, [1])
+    assert cache.get("pool", "token_a") == (True, [1])
+    cache.set("pool", "token_d", [1])
+    assert cache.get("pool", "token_b") == (False, None)
+    assert all(cache.get("pool", key)[0] for key in ("token_a", "token_c", "token_d"))
+    # Values bigger than the whole budget are not cached and evict nothing
+    cache.set("pool", "token_e", list(range(10)))
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (3, 9, 1)
+
+
+def test_fetch_failures_are_not_cached(clock):
+    cache = ResponseCache(ttls={"pool": 900})
+
+    def fail():
+        raise ValueError("stub failure")
+    with pytest.raises(ValueError):
+        cache.get_or_fetch("pool", "token_a", fail)
+    assert cache.get_or_fetch("pool", "token_a", lambda: [1]) == [1]
+    assert cache.get_or_fetch("pool", "token_a", fail) == [1]
+
+
+def test_negative_cached_tokens_are_not_vetted_again_until_they_expire(scanner, dexscreener, clock):
+    vet(scanner, dexscreener, token_a=dict(links=0, pools=0))
+    assert scanner.response_cache.get("rejected", "token_a")[0]
+
+    def token_requests():
+        return [url for url in dexscreener.requests if "/token-pairs/" in url or "/orders/" in url]
+    dexscreener.requests.clear()
+    valid, _ = vet(scanner, dexscreener)
+    assert valid == [] and token_requests() == []
+    # Past REJECTED_CACHE_TTL the token is vetted, and rejected, again
+    clock.now += scanner.response_cache.ttls["rejected"]
+    valid, _ = vet(scanner, dexscreener)
+    assert valid == [] and token_requests() != []
+    assert scanner.response_cache.get("rejected", "token_a") == (True, ["link_test", "pool_test"])
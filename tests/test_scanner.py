@@ -0,0 +1,124 @@
+import inspect
+import pytest
+from conftest import fresh_scanner, make_token
+
+
+def vet(scanner, dexscreener, **tokens):
+    dexscreener.tokens.update((address, make_token(address, **options)) for address, options in tokens.items())
+    profiles = dexscreener.profiles()
+    snapshots = scanner.get_pricehistory_batch_dexscreener([profile['tokenAddress'] for profile in profiles])
+    return scanner.filter_dexscreener_data(profiles, snapshots=snapshots, max_workers=2), snapshots
+
+
+def test_structural_failure_tipped_over_by_a_transient_one_is_not_negative_cached(scanner, dexscreener):
+    # Fails the link test and, without any pairs, the price history test
+    valid, _ = vet(scanner, dexscreener, token_a=dict(links=0, pairs=0))
+    assert valid == []
+    assert scanner.response_cache.get("rejected", "token_a") == (False, None)
+
+
+def test_structural_failures_alone_are_negative_cached(scanner, dexscreener):
+    valid, _ = vet(scanner, dexscreener, token_a=dict(links=0, pools=0))
+    assert valid == []
+    assert scanner.response_cache.get("rejected", "token_a") == (True, ["link_test", "pool_test"])
+
+
+def test_failed_orders_request_fails_the_test_instead_of_the_scan(scanner, dexscreener):
+    dexscreener.statuses["/orders/"] = 429
+    valid, _ = vet(scanner, dexscreener, token_a=dict())
+    assert valid == []
+    assert scanner.get_orderspaid_dexscreener("token_a") is None
+    # The failure was not cached: the next scan fetches the orders again
+    del dexscreener.statuses["/orders/"]
+    valid, _ = vet(scanner, dexscreener)
+    assert [token['tokenAddress'] for token, _ in valid] == ["token_a"]
+
+
+def test_batch_scoring_treats_failed_requests_like_the_scan(scanner, dexscreener):
+    dexscreener.statuses.update({"/orders/": 500, "/token-pairs/": 429})
+    dexscreener.tokens.update((address, make_token(address, links=0)) for address in ("token_a", "token_b"))
+    profiles = dexscreener.profiles()
+    snapshots = scanner.get_pricehistory_batch_dexscreener([profile['tokenAddress'] for profile in profiles])
+    assert scanner.filter_dexscreener_data(profiles, snapshots=snapshots, batch_scoring=True) == []
+
+
+def make_users(scanner, count, **settings):
+    return [dict(scanner.DEFAULT_USER_SETTINGS, user_id=f"user{index}", **settings) for index in range(count)]
+
+
+def scan_and_fan_out(scanner, dexscreener, users):
+    '''
+    One cycle of main(): the batched snapshots, the scan under every user's rule set, then the fan-out.
+    :return: (buys, requests sent)
+    '''
+    sent = len(dexscreener.requests)
+    profiles = dexscreener.profiles()
+    snapshots = scanner.get_pricehistory_batch_dexscreener([profile['tokenAddress'] for profile in profiles])
+    valid_tokens = scanner.filter_dexscreener_data(profiles, snapshots=snapshots, max_workers=2,
+                                                   plan=scanner.compile_rule_plan(users))
+    buys = scanner.fan_out_tokens(valid_tokens, snapshots, users, lambda *args: None)
+    return buys, len(dexscreener.requests) - sent
+
+
+def test_extra_users_add_no_requests(monkeypatch, dexscreener):
+    dexscreener.tokens.update((f"token_{index}", make_token(f"token_{index}", links=index % 3))
+                              for index in range(40))
+    requests_per_cycle = []
+    for count in (1, 10, 50):
+        # Every run starts from cold caches, like the first cycle of a new service
+        with monkeypatch.context() as patch:
+            scanner = fresh_scanner(patch)
+            buys, sent = scan_and_fan_out(scanner, dexscreener, make_users(scanner, count, wallet_limit=100))
+        assert len(buys) == count * len([buy for buy in buys if buy[0] == "user0"]) > 0
+        requests_per_cycle.append(sent)
+    assert requests_per_cycle[0] == requests_per_cycle[1] == requests_per_cycle[2]
+
+
+def test_users_with_their_own_rules_add_few_requests(monkeypatch, dexscreener):
+    dexscreener.tokens.update((f"token_{index}", make_token(f"token_{index}", links=index % 3))
+                              for index in range(40))
+    with monkeypatch.context() as patch:
+        scanner = fresh_scanner(patch)
+        _, shared = scan_and_fan_out(scanner, dexscreener, make_users(scanner, 1))
+    with monkeypatch.context() as patch:
+        scanner = fresh_scanner(patch)
+        users = [dict(user, rules={"pool.min_liquidity_usd": 1000 * (index + 1)})
+                 for index, user in enumerate(make_users(scanner, 20))]
+        buys, sent = scan_and_fan_out(scanner, dexscreener, users)
+    # Stricter rules can only add the pool and orders requests the shared rule set skipped,
+    # whatever the number of users
+    assert shared <= sent <= 2 + 2 * len(dexscreener.tokens)
+    assert {user_id for user_id, _ in buys} == {user['user_id'] for user in users}
+
+
+def test_fan_out_skips_tokens_without_entry_values(scanner):
+    from token_snapshot import decode_pairs
+    tokens = {address: make_token(address, sells=sells) for address, sells in
+              (("token_a", 40), ("token_b", 0), ("token_c", 40))}
+    snapshots = {address: decode_pairs(token["pairs"]) for address, token in tokens.items()}
+    snapshots["token_c"] = []
+    valid_tokens = [(token["profile"], {"default": ["link_test"]}) for token in tokens.values()]
+    bought = []
+    buys = scanner.fan_out_tokens(valid_tokens, snapshots, make_users(scanner, 2),
+                                  lambda user, tokenAddress, tokenMetadata: bought.append(tokenAddress))
+    assert buys == [("user0", "token_a"), ("user1", "token_a")]
+    assert bought == ["token_a", "token_a"]
+    assert scanner.wallet_state.holdings("user0") == {"token_a"}
+
+
+def test_rules_the_checks_do_not_read_are_rejected(scanner):
+    # check_pricehistory_dexscreener takes min_liquidity_usd but neither it nor its scorer reads it
+    with pytest.raises(ValueError, match="pricehistory.min_liquidity_usd"):
+        scanner.compile_rule_plan(make_users(scanner, 1, rules={"pricehistory.min_liquidity_usd": 50000}))
+    with pytest.raises(ValueError, match="volume.min_m5_volume"):
+        scanner.compile_rule_plan(make_users(scanner, 1, rules={"volume.min_m5_volume": 100}))
+
+
+def test_rule_thresholds_are_read_by_the_batch_scorers_with_the_same_defaults(scanner):
+    import scoring
+    scorers = {'pool_test': scoring.score_pool_columns, 'orders_test': scoring.score_orders_columns,
+               'pricehistory_test': scoring.score_pricehistory_columns}
+    for test, (_, defaults) in scanner.rule_tests().items():
+        if test in scorers:
+            parameters = inspect.signature(scorers[test]).parameters
+            assert {name: parameters[name].default for name in defaults} == defaults, test
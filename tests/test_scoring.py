@@ -0,0 +1,133 @@
+import inspect
+import math
+import time
+import pytest
+import scoring
+from conftest import make_token
+from token_snapshot import decode_pairs, decode_pools
+
+NOW = 1700000000.0
+DAY = 60 * 60 * 24
+# Thresholds that let every pool or price history through, so a single rule can be checked on its own
+POOL_RULE_THRESHOLDS = {'liquidity': ('min_liquidity_usd', -math.inf), 'pool_age': ('min_pool_age_days', -math.inf),
+                        'volume': ('min_volume_usd', -math.inf), 'price_change': ('max_price_change_percent', math.inf),
+                        'fdv': ('max_fdv_usd', math.inf)}
+PRICEHISTORY_RULE_THRESHOLDS = {'m5_buy_ratio': ('min_m5_buy_ratio', -math.inf),
+                                'h1_buy_ratio': ('min_h1_buy_ratio', -math.inf),
+                                'h6_buy_ratio': ('min_h6_buy_ratio', -math.inf),
+                                'm5_price_drop': ('max_m5_price_drop_percent', math.inf),
+                                'm5_volume': ('min_m5_volume', -math.inf)}
+
+
+def pool(liquidity=200000, age_days=30, volume=50000, price_change=0.1, fdv=500000):
+    return {"liquidity": {"usd": liquidity}, "pairCreatedAt": NOW - age_days * DAY, "volume": {"h24": volume},
+            "priceChange": {"h24": price_change}, "fdv": fdv}
+
+
+def pair(m5=(100, 40), h1=(1200, 480), h6=(7200, 2880), price_change=0, volume=1000):
+    txns = {window: {"buys": buys, "sells": sells} for window, (buys, sells) in zip(("m5", "h1", "h6"), (m5, h1, h6))}
+    return dict(make_token("token_a")["pairs"][0], txns=txns, priceChange={"m5": price_change}, volume={"m5": volume})
+
+
+# Each default threshold exactly, just past it, and pools or pairs missing fields
+POOL_CASES = [
+    [pool(), pool()],
+    [pool(100000, 7, 10000, 0.2, 1000000), pool(100000, 7, 10000, -0.2, 1000000)],
+    [pool(), pool(liquidity=99999.99)],
+    [pool(), pool(age_days=6.99)],
+    [pool(), pool(volume=9999)],
+    [pool(), pool(price_change=-0.21)],
+    [pool(), pool(fdv=1000001)],
+    [pool()],
+    [pool(), pool(), dict(pool(), liquidity={})],
+    [pool(), {"liquidity": {"usd": 200000}}],
+    [pool(), dict(pool(), volume={}, priceChange={}), dict(pool(), fdv=None)],
+    [],
+    None,
+]
+PAIR_CASES = [
+    [pair()],
+    [pair(m5=(80, 100), h1=(120, 100), h6=(110, 100), price_change=-5, volume=500)],
+    [pair(m5=(79, 100))],
+    [pair(h1=(119, 100))],
+    [pair(h6=(109, 100))],
+    [pair(price_change=-5.01)],
+    [pair(volume=499.99)],
+    [pair(m5=(100, 0))],
+    [pair(h6=(0, 0))],
+    [dict(pair(), priceChange=None, volume={})],
+    [{key: value for key, value in pair().items() if key != "txns"}],
+    [],
+    None,
+]
+
+
+def default(scorer, name):
+    return inspect.signature(scorer).parameters[name].default
+
+
+def decoded_pools(case):
+    return None if case is None else decode_pools(case)
+
+
+def decoded_pairs(case):
+    return None if case is None else decode_pairs(case)
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    # check_pool_dexscreener reads the clock for every pool, so pool ages at a boundary need a fixed one
+    monkeypatch.setattr(time, "time", lambda: NOW)
+
+
+@pytest.mark.parametrize("thresholds", [{}, {"min_num_pools": 1}, {"min_num_pools": 3, "max_fdv_usd": 2000000}])
+def test_pool_scoring_matches_the_pool_check(scanner, frozen_time, thresholds):
+    pools = [decoded_pools(case) for case in POOL_CASES]
+    verdicts, masks = scoring.score_pools_batch(pools, **thresholds)
+    assert verdicts.tolist() == [scanner.check_pool_dexscreener(data, **thresholds) for data in pools]
+    # A mask is the check with every other per-pool rule let through. No threshold lets a pool
+    # without a liquidity figure (NaN) through the check, while the other masks still count it.
+    known = [data is None or all(pool is None or not math.isnan(pool.liquidity_usd) for pool in data)
+             for data in pools]
+    relaxed = dict(thresholds, **dict(POOL_RULE_THRESHOLDS.values()))
+    for rule, (name, _) in POOL_RULE_THRESHOLDS.items():
+        only_rule = dict(relaxed, **{name: thresholds.get(name, default(scoring.score_pools_batch, name))})
+        expected = [scanner.check_pool_dexscreener(data, **only_rule) for data in pools]
+        mask = (masks['num_pools'] & masks[rule]).tolist()
+        assert [value for value, keep in zip(mask, known) if keep] == \
+            [value for value, keep in zip(expected, known) if keep], rule
+
+
+@pytest.mark.parametrize("thresholds", [{}, {"min_m5_buy_ratio": 0, "max_m5_price_drop_percent": 0,
+                                              "min_m5_volume": 0}])
+def test_pricehistory_scoring_matches_the_pricehistory_check(scanner, thresholds):
+    histories = [decoded_pairs(case) for case in PAIR_CASES]
+    verdicts, masks = scoring.score_pricehistory_batch(histories, **thresholds)
+    assert verdicts.tolist() == [scanner.check_pricehistory_dexscreener(data, **thresholds) for data in histories]
+    relaxed = dict(thresholds, **dict(PRICEHISTORY_RULE_THRESHOLDS.values()))
+    # With every threshold let through, the check only wants data with sells in every window
+    assert masks['sells'].tolist() == [scanner.check_pricehistory_dexscreener(data, **relaxed) for data in histories]
+    for rule, (name, _) in PRICEHISTORY_RULE_THRESHOLDS.items():
+        only_rule = dict(relaxed, **{name: thresholds.get(name, default(scoring.score_pricehistory_batch, name))})
+        expected = [scanner.check_pricehistory_dexscreener(data, **only_rule) for data in histories]
+        assert (masks['sells'] & masks[rule]).tolist() == expected, rule
+
+
+@pytest.mark.parametrize("min_momentum", [-math.inf, 0, 0.1])
+def test_momentum_mask_matches_the_entry_trend_check(scanner, monkeypatch, min_momentum):
+    momenta = {"token_a": None, "token_b": -0.1, "token_c": 0.0, "token_d": 0.1, "token_e": 0.5}
+    monkeypatch.setattr(scanner, "entry_momentum", momenta.get)
+    histories = [decoded_pairs([pair()]) for _ in momenta]
+    columns = scoring.pricehistory_columns(histories, momentum=list(momenta.values()))
+    masks = scoring.score_pricehistory_columns(columns, min_momentum=min_momentum)[1]
+    # An undecided trend fails the test, and is what the entry watch samples
+    trends = [scanner.check_entry_trend(tokenAddress, min_momentum) for tokenAddress in momenta]
+    assert masks['momentum'].tolist() == [bool(trend) for trend in trends]
+    assert scoring.momentum_pending(columns, masks).tolist() == [trend is None for trend in trends]
+
+
+def test_empty_scans_score_to_empty_verdicts(frozen_time):
+    verdicts, masks = scoring.score_pools_batch([])
+    assert verdicts.tolist() == [] and all(mask.tolist() == [] for mask in masks.values())
+    verdicts, masks = scoring.score_pricehistory_batch([])
+    assert verdicts.tolist() == [] and all(mask.tolist() == [] for mask in masks.values())
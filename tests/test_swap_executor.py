@@ -0,0 +1,64 @@
+import pytest
+from solders.keypair import Keypair
+import swap_executor
+from mock_services import MockJupiter, MockSolanaRpc
+from quote_cache import QuoteCache
+from swap_executor import SwapExecutor, sell_landed
+
+
+class CountingSolanaRpc(MockSolanaRpc):
+    '''
+    Node that counts the calls of every method.
+    '''
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = {}
+
+    def call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        return super().call(method, params)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    '''
+    SwapExecutor against a mock node holding token_a and token_b, and a mock Jupiter.
+    '''
+    rpc = CountingSolanaRpc(holdings=["token_a", "token_b"]).start()
+    jupiter = MockJupiter().start()
+    monkeypatch.setattr(swap_executor, "JUPITER_QUOTE_URL", jupiter.url + "/swap/v1/quote")
+    monkeypatch.setattr(swap_executor, "JUPITER_SWAP_URL", jupiter.url + "/swap/v1/swap")
+    executor = SwapExecutor(rpc.url, quotes=QuoteCache(swap_executor.get_jupiter_swap_quote, ttl=0))
+    yield executor, rpc, jupiter
+    executor.close()
+    rpc.stop()
+    jupiter.stop()
+
+
+def test_sell_many_reads_the_balances_once_and_sells_every_held_token(executor):
+    executor, rpc, jupiter = executor
+    results = executor.run(executor.sell_many("user0", str(Keypair()), ["token_a", "token_b", "token_c"],
+                                              confirm=True))
+    assert [results[mint].get("outcome") for mint in ("token_a", "token_b")] == ["confirmed", "confirmed"]
+    # One owner-wide query per token program, whatever the number of mints
+    assert rpc.calls["getTokenAccountsByOwner"] == len(swap_executor.TOKEN_PROGRAM_IDS)
+    assert rpc.sent == 2
+    # Nothing to sell is reported, and leaves the wallet without the token like a landed sell
+    assert results["token_c"] == {"error": "no balance"}
+    assert all(sell_landed(result) for result in results.values())
+
+
+def test_a_failed_sell_does_not_fail_the_others(executor, monkeypatch):
+    executor, rpc, jupiter = executor
+    handle = jupiter.handle
+
+    def handle_failing_token_b(method, path, body):
+        if method == "GET" and "inputMint=token_b" in path:
+            return 500, {"error": "stub failure"}
+        return handle(method, path, body)
+    monkeypatch.setattr(jupiter, "handle", handle_failing_token_b)
+    results = executor.run(executor.sell_many("user0", str(Keypair()), ["token_a", "token_b"]))
+    assert "signature" in results["token_a"]
+    assert "500" in results["token_b"]["error"]
+    assert not sell_landed(results["token_b"])
+    assert rpc.sent == 1
@@ -0,0 +1,106 @@
+import threading
+import pytest
+from position_monitor import PositionMonitor
+from wallet_state import MemoryWalletStore, WalletState, WalletStore
+
+ENTRY = {'priceNative': 0.001, 'm5_buys': 100, 'm5_buysell_ratio': 2.5, 'm5_volume': 1000, 'm5_priceChange': 0}
+
+
+def run_threads(target, count):
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        target(index)
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_wallet_store_is_abstract():
+    with pytest.raises(TypeError):
+        WalletStore()
+
+
+def test_concurrent_buys_respect_the_wallet_limit():
+    store = MemoryWalletStore()
+    wallet = WalletState(store)
+    reserved = []
+
+    def buy(index):
+        for token in range(20):
+            if wallet.try_buy("user0", f"token_{index}_{token}", 5, ENTRY):
+                reserved.append(f"token_{index}_{token}")
+    run_threads(buy, 16)
+    assert len(reserved) == wallet.count("user0") == 5
+    assert wallet.holdings("user0") == set(reserved)
+    wallet.flush()
+    assert store.states["user0"]["count"] == 5
+    assert set(store.states["user0"]["entries"]) == set(reserved)
+
+
+def test_concurrent_buys_of_one_token_reserve_it_once():
+    wallet = WalletState(MemoryWalletStore())
+    results = []
+    run_threads(lambda index: results.append(wallet.try_buy("user0", "token_a", 5)), 16)
+    assert results.count(True) == 1
+    assert wallet.count("user0") == 1
+
+
+def test_concurrent_buys_and_sells_keep_counts_consistent():
+    store = MemoryWalletStore()
+    wallet = WalletState(store)
+    refused = []
+
+    def trade(index):
+        user_id = f"user{index % 4}"
+        for token in range(50):
+            tokenAddress = f"token_{index}_{token}"
+            if not wallet.try_buy(user_id, tokenAddress, 200, ENTRY):
+                refused.append(tokenAddress)
+            if token % 2:
+                wallet.record_sell(user_id, tokenAddress)
+            if token % 10 == 0:
+                wallet.flush()
+    run_threads(trade, 16)
+    wallet.flush()
+    assert refused == []
+    for user in range(4):
+        user_id = f"user{user}"
+        # 4 threads per user, each keeping its 25 even-numbered tokens
+        assert wallet.count(user_id) == len(wallet.holdings(user_id)) == 100
+        assert store.states[user_id]["tokens"] == sorted(wallet.holdings(user_id))
+        assert store.states[user_id]["count"] == 100
+
+
+def test_load_restores_holdings_with_their_entries():
+    store = MemoryWalletStore()
+    wallet = WalletState(store)
+    wallet.try_buy("user0", "token_a", 5, ENTRY)
+    wallet.try_buy("user0", "token_b", 5)
+    wallet.try_buy("user1", "token_a", 5, ENTRY)
+    wallet.record_sell("user1", "token_a")
+    wallet.flush()
+    restarted = WalletState(store)
+    restarted.load(["user0", "user1", "user2"])
+    assert sorted(restarted.positions()) == [("user0", "token_a", ENTRY), ("user0", "token_b", None)]
+    assert restarted.count("user1") == restarted.count("user2") == 0
+
+
+def test_restore_positions_registers_holdings_with_the_monitor(scanner, dexscreener):
+    from conftest import make_token
+    dexscreener.tokens.update(token_b=make_token("token_b"), token_c=make_token("token_c", pairs=0))
+    store = MemoryWalletStore({"user0": {"tokens": ["token_a", "token_b", "token_c"], "count": 3,
+                                         "entries": {"token_a": ENTRY}}})
+    scanner.wallet_state.store = store
+    scanner.wallet_state.load(["user0"])
+    monitor = PositionMonitor(lambda addresses: {}, lambda *args: None)
+    assert scanner.restore_positions(monitor) == 2
+    assert monitor.positions[("user0", "token_a")] == ENTRY
+    # Saved without entry values, so its current snapshot is the baseline, and stored for the next restart
+    assert monitor.positions[("user0", "token_b")]['m5_buysell_ratio'] == 2.5
+    assert not monitor.has_position("token_c", user_id="user0")
+    scanner.wallet_state.flush()
+    assert set(store.states["user0"]["entries"]) == {"token_a", "token_b"}
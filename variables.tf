@@ -12,4 +12,23 @@ variable "region" {
 variable "source_bucket" {
   type        = string
   description = "The GCS bucket containing the function source code"
+}
+
+variable "shared_scanner" {
+  type        = bool
+  description = "Deploy one start service that scans for every user instead of one start service per user"
+  default     = false
+}
+
+variable "user_settings" {
+  type = map(object({
+    wallet_limit       = number
+    amount_in_sol      = optional(number, 0.03)
+    private_key_secret = optional(string)
+    required_tests     = list(string)
+    rules              = optional(map(number), {})
+    required_passes    = optional(number)
+  }))
+  description = "Strategy settings per user_id for the shared scanner, users without an entry get the defaults"
+  default     = {}
 }
\ No newline at end of file